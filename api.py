@@ -16,6 +16,17 @@ log = logging.getLogger("api")
 
 app = FastAPI(title="AurumLedger API", version="1.0.0")
 
+# ── /metrics（每路由延遲 / 狀態碼；app.db 可載入時附連線池 gauge） ─────
+from app.utils import metrics, sqlstats
+_engines = {}
+try:
+    from app.db import engine as _engine
+    _engines["app"] = _engine
+except Exception as e:  # noqa: BLE001
+    log.warning(f"app.db not available for pool metrics: {e!r}")
+metrics.install(app, name="api", engines=_engines)
+sqlstats.install(app)
+
 # ── static/ ─────────────────────────────────────────────────────────
 for candidate in ("static", os.path.join("web", "static")):
     if os.path.isdir(candidate):
@@ -1,24 +1,39 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, status, Form
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from passlib.context import CryptContext
 from .db import get_db
+from .utils import hashing
 
 router = APIRouter(prefix="/auth", tags=["auth"])
-pwd = CryptContext(schemes=["bcrypt", "pbkdf2_sha256"], deprecated="auto")
+# bcrypt 在雜湊專用 process pool 執行（見 utils/hashing.py），佇列滿時丟 HashBusy
+PWD_SCHEMES = ("bcrypt", "pbkdf2_sha256")
 
-def hash_password(plain: str) -> str:
-    return pwd.hash(plain)
+async def hash_password(plain: str) -> str:
+    return await hashing.passlib_hash(PWD_SCHEMES, plain)
 
-def verify_password(plain: str, hashed: str) -> bool:
-    try:
-        return pwd.verify(plain, hashed)
-    except Exception:
-        return False
+async def verify_password(plain: str, hashed: str) -> bool:
+    return await hashing.passlib_verify(PWD_SCHEMES, plain, hashed)
 
 def _user_count(db: Session) -> int:
     return db.execute(text("SELECT COUNT(*) AS c FROM users")).mappings().first()["c"]
 
+# 以下 handler 是 async（要 await 雜湊），同步的 DB 存取一律丟 threadpool，不佔事件迴圈
+def _user_by(db: Session, where: str, **params):
+    return db.execute(text(f"SELECT id, username, password_hash FROM users WHERE {where}"), params).mappings().first()
+
+def _insert_user(db: Session, username: str, password_hash: str) -> None:
+    db.execute(text("INSERT INTO users(username, password_hash) VALUES(:u, :p)"), {"u": username, "p": password_hash})
+    db.commit()
+
+def _username_taken(db: Session, username: str, uid: int) -> bool:
+    return db.execute(text("SELECT 1 FROM users WHERE username = :u AND id != :i"), {"u": username, "i": uid}).first() is not None
+
+def _update_user(db: Session, updates: dict) -> None:
+    sets = ", ".join([f"{k} = :{k}" for k in updates.keys() if k != "id"])
+    db.execute(text(f"UPDATE users SET {sets} WHERE id = :id"), updates)
+    db.commit()
+
 # 受保護依賴
 def login_required(request: Request):
     if not request.session.get("uid"):
@@ -30,17 +45,16 @@ def has_user(db: Session = Depends(get_db)):
     return {"has_user": _user_count(db) > 0}
 
 @router.post("/setup")
-def setup_first_user(username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    if _user_count(db) > 0:
+async def setup_first_user(username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+    if await run_in_threadpool(_user_count, db) > 0:
         raise HTTPException(400, "已存在使用者，請改用登入")
-    db.execute(text("INSERT INTO users(username, password_hash) VALUES(:u, :p)"), {"u": username, "p": hash_password(password)})
-    db.commit()
+    await run_in_threadpool(_insert_user, db, username, await hash_password(password))
     return {"ok": True}
 
 @router.post("/login")
-def login(request: Request, username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    row = db.execute(text("SELECT id, username, password_hash FROM users WHERE username = :u"), {"u": username}).mappings().first()
-    if not row or not verify_password(password, row["password_hash"]):
+async def login(request: Request, username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+    row = await run_in_threadpool(_user_by, db, "username = :u", u=username)
+    if not row or not await verify_password(password, row["password_hash"]):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="帳號或密碼錯誤")
     request.session["uid"] = int(row["id"])
     request.session["uname"] = row["username"]
@@ -56,7 +70,7 @@ def me(request: Request, _=Depends(login_required)):
     return {"id": request.session.get("uid"), "username": request.session.get("uname")}
 
 @router.post("/change-credentials")
-def change_credentials(
+async def change_credentials(
     request: Request,
     current_password: str = Form(...),
     new_username: str = Form(None),
@@ -65,24 +79,20 @@ def change_credentials(
     _=Depends(login_required),
 ):
     uid = int(request.session["uid"]) if request.session.get("uid") else None
-    row = db.execute(text("SELECT id, username, password_hash FROM users WHERE id = :i"), {"i": uid}).mappings().first()
-    if not row or not verify_password(current_password, row["password_hash"]):
+    row = await run_in_threadpool(_user_by, db, "id = :i", i=uid)
+    if not row or not await verify_password(current_password, row["password_hash"]):
         raise HTTPException(400, "目前密碼不正確")
 
     updates = {}
     if new_username and new_username != row["username"]:
-        dup = db.execute(text("SELECT 1 FROM users WHERE username = :u AND id != :i"), {"u": new_username, "i": uid}).first()
-        if dup:
+        if await run_in_threadpool(_username_taken, db, new_username, uid):
             raise HTTPException(400, "此帳號已被使用")
         updates["username"] = new_username
     if new_password:
-        updates["password_hash"] = hash_password(new_password)
+        updates["password_hash"] = await hash_password(new_password)
 
     if updates:
-        sets = ", ".join([f"{k} = :{k}" for k in updates.keys()])
-        updates["id"] = uid
-        db.execute(text(f"UPDATE users SET {sets} WHERE id = :id"), updates)
-        db.commit()
+        await run_in_threadpool(_update_user, db, {**updates, "id": uid})
         if "username" in updates:
             request.session["uname"] = updates["username"]
 
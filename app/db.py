@@ -23,6 +23,10 @@ if DATABASE_URL.startswith("sqlite"):
 else:
     engine = create_engine(DATABASE_URL, **engine_kwargs)
 
+# 每請求 SQL 條數 / 時間、慢查詢（app/utils/sqlstats.py；middleware 由各 app 掛上）
+from .utils.sqlstats import instrument_engine
+instrument_engine(engine)
+
 Base = declarative_base()
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
 
@@ -1,28 +1,83 @@
-import io, csv
+import io, csv, itertools, os
 from datetime import datetime
-from fastapi import APIRouter, Depends, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, Query, Request, UploadFile, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from .db import get_db
+from .db import engine, get_db
 from .auth import login_required
+from .models import CATEGORIES
+from .utils import categories, jobs
 
 router = APIRouter(prefix="/data", tags=["data"])
 
 ALLOWED_TABLES = {"orders", "expenses"}
+# 存成維度表 id 的欄位：CSV 仍以名稱進出（資料表 → (CSV 欄名, 實際欄位)）
+NAMED_COLUMNS = {"expenses": ("category", "category_id")}
+IMPORT_BATCH = 5000                 # 背景匯入每批寫入列數（分類換 id 也是每批一次）
+
+# 大量匯入 / 匯出加 ?async=1 改排入背景工作；佇列預設在 SQLite 檔旁的 <db>.jobs/
+JOBS_DIR = os.getenv("AURUM_JOBS_DIR") or str(
+    jobs.default_dir_for(engine.url.database) if engine.url.get_backend_name() == "sqlite" and engine.url.database
+    else "jobs")
+JOBS = jobs.JobQueue(JOBS_DIR, name="data-jobs")
+router.add_event_handler("startup", JOBS.start)
+router.add_event_handler("shutdown", JOBS.stop)
+
+def _csv_columns(table: str, cols):
+    csv_col, db_col = NAMED_COLUMNS.get(table.lower(), (None, None))
+    return [csv_col if c == db_col else c for c in cols]
 
 def _validate_table(inspector, name: str):
     tables = {t.lower() for t in inspector.get_table_names()}
     if name.lower() not in tables or name.lower() not in ALLOWED_TABLES:
         raise HTTPException(status_code=400, detail=f"不支援的資料表：{name}")
 
+def _export_query(insp, table: str):
+    """(CSV 欄名, SELECT)；維度表 id 欄 JOIN 回名稱。"""
+    db_cols = [c["name"] for c in insp.get_columns(table)]
+    cols = _csv_columns(table, db_cols)
+    named = NAMED_COLUMNS.get(table.lower())
+    named = named if named and named[1] in db_cols else None
+    col_list = ", ".join(f'c.name AS "{c}"' if named and c == named[0] else f't."{c}"' for c in cols)
+    join = f' JOIN {categories.TABLE} c ON c.id = t."{named[1]}"' if named else ""
+    return cols, text(f'SELECT {col_list} FROM "{table}" t{join}')
+
+def _export_name(table: str) -> str:
+    return f"{table}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.csv"
+
+def _insert(conn, table: str, db_cols, cols, records) -> int:
+    """records 以 CSV 欄名為鍵；名稱欄先換成 id（新分類此時建立），再一次 executemany 寫入。"""
+    if not records:
+        return 0
+    named = NAMED_COLUMNS.get(table.lower())
+    if named and named[1] in db_cols:
+        ids = CATEGORIES.ids_for(r[named[0]] for r in records)
+        for r in records:
+            r[named[1]] = ids[r.pop(named[0])]
+        cols = db_cols
+    col_list = ", ".join([f'"{c}"' for c in cols])
+    val_list = ", ".join([f':{c}' for c in cols])
+    conn.execute(text(f'INSERT INTO "{table}" ({col_list}) VALUES ({val_list})'), records)
+    return len(records)
+
+def _enqueued(job) -> JSONResponse:
+    return JSONResponse(job, status_code=202, headers={"Location": f"{router.prefix}/jobs/{job['id']}"})
+
+def _owner(request: Request) -> str:
+    return str(request.session.get("uid"))
+
 @router.get("/export/{table}")
-def export_csv(table: str, db: Session = Depends(get_db), _=Depends(login_required)):
+def export_csv(table: str, request: Request, async_: bool = Query(False, alias="async"),
+               db: Session = Depends(get_db), _=Depends(login_required)):
     insp = inspect(db.bind)
     _validate_table(insp, table)
-    cols = [c["name"] for c in insp.get_columns(table)]
-    q = db.execute(text(f"SELECT {', '.join([f'\"{c}\"' for c in cols])} FROM \"{table}\""))
-    rows = q.mappings().all()
+    if async_:
+        return _enqueued(JOBS.enqueue("data.export", {"table": table}, owner=_owner(request)))
+    cols, q = _export_query(insp, table)
+    rows = db.execute(q).mappings().all()
 
     buf = io.StringIO()
     writer = csv.DictWriter(buf, fieldnames=cols)
@@ -30,14 +85,23 @@ def export_csv(table: str, db: Session = Depends(get_db), _=Depends(login_requir
     for r in rows:
         writer.writerow({k: r[k] for k in cols})
     buf.seek(0)
-    filename = f"{table}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.csv"
+    filename = _export_name(table)
     return StreamingResponse(iter([buf.read()]), media_type="text/csv", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 @router.post("/import/{table}")
-async def import_csv(table: str, file: UploadFile, db: Session = Depends(get_db), _=Depends(login_required)):
+async def import_csv(table: str, file: UploadFile, request: Request, async_: bool = Query(False, alias="async"),
+                     db: Session = Depends(get_db), _=Depends(login_required)):
     insp = inspect(db.bind)
     _validate_table(insp, table)
-    cols = [c["name"] for c in insp.get_columns(table)]
+    db_cols = [c["name"] for c in insp.get_columns(table)]
+    cols = _csv_columns(table, db_cols)
+
+    if async_:
+        # 上傳檔以串流複製進工作目錄（不整包讀進記憶體），欄位檢查與寫入都在背景做；
+        # 複製與佇列寫入都是同步檔案 I/O，丟 threadpool 不佔事件迴圈
+        job = await run_in_threadpool(JOBS.enqueue, "data.import", {"table": table}, owner=_owner(request),
+                                      inputs={"upload.csv": file.file})
+        return _enqueued(job)
 
     content = (await file.read()).decode("utf-8-sig")
     reader = csv.DictReader(io.StringIO(content))
@@ -48,9 +112,85 @@ async def import_csv(table: str, file: UploadFile, db: Session = Depends(get_db)
     records = [{c: row.get(c) for c in cols} for row in reader]
     if not records:
         return {"inserted": 0}
-
-    col_list = ", ".join([f'"{c}"' for c in cols])
-    val_list = ", ".join([f':{c}' for c in cols])
-    db.execute(text(f'INSERT INTO "{table}" ({col_list}) VALUES ({val_list})'), records)
+    n = _insert(db, table, db_cols, cols, records)
     db.commit()
-    return {"inserted": len(records)}
\ No newline at end of file
+    return {"inserted": n}
+
+# ---------------- 背景工作 ----------------
+def _job_export(ctx: jobs.JobContext, table: str):
+    insp = inspect(engine)
+    cols, q = _export_query(insp, table)
+    path = ctx.artifact(_export_name(table), "text/csv")
+    with engine.connect() as conn:
+        ctx.total = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar_one()
+        rows = conn.execution_options(yield_per=IMPORT_BATCH).execute(q).mappings()
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=cols)
+            writer.writeheader()
+            for r in ctx.track(rows, "匯出 "):
+                writer.writerow({k: r[k] for k in cols})
+    return {"rows": ctx.done}
+
+def _job_import(ctx: jobs.JobContext, table: str):
+    insp = inspect(engine)
+    db_cols = [c["name"] for c in insp.get_columns(table)]
+    cols = _csv_columns(table, db_cols)
+    named = NAMED_COLUMNS.get(table.lower())
+    named = named if named and named[1] in db_cols else None
+    src = ctx.input("upload.csv")
+    with open(src, encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in cols if c not in (reader.fieldnames or [])]
+        if missing:
+            raise jobs.JobFailed(f"CSV 欄位缺少：{missing}")
+        # 第一遍：列數（進度分母）與用到的分類；新分類先建好，寫入交易內只查快取（SQLite 同時只能一個寫入者）
+        names, total = set(), 0
+        for row in reader:
+            total += 1
+            if named:
+                names.add(row.get(named[0]))
+        ctx.total = total
+        if names:
+            CATEGORIES.ids_for(names)
+    with open(src, encoding="utf-8-sig", newline="") as f:
+        rows = ctx.track(csv.DictReader(f), "匯入 ")
+        n = 0
+        # 整個檔案一個交易：中途失敗 / 取消全部回滾，重試不會重複寫入
+        try:
+            with engine.begin() as conn:
+                while batch := [{c: row.get(c) for c in cols} for row in itertools.islice(rows, IMPORT_BATCH)]:
+                    n += _insert(conn, table, db_cols, cols, batch)
+        except IntegrityError as e:
+            raise jobs.JobFailed(f"第 {n + 1:,} ~ {n + IMPORT_BATCH:,} 列寫入失敗：{e.orig}") from e
+    return {"inserted": n}
+
+JOBS.register("data.export", _job_export)
+JOBS.register("data.import", _job_import)
+
+def _my_job(job_id: str, request: Request):
+    job = JOBS.get(job_id)
+    if job is None or job["owner"] != _owner(request):
+        raise HTTPException(status_code=404, detail="找不到工作")
+    return job
+
+@router.get("/jobs")
+def list_jobs(request: Request, _=Depends(login_required)):
+    return JOBS.list(owner=_owner(request))
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, request: Request, _=Depends(login_required)):
+    return _my_job(job_id, request)
+
+@router.get("/jobs/{job_id}/download")
+def download_job(job_id: str, request: Request, _=Depends(login_required)):
+    job = _my_job(job_id, request)
+    art = JOBS.artifact(job_id) if job["status"] == "done" else None
+    if art is None:
+        raise HTTPException(status_code=409 if job["status"] != "done" else 410, detail=f"工作狀態：{job['status']}")
+    path, name, media_type = art
+    return FileResponse(path, media_type=media_type, filename=name)
+
+@router.delete("/jobs/{job_id}")
+def cancel_job(job_id: str, request: Request, _=Depends(login_required)):
+    _my_job(job_id, request)
+    return JOBS.cancel(job_id)
@@ -1,7 +1,7 @@
 # app/main.py
 from pathlib import Path
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
@@ -11,12 +11,27 @@ STATIC_DIR = BASE_DIR / "static"                 # == app/static
 
 app = FastAPI(title="AurumLedger 企業版")
 
+# 每路由延遲 / 狀態碼 + 連線池使用量 → GET /metrics
+from .db import engine
+from .utils import metrics, profiling, sqlstats
+metrics.install(app, name="app", engines={"app": engine})
+sqlstats.install(app)
+profiling.install(app)   # 管理員單次剖析；未設定 AURUM_PROFILE_KEY 時不掛
+
 # 正確掛載 /static
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
 # 指定模板資料夾
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
+# 密碼雜湊佇列已滿（utils/hashing.py）→ 429，請用戶端稍後重試
+from .utils.hashing import HashBusy
+
+@app.exception_handler(HashBusy)
+async def _hash_busy(_req: Request, exc: HashBusy):
+    return JSONResponse({"detail": "登入人數較多，請稍後再試"}, status_code=429,
+                        headers={"Retry-After": str(exc.retry_after)})
+
 # ---- 頁面路由（登入 + 首頁示意）----
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request, msg: str | None = None):
@@ -0,0 +1,214 @@
+# app/migrations.py
+# -*- coding: utf-8 -*-
+"""
+app/models.py schema 的受管索引（依版本號套用，記錄在 schema_migrations）
+- orders / expenses 清單都是「日期範圍 + ORDER BY date DESC, id DESC」→ (date DESC, id DESC) 索引，免暫存排序
+- 篩選用的 lower(欄位) → 運算式索引（lower(status) = ? 直接走索引）
+- 未結訂單（status = open，約 5%）→ 部分索引，只收 open 的列
+- PostgreSQL 另建 pg_trgm GIN 索引，讓 lower(x) LIKE '%…%' 也能走索引；SQLite 的 B-tree 做不到，
+  前置 % 的搜尋在 SQLite 仍靠日期範圍先縮小資料量
+- 007：expenses.category 文字欄 → expense_categories 維度表 + category_id（app/utils/categories.py）；
+  新庫由 create_all 直接建成新結構，004 / 006 只在還有文字欄位時才建分類的 lower() / trigram 索引
+用法：
+  python -m app.migrations                 # 套用全部（預設讀 DATABASE_URL）
+  python -m app.migrations status
+  python -m app.migrations downgrade 0     # 退回到指定版本
+啟動時 models.ensure_tables() 也會自動 upgrade。
+"""
+from __future__ import annotations
+
+import sys
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from .utils import categories
+
+SqlList = Union[Sequence[str], Callable[[Connection], Sequence[str]]]   # 固定清單，或依連線（dialect / 現有欄位）產生
+
+
+class Migration:
+    def __init__(self, version: int, name: str, up: SqlList, down: SqlList):
+        self.version, self.name, self._up, self._down = version, name, up, down
+
+    def up(self, conn: Connection) -> Sequence[str]:
+        return self._up(conn) if callable(self._up) else self._up
+
+    def down(self, conn: Connection) -> Sequence[str]:
+        return self._down(conn) if callable(self._down) else self._down
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return column in {c["name"] for c in inspect(conn).get_columns(table)}
+
+def _expenses_lower_up(conn: Connection) -> Sequence[str]:
+    out = ["CREATE INDEX IF NOT EXISTS ix_expenses_lower_owner ON expenses (lower(coalesce(owner, '')))",
+           "CREATE INDEX IF NOT EXISTS ix_expenses_lower_note ON expenses (lower(coalesce(note, '')))"]
+    if _has_column(conn, "expenses", "category"):
+        out.insert(0, "CREATE INDEX IF NOT EXISTS ix_expenses_lower_category ON expenses (lower(category))")
+    return out
+
+def _trgm_up(conn: Connection) -> Sequence[str]:
+    if conn.dialect.name != "postgresql":
+        return []
+    out = ["CREATE EXTENSION IF NOT EXISTS pg_trgm",
+           "CREATE INDEX IF NOT EXISTS ix_orders_order_no_trgm ON orders USING gin (lower(order_no) gin_trgm_ops)",
+           "CREATE INDEX IF NOT EXISTS ix_orders_customer_trgm ON orders USING gin (lower(customer) gin_trgm_ops)",
+           "CREATE INDEX IF NOT EXISTS ix_expenses_note_trgm ON expenses USING gin (lower(coalesce(note, '')) gin_trgm_ops)"]
+    if _has_column(conn, "expenses", "category"):
+        out.append("CREATE INDEX IF NOT EXISTS ix_expenses_category_trgm ON expenses USING gin (lower(category) gin_trgm_ops)")
+    return out
+
+def _trgm_down(conn: Connection) -> Sequence[str]:
+    if conn.dialect.name != "postgresql":
+        return []
+    return [f"DROP INDEX IF EXISTS {n}" for n in
+            ("ix_orders_order_no_trgm", "ix_orders_customer_trgm", "ix_expenses_category_trgm", "ix_expenses_note_trgm")]
+
+# 分類字串的搜尋索引在 007 之後沒有對象；分類名稱只剩維度表上的 UNIQUE 索引
+_CATEGORY_TEXT_INDEXES = ("ix_expenses_lower_category", "ix_expenses_category_trgm")
+
+def _categories_up(conn: Connection) -> Sequence[str]:
+    if not _has_column(conn, "expenses", "category") or _has_column(conn, "expenses", "category_id"):
+        return []
+    drops = [f"DROP INDEX IF EXISTS {n}" for n in _CATEGORY_TEXT_INDEXES]
+    if conn.dialect.name != "postgresql":
+        # 重建表時會照抄 expenses 現有的索引 → 文字欄位的 lower() 索引要先刪掉，不能只排在清單前面
+        for sql in drops:
+            conn.execute(text(sql))
+        return categories.migration_sql(conn, "category", "category_id")
+    # PostgreSQL 可以直接加欄 / 刪欄，不必重建整張表
+    norm = categories.name_expr("category")
+    return [f"CREATE TABLE IF NOT EXISTS {categories.TABLE} "
+            f"(id SERIAL PRIMARY KEY, name VARCHAR({categories.NAME_MAX}) NOT NULL UNIQUE)",
+            f"INSERT INTO {categories.TABLE} (name) SELECT DISTINCT {norm} FROM expenses e ON CONFLICT (name) DO NOTHING",
+            f"ALTER TABLE expenses ADD COLUMN category_id INTEGER REFERENCES {categories.TABLE} (id)",
+            f"UPDATE expenses e SET category_id = c.id FROM {categories.TABLE} c WHERE c.name = {norm}",
+            "ALTER TABLE expenses ALTER COLUMN category_id SET NOT NULL",
+            *drops,
+            "DROP INDEX IF EXISTS ix_expenses_date_cat",
+            "ALTER TABLE expenses DROP COLUMN category",
+            "CREATE INDEX IF NOT EXISTS ix_expenses_date_cat ON expenses (date, category_id)"]
+
+def _categories_down(conn: Connection) -> Sequence[str]:
+    if not _has_column(conn, "expenses", "category_id"):
+        return []
+    if conn.dialect.name != "postgresql":
+        out = list(categories.decode_sql(conn, "category_id", "category"))
+    else:
+        out = [f"ALTER TABLE expenses ADD COLUMN category VARCHAR({categories.NAME_MAX})",
+               f"UPDATE expenses e SET category = c.name FROM {categories.TABLE} c WHERE c.id = e.category_id",
+               "ALTER TABLE expenses ALTER COLUMN category SET NOT NULL",
+               "DROP INDEX IF EXISTS ix_expenses_date_cat",
+               "ALTER TABLE expenses DROP COLUMN category_id",
+               "CREATE INDEX IF NOT EXISTS ix_expenses_date_cat ON expenses (date, category)"]
+    return out + [f"DROP TABLE IF EXISTS {categories.TABLE}"]
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "orders list sort + date range", [
+        "CREATE INDEX IF NOT EXISTS ix_orders_date_id ON orders (date DESC, id DESC)",
+    ], ["DROP INDEX IF EXISTS ix_orders_date_id"]),
+    Migration(2, "expenses list sort + date range", [
+        "CREATE INDEX IF NOT EXISTS ix_expenses_date_id ON expenses (date DESC, id DESC)",
+    ], ["DROP INDEX IF EXISTS ix_expenses_date_id"]),
+    Migration(3, "orders lower() expression indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_orders_lower_status ON orders (lower(status))",
+        "CREATE INDEX IF NOT EXISTS ix_orders_lower_order_no ON orders (lower(order_no))",
+        "CREATE INDEX IF NOT EXISTS ix_orders_lower_customer ON orders (lower(customer))",
+    ], ["DROP INDEX IF EXISTS ix_orders_lower_status",
+        "DROP INDEX IF EXISTS ix_orders_lower_order_no",
+        "DROP INDEX IF EXISTS ix_orders_lower_customer"]),
+    Migration(4, "expenses lower() expression indexes", _expenses_lower_up, ["DROP INDEX IF EXISTS ix_expenses_lower_category",
+        "DROP INDEX IF EXISTS ix_expenses_lower_owner",
+        "DROP INDEX IF EXISTS ix_expenses_lower_note"]),
+    Migration(5, "open orders partial index", [
+        # 條件須與 routers/orders.py 產生的 lower(status) = 'open' 一致，查詢才會挑到
+        "CREATE INDEX IF NOT EXISTS ix_orders_open ON orders (date DESC, id DESC) WHERE lower(status) = 'open'",
+    ], ["DROP INDEX IF EXISTS ix_orders_open"]),
+    Migration(6, "postgres trigram search indexes", _trgm_up, _trgm_down),
+    Migration(7, "expense categories dimension table", _categories_up, _categories_down),
+]
+
+LATEST = MIGRATIONS[-1].version
+
+
+# ---------------- 執行 ----------------
+def _ensure_table(conn: Connection) -> None:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations ("
+                      "version INTEGER PRIMARY KEY, name VARCHAR(128) NOT NULL, applied_at VARCHAR(32) NOT NULL)"))
+
+def applied(engine: Engine) -> List[Tuple[int, str, str]]:
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        return [tuple(r) for r in conn.execute(text("SELECT version, name, applied_at FROM schema_migrations ORDER BY version"))]
+
+def current_version(engine: Engine) -> int:
+    rows = applied(engine)
+    return rows[-1][0] if rows else 0
+
+def _analyze(conn: Connection, dialect: str) -> None:
+    # 新索引要有統計資料，規劃器才會在 (date, id) 與 lower(...) 之間挑對
+    conn.execute(text("ANALYZE orders" if dialect == "postgresql" else "ANALYZE"))
+    if dialect == "postgresql":
+        conn.execute(text("ANALYZE expenses"))
+
+def upgrade(engine: Engine, target: Optional[int] = None, log: Callable[[str], None] = lambda _m: None) -> int:
+    """套用尚未執行的 migration（每個版本一個交易）；回傳套用數量。"""
+    target = LATEST if target is None else target
+    dialect = engine.dialect.name
+    done = {v for v, _n, _t in applied(engine)}
+    n = 0
+    for m in MIGRATIONS:
+        if m.version in done or m.version > target:
+            continue
+        with engine.begin() as conn:
+            for sql in m.up(conn):
+                conn.execute(text(sql))
+            conn.execute(text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                         {"v": m.version, "n": m.name, "t": datetime.now().isoformat(timespec="seconds")})
+        log(f"[migrate] ↑ {m.version:03d} {m.name}")
+        n += 1
+    if n:
+        with engine.begin() as conn:
+            _analyze(conn, dialect)
+    return n
+
+def downgrade(engine: Engine, target: int, log: Callable[[str], None] = lambda _m: None) -> int:
+    done = {v for v, _n, _t in applied(engine)}
+    n = 0
+    for m in reversed(MIGRATIONS):
+        if m.version not in done or m.version <= target:
+            continue
+        with engine.begin() as conn:
+            for sql in m.down(conn):
+                conn.execute(text(sql))
+            conn.execute(text("DELETE FROM schema_migrations WHERE version = :v"), {"v": m.version})
+        log(f"[migrate] ↓ {m.version:03d} {m.name}")
+        n += 1
+    return n
+
+
+__all__ = ["Migration", "MIGRATIONS", "LATEST", "applied", "current_version", "upgrade", "downgrade"]
+
+
+if __name__ == "__main__":
+    import argparse
+    from .db import engine as _engine, DATABASE_URL
+    ap = argparse.ArgumentParser(description="app schema 受管索引")
+    ap.add_argument("cmd", nargs="?", default="upgrade", choices=["upgrade", "downgrade", "status"])
+    ap.add_argument("version", nargs="?", type=int)
+    a = ap.parse_args()
+    if a.cmd == "status":
+        rows = applied(_engine)
+        print(f"{DATABASE_URL}：目前版本 {rows[-1][0] if rows else 0} / 最新 {LATEST}")
+        for v, name, t in rows:
+            print(f"  {v:03d} {name}  ({t})")
+    elif a.cmd == "downgrade":
+        if a.version is None:
+            sys.exit("downgrade 需要目標版本，例如：python -m app.migrations downgrade 0")
+        print(f"[✓] 退回 {downgrade(_engine, a.version, print)} 個版本")
+    else:
+        print(f"[✓] 套用 {upgrade(_engine, a.version, print)} 個版本")
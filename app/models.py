@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, Date, Numeric, Text, Index
+from sqlalchemy import Column, ForeignKey, Integer, String, Date, Numeric, Text, Index
+from sqlalchemy.orm import relationship
 from .db import Base, engine
+from .utils import categories
 
 class User(Base):
     __tablename__ = "users"
@@ -18,16 +20,33 @@ class Order(Base):
     notes = Column(Text)
     __table_args__ = (Index("ix_orders_no_date", "order_no", "date"),)
 
+class ExpenseCategory(Base):
+    """支出分類維度表（app/utils/categories.py）；舊庫由 migration 007 從文字欄位轉入。"""
+    __tablename__ = categories.TABLE
+    id = Column(Integer, primary_key=True)
+    name = Column(String(categories.NAME_MAX), nullable=False, unique=True)
+
 class Expense(Base):
     __tablename__ = "expenses"
     id = Column(Integer, primary_key=True)
     date = Column(Date, nullable=False)
-    category = Column(String(64), nullable=False)
+    category_id = Column(Integer, ForeignKey(f"{categories.TABLE}.id"), nullable=False)
     amount = Column(Numeric(12, 2), nullable=False)
     owner = Column(String(64))
     note = Column(Text)
-    __table_args__ = (Index("ix_expenses_date_cat", "date", "category"),)
+    category_ref = relationship(ExpenseCategory, lazy="joined")
+    __table_args__ = (Index("ix_expenses_date_cat", "date", "category_id"),)
+
+    @property
+    def category(self) -> str:
+        """對外仍是分類名稱（JOIN 載入）。"""
+        return self.category_ref.name if self.category_ref else categories.DEFAULT_NAME
+
+# 寫入支出時以分類名稱換 id；新名稱以獨立交易立即建立
+CATEGORIES = categories.CategoryCache(engine.begin)
 
-# 啟動時確保表存在
+# 啟動時確保表存在，並套用受管索引（app/migrations.py）
 def ensure_tables(_engine=engine):
-    Base.metadata.create_all(bind=_engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=_engine)
+    from .migrations import upgrade
+    upgrade(_engine)
\ No newline at end of file
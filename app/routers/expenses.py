@@ -3,12 +3,12 @@ from decimal import Decimal, InvalidOperation
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy import or_, func, select, and_
+from sqlalchemy import or_, func, select, and_, literal_column
 from sqlalchemy.orm import Session
 
 from ..db import get_db
 from ..auth import login_required
-from ..models import Expense
+from ..models import CATEGORIES, Expense, ExpenseCategory
 
 router = APIRouter(prefix="/api/expenses", tags=["expenses"], dependencies=[Depends(login_required)])
 
@@ -34,7 +34,10 @@ def list_expenses(
     conds = []
     if q:
         qs = q.strip().lower()
-        conds.append(or_(func.lower(Expense.category).contains(qs), func.lower(func.coalesce(Expense.owner, "")).contains(qs), func.lower(func.coalesce(Expense.note, "")).contains(qs)))
+        blank = literal_column("''")   # 與 migrations 的 lower(coalesce(owner, '')) 運算式索引寫法一致
+        # 分類名稱只在維度表上比對，支出本身比對整數 category_id
+        cat_hit = Expense.category_id.in_(select(ExpenseCategory.id).where(func.lower(ExpenseCategory.name).contains(qs)))
+        conds.append(or_(cat_hit, func.lower(func.coalesce(Expense.owner, blank)).contains(qs), func.lower(func.coalesce(Expense.note, blank)).contains(qs)))
     if date_from:
         try: conds.append(Expense.date >= date.fromisoformat(date_from))
         except Exception: pass
@@ -59,7 +62,7 @@ def create_expense(payload: dict = Body(...), db: Session = Depends(get_db)):
         raise HTTPException(400, "金額格式錯誤")
     e = Expense(
         date=date.fromisoformat(payload["date"]),
-        category=payload["category"],
+        category_id=CATEGORIES.id_for(payload["category"]),
         amount=amount,
         owner=payload.get("owner"),
         note=payload.get("note"),
@@ -71,13 +74,14 @@ def create_expense(payload: dict = Body(...), db: Session = Depends(get_db)):
 
 @router.put("/{eid}", response_model=dict)
 def update_expense(eid: int, payload: dict = Body(...), db: Session = Depends(get_db)):
+    cid = CATEGORIES.id_for(payload["category"]) if "category" in payload else None   # 先取 id，再開始改支出
     e = db.get(Expense, eid)
     if not e:
         raise HTTPException(404, "找不到支出")
     if "date" in payload and payload["date"]:
         e.date = date.fromisoformat(payload["date"])
-    if "category" in payload:
-        e.category = payload["category"]
+    if cid is not None:
+        e.category_id = cid
     if "amount" in payload:
         try: e.amount = Decimal(str(payload["amount"]))
         except (InvalidOperation, TypeError): raise HTTPException(400, "金額格式錯誤")
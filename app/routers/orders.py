@@ -3,7 +3,7 @@ from decimal import Decimal, InvalidOperation
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy import or_, func, select, and_
+from sqlalchemy import or_, func, select, and_, bindparam
 from sqlalchemy.orm import Session
 
 from ..db import get_db
@@ -48,7 +48,8 @@ def list_orders(
         except Exception:
             pass
     if status:
-        conds.append(func.lower(Order.status) == status.lower())
+        # 狀態值直接內嵌（literal_execute），lower(status) = 'open' 才會挑到 migrations 的部分索引 ix_orders_open
+        conds.append(func.lower(Order.status) == bindparam("status", status.strip().lower(), literal_execute=True))
     if conds:
         stmt = stmt.where(and_(*conds))
     stmt = stmt.order_by(Order.date.desc() if sort != "asc" else Order.date.asc(), Order.id.desc())
@@ -4,6 +4,7 @@
  * 1) 只有 /orders#create 自動聚焦「單號」，搜尋頁永遠停在搜尋框
  * 2) 反白：僅班別欄禁用選取（含 ::selection），拖曳不會出現藍底
  * 3) 編輯器採絕對定位覆蓋，不撐高表格；拖曳結束確實解鎖，不會卡住
+ * 4) 訂單/支出表格以列資料陣列為準，只繪製可視範圍的列；分班別、排序、勾選都在陣列上運算
  */
 (function(){
   "use strict";
@@ -59,13 +60,96 @@
     if(/^早/.test(t)) td.classList.add('shift-morning');
     else if(/^晚/.test(t)) td.classList.add('shift-night');
   }
-  function paintAllShiftCells(scope){
-    $$('td[data-field="shift"]', scope||document).forEach(paintShiftCell);
+
+  // ---------- 批次寫入佇列（樂觀顯示；失敗的格子自動還原） ----------
+  // 同一格連續修改只送最後一次；計時到或離開頁面時一次送出，KPI 只通知一次。
+  // 同時只有一批在途：下一批等上一批回來才送，伺服器端套用順序 = 修改順序。
+  function createWriteQueue(url, delay=350){
+    const pending = new Map();   // "id:field" -> 尚未送出的 edit
+    const latest = new Map();    // "id:field" -> 該格最新一次（尚未確定）的 edit
+    let timer=null, seq=0, inflight=null, rerun=false;
+
+    function schedule(){ clearTimeout(timer); timer=setTimeout(flush, delay); }
+
+    // 格子狀態：edit.mark 由表格提供（列可能已被捲出畫面），否則直接改 td 的 class
+    function mark(edit, state){
+      if(edit.mark) return edit.mark(state);
+      const td = edit.td; if(!td) return;
+      td.classList.toggle('cell-pending', state==='pending');
+      td.classList.toggle('cell-failed', state==='failed');
+    }
+
+    function enqueue(edit){
+      const k = edit.id+':'+edit.field;
+      const prev = latest.get(k);
+      if(prev) edit.old = prev.old;          // 還原點維持第一筆未確定修改之前的值
+      edit.key = String(++seq);
+      pending.set(k, edit);
+      latest.set(k, edit);
+      mark(edit, 'pending');
+      schedule();
+    }
+
+    function settle(edit, ok, value){
+      const k = edit.id+':'+edit.field;
+      const cur = latest.get(k);
+      if(cur !== edit){
+        // 這格之後又改過：畫面歸較新的那筆管；成功的話，較新那筆的還原點改成已寫入的值
+        if(cur && ok) cur.old = value;
+        return;
+      }
+      latest.delete(k);
+      mark(edit, '');
+      if(ok){ edit.onCommit && edit.onCommit(value); return; }
+      edit.onRollback && edit.onRollback(edit.old);
+      mark(edit, 'failed');
+      setTimeout(()=>mark(edit, ''), 1600);
+    }
+
+    async function send(batch, keepalive){
+      const body = JSON.stringify({edits: batch.map(e=>({key:e.key, id:e.id, field:e.field, value:e.value}))});
+      let results=null;
+      try{
+        const res = await fetch(url, {method:'POST', headers:{'Content-Type':'application/json'}, body, keepalive});
+        const j = await res.json();
+        if(j && j.ok) results = j.results;
+      }catch(_e){}
+      const byKey = new Map((results||[]).map(r=>[String(r.key), r]));
+      let anyOk=false;
+      batch.forEach(e=>{
+        const r = byKey.get(e.key);
+        if(r && r.ok){ anyOk=true; settle(e, true, r.value); }
+        else settle(e, false);
+      });
+      if(anyOk) notifyKpiDirty();
+    }
+
+    function flush(keepalive=false){
+      clearTimeout(timer); timer=null;
+      if(!pending.size) return inflight || Promise.resolve();
+      // 上一批還在途：回來後再送（頁面卸載時例外，等不到回應，直接以 keepalive 送出）
+      if(inflight && !keepalive){ rerun=true; return inflight; }
+      const batch = Array.from(pending.values());
+      pending.clear();
+      const p = send(batch, keepalive);
+      if(!inflight){
+        inflight = p.finally(()=>{
+          inflight=null;
+          if(rerun){ rerun=false; flush(); }
+        });
+      }
+      return p;
+    }
+
+    // 離開頁面 / 切到背景：立即送出（keepalive 讓請求在卸載後仍能完成）
+    on(window,'pagehide', ()=>flush(true));
+    on(document,'visibilitychange', ()=>{ if(document.visibilityState==='hidden') flush(true); });
+    return {enqueue, flush};
   }
 
   // ---------- 表內編輯（覆蓋不撐高） ----------
   function makeCellEditor(td, opts){
-    // opts: {id, field, url, type, value, options, onSaved}
+    // opts: {id, field, queue, type, value, options, mark, onSaved, onRollback}
     const old = opts.value;
     let input, saved=false;
 
@@ -90,33 +174,30 @@
     td.appendChild(input);
     try{ input.focus(); input.select?.(); }catch{}
 
+    const show=(val)=>{
+      td.textContent = (opts.type==='number') ? fmtNum(val) : val;
+      if(opts.field==='shift') paintShiftCell(td);
+    };
     const cleanup=()=>{ td.classList.remove('editing-cell'); };
     const restore=()=>{
       if(saved) return;
       td.textContent = old; paintShiftCell(td);
       cleanup();
     };
-    const done=(val)=>{
-      saved=true;
-      td.textContent = (opts.type==='number') ? fmtNum(val) : val;
-      if(opts.field==='shift') paintShiftCell(td);
-      opts.onSaved && opts.onSaved(val);
-      cleanup();
-    };
 
-    const save = async()=>{
+    const save=()=>{
       if(saved) return;
+      saved=true;
       const value = String(input.value||'').trim();
-      try{
-        const res = await fetch(opts.url, {
-          method:'POST',
-          headers:{'Content-Type':'application/json'},
-          body: JSON.stringify({id:opts.id, field:opts.field, value})
-        });
-        const j = await res.json();
-        if(j && j.ok){ done(j.value); notifyKpiDirty(); }
-        else restore();
-      }catch(_e){ restore(); }
+      cleanup();
+      if(value===String(old)){ show(old); return; }
+      show(value);                                   // 樂觀顯示
+      opts.onSaved && opts.onSaved(value);
+      opts.queue.enqueue({
+        id:opts.id, field:opts.field, value, old, td, mark:opts.mark,
+        onCommit:(val)=>{ if(String(val)!==value){ show(val); opts.onSaved && opts.onSaved(val); } },
+        onRollback:(prev)=>{ show(prev); opts.onRollback && opts.onRollback(prev); }
+      });
     };
 
     if (input.tagName==='SELECT'){
@@ -131,45 +212,264 @@
     }
   }
 
-  // ---------- 拖曳勾選（含 Shift 範圍） ----------
-  function initDragSelect(tbody){
-    if(!tbody) return;
-    let dragging=false, targetState=false, lastIdx=-1;
-    const rows = ()=> Array.from(tbody.querySelectorAll('tr'));
+  // ---------- 資料表格：列資料陣列 + 視窗化繪製 ----------
+  // 列資料存在 rows 陣列（順序即顯示順序），DOM 只畫可視範圍附近的列；
+  // 上下各一個墊高用 tbody 撐出捲軸高度。班別分組以 ends[] 記錄各組尾端位置，
+  // 新列直接插到所屬組尾，不必掃描整張表。
+  const VGRID_MIN_ROWS = 200;   // 列數不多時全部繪製，不做視窗化
+  const VGRID_OVERSCAN = 30;    // 可視範圍上下多畫的列數，快速捲動不閃白
+
+  function normShift(v){
+    v = String(v||'').trim();
+    if(v.startsWith('早')) return '早班';
+    if(v.startsWith('晚')) return '晚班';
+    return v;
+  }
+
+  function createGrid(tbody, cfg){
+    // cfg: {cols:[{field, num}], groupOf?(row)->0..2, nextIdx?}
+    const cols = cfg.cols;
+    const groupOf = cfg.groupOf || null;
+    // 每組一個陣列（無分組時只有一組）；列移組時舊位置留 null，下次取位置前一次掃掉
+    let groups = [[]], dead = 0;
+    let nextIdx = 0, rowH = 0, win = [-1,-1], raf = 0;
+    const rendered = new Map();          // row -> tr（只有目前畫出的列）
+
+    const padBody = ()=>{
+      const b=document.createElement('tbody'); b.className='vgrid-pad'; b.hidden=true;
+      const tr=document.createElement('tr'), td=document.createElement('td');
+      td.colSpan=cols.length+1; td.style.cssText='height:0;padding:0;border:0';
+      tr.appendChild(td); b.appendChild(tr);
+      return b;
+    };
+    const padTop = padBody(), padBottom = padBody();
+
+    function makeRow(o){
+      const r = {id:String(o.id), idx:(o.idx!=null ? Number(o.idx) : nextIdx), cells:{}, marks:{}, selected:!!o.selected};
+      nextIdx = Math.max(nextIdx, r.idx+1);
+      cols.forEach(c=>{
+        const v = o[c.field]==null ? '' : String(o[c.field]).trim();
+        r.cells[c.field] = c.num ? v.replace(/,/g,'') : v;
+      });
+      return r;
+    }
+
+    // ---- 分組：整批穩定分段 O(n)；單列加到組尾 / 換組都是 O(1) ----
+    // 列記住自己的組 r.g 與組內位置 r.slot；位置 pos = 前面各組長度 + slot
+    function insertAtTail(r){
+      const g = r.g = groupOf ? groupOf(r) : 0;
+      r.slot = groups[g].push(r) - 1;
+    }
+    function regroup(list){
+      groups = groupOf ? [[],[],[]] : [[]]; dead = 0;
+      list.forEach(insertAtTail);
+    }
+    function moveToGroupTail(r){
+      if(groups[r.g][r.slot]!==r) return;
+      groups[r.g][r.slot] = null; dead++;
+      insertAtTail(r);
+    }
+    function sweep(){
+      if(!dead) return;
+      groups = groups.map(a=>{
+        if(!a.includes(null)) return a;
+        const b = a.filter(Boolean);
+        b.forEach((r,i)=>{ r.slot=i; });
+        return b;
+      });
+      dead = 0;
+    }
+    function size(){ return groups.reduce((n,a)=>n+a.length, 0) - dead; }
+    function rowAt(pos){
+      sweep();
+      for(const a of groups){ if(pos<a.length) return a[pos]; pos-=a.length; }
+      return undefined;
+    }
+    function allRows(){ sweep(); return [].concat(...groups); }
+
+    // ---- 繪製 ----
+    function paintCell(td, r, field){
+      const c = cols.find(x=>x.field===field);
+      const v = r.cells[field];
+      td.textContent = c && c.num ? fmtNum(v) : v;
+      if(field==='shift') paintShiftCell(td);
+      const m = r.marks[field]||'';
+      td.classList.toggle('cell-pending', m==='pending');
+      td.classList.toggle('cell-failed', m==='failed');
+    }
+    function buildTr(r){
+      const tr=document.createElement('tr');
+      tr.dataset.id=r.id; tr.dataset.idx=r.idx;
+      cols.forEach(c=>{
+        const td=document.createElement('td');
+        td.className='center editable'; td.dataset.field=c.field;
+        paintCell(td, r, c.field);
+        tr.appendChild(td);
+      });
+      const td=document.createElement('td'); td.className='center';
+      const cb=document.createElement('input'); cb.type='checkbox'; cb.className='row-select'; cb.value=r.id;
+      cb.checked=r.selected;
+      td.appendChild(cb); tr.appendChild(td);
+      return tr;
+    }
+    function windowFor(){
+      const n = size();
+      if(n<=VGRID_MIN_ROWS) return [0,n];
+      const h = rowH || 40;
+      const top = (padTop.hidden ? tbody : padTop).getBoundingClientRect().top;
+      const first = Math.floor(Math.max(0,-top)/h);
+      let s = Math.max(0, first-VGRID_OVERSCAN);
+      s -= s%2;                                        // 起點取偶數，斑馬紋不跳色
+      const e = Math.min(n, first+Math.ceil(window.innerHeight/h)+VGRID_OVERSCAN);
+      return [Math.min(s, Math.max(0,n-1)), e];
+    }
+    function render(force){
+      raf=0;
+      sweep();
+      const n = size();
+      const [s,e] = windowFor();
+      if(!force && s===win[0] && e===win[1]) return;
+      win=[s,e];
+      const trs=[], keep=new Map();
+      for(let i=s;i<e;i++){
+        const r=rowAt(i);
+        const tr = rendered.get(r) || buildTr(r);
+        tr.dataset.pos=i;
+        keep.set(r,tr); trs.push(tr);
+      }
+      // 先移除不在範圍內的列，再依序補上新列；留下來的列不搬動（編輯中的輸入框不會失焦）
+      const want=new Set(trs);
+      Array.from(tbody.children).forEach(tr=>{ if(!want.has(tr)) tr.remove(); });
+      let cur=tbody.firstChild;
+      trs.forEach(tr=>{ if(tr===cur) cur=cur.nextSibling; else tbody.insertBefore(tr,cur); });
+      rendered.clear(); keep.forEach((tr,r)=>rendered.set(r,tr));
+
+      if(trs.length && tbody.offsetHeight) rowH = tbody.offsetHeight/trs.length;
+      const h = rowH || 40;
+      padTop.hidden = !s;               padTop.firstChild.firstChild.style.height = (s*h)+'px';
+      padBottom.hidden = e>=n; padBottom.firstChild.firstChild.style.height = ((n-e)*h)+'px';
+    }
+    const schedule = ()=>{ if(!raf) raf=requestAnimationFrame(()=>render(false)); };
+    const refresh = ()=>render(true);
+
+    // ---- 初始：讀取伺服器產生的列 ----
+    const rows = [];
+    Array.from(tbody.querySelectorAll('tr[data-id]')).forEach(tr=>{
+      const o={id:tr.dataset.id, idx:tr.dataset.idx};
+      cols.forEach(c=>{ o[c.field]=text(tr.querySelector(`td[data-field="${c.field}"]`)); });
+      o.selected = !!tr.querySelector('input[type="checkbox"]:checked');
+      rows.push(makeRow(o));
+    });
+    if(!rows.length) return null;     // 沒資料：保留「目前沒有資料」列
+    tbody.replaceChildren();
+    tbody.before(padTop); tbody.after(padBottom);
+    regroup(rows);
+    refresh();
+    on(document,'scroll',schedule,{passive:true, capture:true});
+    on(window,'resize',()=>{ rowH=0; schedule(); });
+
+    return {
+      tbody,
+      get size(){ return size(); },
+      rowAt,
+      posOf(el){ const tr=el && el.closest && el.closest('tr[data-pos]'); return tr && tbody.contains(tr) ? Number(tr.dataset.pos) : -1; },
+      append(list){
+        list.forEach(o=>insertAtTail(makeRow(o)));
+        refresh();
+      },
+      sortBy(cmp){
+        regroup(allRows().sort(cmp)); refresh();
+      },
+      resetOrder(){
+        regroup(allRows().sort((a,b)=>a.idx-b.idx)); refresh();
+      },
+      setCell(r, field, value){
+        const before = groupOf ? groupOf(r) : 0;
+        r.cells[field] = String(value);
+        const tr = rendered.get(r);
+        const td = tr && tr.querySelector(`td[data-field="${field}"]`);
+        if(td && !td.classList.contains('editing-cell')) paintCell(td, r, field);
+        if(groupOf && groupOf(r)!==before){ moveToGroupTail(r); refresh(); }
+      },
+      mark(r, field, state){
+        r.marks[field] = state;
+        const tr = rendered.get(r);
+        const td = tr && tr.querySelector(`td[data-field="${field}"]`);
+        if(td){
+          td.classList.toggle('cell-pending', state==='pending');
+          td.classList.toggle('cell-failed', state==='failed');
+        }
+      },
+      setSelected(a, b, state){
+        if(a>b) [a,b]=[b,a];
+        const n=size();
+        for(let i=Math.max(0,a); i<=b && i<n; i++){
+          const r=rowAt(i); r.selected=state;
+          const tr=rendered.get(r);
+          if(tr){ const cb=tr.querySelector('input.row-select'); if(cb) cb.checked=state; }
+        }
+      },
+      // 送出刪除：只有畫出的列有 checkbox，改由陣列產生 selected 欄位
+      bindForm(form){
+        if(!form) return;
+        on(form,'submit',()=>{
+          $$('input.vgrid-sel', form).forEach(x=>x.remove());
+          const frag=document.createDocumentFragment();
+          allRows().forEach(r=>{
+            if(!r.selected) return;
+            const inp=document.createElement('input');
+            inp.type='hidden'; inp.name='selected'; inp.value=r.id; inp.className='vgrid-sel';
+            frag.appendChild(inp);
+          });
+          form.appendChild(frag);
+        });
+      }
+    };
+  }
+
+  // ---------- 拖曳勾選（含 Shift 範圍；以列位置運算，不查 DOM 列表） ----------
+  function initDragSelect(grid){
+    if(!grid) return;
+    const tbody = grid.tbody;
+    let dragging=false, targetState=false, lastPos=-1, anchor=-1;
 
     on(tbody,'mousedown',e=>{
       if(e.button!==0) return;
       const td = e.target.closest('td'); if(!td) return;
       const tr = td.parentElement;
       const isLast = td.cellIndex === tr.cells.length-1;
-      const cb = td.querySelector('input[type="checkbox"][name="selected"]');
+      const cb = td.querySelector('input.row-select');
       if(!cb || !isLast) return;
+      const pos = grid.posOf(tr); if(pos<0) return;
 
       if(e.target===cb){
         setTimeout(()=>{
           targetState = cb.checked;
+          lastPos = pos;
           dragging = true;
           document.documentElement.classList.add('x-dragging');  // 鎖選取（只對班別欄有效，見樣式）
         },0);
         return;
       }
       e.preventDefault();
-      targetState = !cb.checked;
-      cb.checked = targetState;
+      targetState = !grid.rowAt(pos).selected;
+      grid.setSelected(pos, pos, targetState);
+      lastPos = anchor = pos;
       dragging = true;
       document.documentElement.classList.add('x-dragging');
     });
 
+    // 拖曳經過：補齊上一列到目前列之間（滑鼠移動過快或列被重畫時也不漏勾）
     on(tbody,'mouseover',e=>{
       if(!dragging) return;
-      const tr = e.target.closest('tr'); if(!tr) return;
-      const cb = tr.querySelector('input[type="checkbox"][name="selected"]');
-      if (cb) cb.checked = targetState;
+      const pos = grid.posOf(e.target); if(pos<0) return;
+      grid.setSelected(lastPos<0 ? pos : lastPos, pos, targetState);
+      lastPos = pos;
     });
 
     // 確保拖曳結束一定釋放，避免「卡住」
     const clearDragFlag = ()=>{
-      dragging=false;
+      dragging=false; lastPos=-1;
       document.documentElement.classList.remove('x-dragging');
     };
     on(document,'mouseup', clearDragFlag);
@@ -178,89 +478,75 @@
     on(window,'blur', clearDragFlag);
     on(document,'click', clearDragFlag);
 
-    // Shift+Click 範圍
+    // 單擊 checkbox 寫回陣列；Shift+Click 範圍
     on(tbody,'click',e=>{
-      const cb = e.target.closest('input[type="checkbox"][name="selected"]');
+      const cb = e.target.closest('input.row-select');
       if(!cb) return;
-      const rs = rows();
-      const idx = rs.indexOf(cb.closest('tr'));
-      if(e.shiftKey && lastIdx>=0){
-        const [a,b] = lastIdx<idx ? [lastIdx,idx] : [idx,lastIdx];
-        for(let i=a;i<=b;i++){
-          const cbi = rs[i].querySelector('input[type="checkbox"][name="selected"]');
-          if(cbi) cbi.checked = cb.checked;
-        }
-      }
-      lastIdx = idx;
+      const pos = grid.posOf(cb); if(pos<0) return;
+      if(e.shiftKey && anchor>=0) grid.setSelected(anchor, pos, cb.checked);
+      else grid.setSelected(pos, pos, cb.checked);
+      anchor = pos;
     });
   }
 
-  // ---------- 訂單頁：分班別 + 新增列置尾 ----------
-  function getShiftFromRow(tr){
-    const td = tr.querySelector('td[data-field="shift"]');
-    if(!td) return '';
-    const v = (td.querySelector('select')?.value || text(td)).trim();
-    if(!v) return '';
-    if(v.startsWith('早')) return '早班';
-    if(v.startsWith('晚')) return '晚班';
-    return v;
-  }
-  function stableGroupAll(tbody){
-    const rows = Array.from(tbody.querySelectorAll('tr'));
-    const early=[], late=[], other=[];
-    rows.forEach(tr=>{
-      const s=getShiftFromRow(tr);
-      if(s==='早班') early.push(tr);
-      else if(s==='晚班') late.push(tr);
-      else other.push(tr);
+  // ---------- 表內編輯：點格子開編輯器，結果寫回列資料 ----------
+  function bindGridEditing(grid, queue, editorFor){
+    let editingNow=null;
+    on(grid.tbody,'click',e=>{
+      const td = e.target.closest('td.editable'); if(!td) return;
+      if(editingNow && editingNow===td) return;
+      const r = grid.rowAt(grid.posOf(td)); if(!r) return;
+      editingNow = td;
+
+      const field = td.getAttribute('data-field');
+      const {type, options} = editorFor(field);
+      const apply = val=>grid.setCell(r, field, val);
+      makeCellEditor(td, {
+        id:r.id, field, queue, type, value:r.cells[field], options,
+        mark:state=>grid.mark(r, field, state),
+        onSaved:apply, onRollback:apply
+      });
+
+      const obs = new MutationObserver(()=>{
+        if(!td.querySelector('.cell-editor')){ editingNow=null; obs.disconnect(); }
+      });
+      obs.observe(td,{childList:true, subtree:true});
     });
-    const frag=document.createDocumentFragment();
-    early.forEach(tr=>frag.appendChild(tr));
-    late.forEach(tr=>frag.appendChild(tr));
-    other.forEach(tr=>frag.appendChild(tr));
-    tbody.innerHTML='';
-    tbody.appendChild(frag);
   }
-  function moveRowToShiftTail(tr, tbody){
-    const s = getShiftFromRow(tr); if(!s) return;
-    const rows = Array.from(tbody.querySelectorAll('tr'));
-    let insertAfter=null;
-    if(s==='早班'){
-      for(let i=rows.length-1;i>=0;i--){ if(getShiftFromRow(rows[i])==='早班'){ insertAfter=rows[i]; break; } }
-      if(insertAfter) insertAfter.after(tr);
-      else{
-        const firstLate = rows.find(r=>getShiftFromRow(r)==='晚班');
-        if(firstLate) tbody.insertBefore(tr, firstLate);
-        else tbody.insertBefore(tr, tbody.firstChild);
-      }
-    }else if(s==='晚班'){
-      for(let i=rows.length-1;i>=0;i--){ if(getShiftFromRow(rows[i])==='晚班'){ insertAfter=rows[i]; break; } }
-      if(insertAfter) insertAfter.after(tr);
-      else{
-        for(let i=rows.length-1;i>=0;i--){ if(getShiftFromRow(rows[i])==='早班'){ insertAfter=rows[i]; break; } }
-        if(insertAfter) insertAfter.after(tr);
-        else tbody.appendChild(tr);
+
+  // ---------- 訂單頁：捲動載入（keyset 分頁，/orders/rows） ----------
+  function initOrdersPaging(tbody, onRows){
+    const more = $('#orders-more');
+    let next = tbody.dataset.next || '';
+    if(!more || !next || !('IntersectionObserver' in window)) return;
+    let loading=false;
+    const base = new URL(location.href).searchParams;
+
+    const load = async()=>{
+      if(loading || !next) return;
+      loading=true;
+      const qs = new URLSearchParams();
+      ['q','from_','to'].forEach(k=>{ const v=base.get(k); if(v) qs.set(k,v); });
+      qs.set('after', next);
+      try{
+        const res = await fetch('/orders/rows?'+qs.toString(), {cache:'no-store'});
+        const j = await res.json();
+        if(!j || !j.ok) throw new Error('rows');
+        next = j.next || '';
+        onRows && onRows(j.rows);
+      }catch(_e){
+        next = '';
+        more.textContent='載入失敗，請重新整理';
+      }finally{
+        loading=false;
+        if(!next && more.textContent!=='載入失敗，請重新整理') more.hidden=true;
       }
-    }
-  }
-  function observeNewRows(tbody){
-    const obs = new MutationObserver(muts=>{
-      muts.forEach(m=>{
-        m.addedNodes.forEach(node=>{
-          if(!(node instanceof HTMLElement)) return;
-          if(node.tagName==='TR'){
-            paintAllShiftCells(node);
-            moveRowToShiftTail(node, tbody);
-          }else{
-            node.querySelectorAll && node.querySelectorAll('tr').forEach(tr=>{
-              paintAllShiftCells(tr);
-              moveRowToShiftTail(tr, tbody);
-            });
-          }
-        });
-      });
-    });
-    obs.observe(tbody, {childList:true, subtree:true});
+    };
+    const io = new IntersectionObserver(ents=>{
+      if(ents.some(e=>e.isIntersecting)) load();
+      if(!next) io.disconnect();
+    }, {rootMargin:'600px 0px'});
+    io.observe(more);
   }
 
   // ---------- 焦點策略：/orders#create → 單號；有 q → 搜尋；其餘不動 ----------
@@ -284,75 +570,50 @@
   }
 
   // ---------- 訂單頁初始化 ----------
+  const orderGroup = r=>{ const s=normShift(r.cells.shift); return s==='早班'?0 : s==='晚班'?1 : 2; };
+
   function initOrdersPage(){
     const table = $('#orders-table'); if(!table) return;
     const tbody = $('#orders-body') || table.tBodies[0];
 
-    paintAllShiftCells(table);
-    stableGroupAll(tbody);
-    observeNewRows(tbody);
-
-    // 表內編輯
-    let editingNow=null;
-    on(tbody,'click',e=>{
-      const td = e.target.closest('td.editable'); if(!td) return;
-      if(editingNow && editingNow===td) return;
-      editingNow = td;
-
-      const tr = td.closest('tr');
-      const id = tr.getAttribute('data-id');
-      const field = td.getAttribute('data-field');
-      const raw = td.textContent.trim().replace(/,/g,'');
-
-      let type='text', options=null;
-      if(field==='shift'){ type='select'; options=['早班','晚班']; }
-      else if(field==='amount'){ type='number'; }
-      else if(field==='odt'){ type='date'; }
-
-      makeCellEditor(td, {
-        id, field, url:'/orders/update-json', type, value:raw, options,
-        onSaved:(val)=>{
-          if(field==='shift'){
-            td.textContent = (/^早/.test(val)?'早班': /^晚/.test(val)?'晚班': val);
-            paintShiftCell(td);
-            moveRowToShiftTail(tr, tbody);
-          }
-        }
+    const grid = createGrid(tbody, {
+      cols:[{field:'shift'},{field:'order_no'},{field:'amount', num:true},{field:'odt'}],
+      groupOf:orderGroup
+    });
+    if(grid){
+      // 表內編輯（經批次佇列寫回；改班別時列會移到新班別尾端）
+      const queue = createWriteQueue('/orders/update-batch');
+      bindGridEditing(grid, queue, field=>{
+        if(field==='shift')  return {type:'select', options:['早班','晚班']};
+        if(field==='amount') return {type:'number'};
+        if(field==='odt')    return {type:'date'};
+        return {type:'text'};
       });
 
-      const obs = new MutationObserver(()=>{
-        if(!td.querySelector('.cell-editor')){ editingNow=null; obs.disconnect(); }
-      });
-      obs.observe(td,{childList:true, subtree:true});
-    });
+      // 拖曳勾選
+      initDragSelect(grid);
+      grid.bindForm($('#form-delete'));
 
-    // 拖曳勾選
-    initDragSelect(tbody);
-
-    // 表頭排序（點同欄第二次恢復）
-    const orig = Array.from(tbody.querySelectorAll('tr'));
-    let currentKey=null;
-    function restore(){
-      while(tbody.firstChild) tbody.removeChild(tbody.firstChild);
-      orig.sort((a,b)=> Number(a.dataset.idx)-Number(b.dataset.idx));
-      orig.forEach(tr=>tbody.appendChild(tr));
-      stableGroupAll(tbody);
-    }
-    function applySort(key){
-      if(currentKey===key){ currentKey=null; return restore(); }
-      const rows = Array.from(orig);
-      rows.sort((a,b)=>{
-        const ta = a.querySelector(`[data-field="${key}"]`).textContent.trim().replace(/,/g,'');
-        const tb = b.querySelector(`[data-field="${key}"]`).textContent.trim().replace(/,/g,'');
+      // 表頭排序（點同欄第二次恢復）；排序在陣列上做，之後再分班別
+      let currentKey=null;
+      const cmpBy = key=>(a,b)=>{
+        const ta=a.cells[key], tb=b.cells[key];
         if(key==='amount') return Number(ta)-Number(tb);
         return (ta>tb?1:ta<tb?-1:0);
+      };
+      function applySort(key){
+        if(currentKey===key){ currentKey=null; return grid.resetOrder(); }
+        grid.sortBy(cmpBy(key));
+        currentKey=key;
+      }
+      $$('#orders-table th.sortable').forEach(th=> on(th,'click',()=>applySort(th.dataset.key)));
+
+      // 捲到底再向後端取下一頁；未排序時新列接到所屬班別尾端，排序中就重排一次
+      initOrdersPaging(tbody, list=>{
+        grid.append(list);
+        if(currentKey) grid.sortBy(cmpBy(currentKey));
       });
-      while(tbody.firstChild) tbody.removeChild(tbody.firstChild);
-      rows.forEach(tr=>tbody.appendChild(tr));
-      stableGroupAll(tbody);
-      currentKey=key;
     }
-    $$('#orders-table th.sortable').forEach(th=> on(th,'click',()=>applySort(th.dataset.key)));
 
     // 新增送出時（導回 #create），這裡只發 KPI 髒訊號
     const createForm = $('#form-create');
@@ -403,32 +664,20 @@
 
     const CAT_OPTIONS = ['原料','租金','人事','菜錢','雜支','租金水電','其他'];
 
-    let editingNow=null;
-    on(tbody,'click',e=>{
-      const td = e.target.closest('td.editable'); if(!td) return;
-      if(editingNow && editingNow===td) return;
-      editingNow = td;
-
-      const tr = td.closest('tr');
-      const id = tr.getAttribute('data-id');
-      const field = td.getAttribute('data-field');
-      const raw = td.textContent.trim().replace(/,/g,'');
-
-      let type='text', options=null;
-      if(field==='cat'){ type='select'; options=CAT_OPTIONS; }
-      else if(field==='amount'){ type='number'; }
-      else if(field==='odt'){ type='date'; }
-
-      makeCellEditor(td, { id, field, url:'/expenses/update-json', type, value:raw, options,
-        onSaved:()=>notifyKpiDirty() });
-
-      const obs = new MutationObserver(()=>{
-        if(!td.querySelector('.cell-editor')){ editingNow=null; obs.disconnect(); }
-      });
-      obs.observe(td,{childList:true, subtree:true});
+    const grid = createGrid(tbody, {
+      cols:[{field:'cat'},{field:'amount', num:true},{field:'odt'},{field:'memo'}]
+    });
+    if(!grid) return;
+    const queue = createWriteQueue('/expenses/update-batch');
+    bindGridEditing(grid, queue, field=>{
+      if(field==='cat')    return {type:'select', options:CAT_OPTIONS};
+      if(field==='amount') return {type:'number'};
+      if(field==='odt')    return {type:'date'};
+      return {type:'text'};
     });
 
-    initDragSelect(tbody);
+    initDragSelect(grid);
+    grid.bindForm($('#form-delete-exp'));
   }
 
   // ---------- KPI/報表：變更自動送出 ----------
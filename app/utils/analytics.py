@@ -0,0 +1,206 @@
+# app/utils/analytics.py
+# -*- coding: utf-8 -*-
+"""
+營運分析：移動平均、星期季節性、月底預估（NumPy 向量化）
+- 全部歷史先彙總成「每日 × (早班, 晚班, 支出)」一次載入成陣列（series.grid），之後的計算都在記憶體裡
+- DailyCache 以資料庫檔（與 -wal）的 mtime / 大小當版本，資料沒變就不重查；一個行程一份
+- 三個前端共用：server.py /api/v1/reports/analytics、web_ui 與桌機版 AI 助理的「走勢 / 預估」問句
+各程式只負責提供 loader()，回傳 [(日期, 類別, 金額)]（類別同 series：0=早班 1=晚班 2=支出）。
+月底預估 = 本月至今實績 + 剩餘每一天的「近 N 週同星期平均營收」；支出波動大（房租、進貨），
+改用近 28 天日均。基準日當天可能還沒結帳，平均值只取基準日之前的完整日子。
+"""
+from __future__ import annotations
+
+import os, threading
+from calendar import monthrange
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import series
+
+WEEKDAYS = ("一", "二", "三", "四", "五", "六", "日")
+SEASON_WEEKS = 8                    # 星期季節性 / 預估用近幾週
+TAIL_DAYS = 56                      # summary 附帶的圖表天數
+
+
+class Daily:
+    """連續日軸上的每日金額；axis 為 datetime64[D]，其餘為等長 float 陣列。"""
+    __slots__ = ("axis", "morning", "evening", "total", "expense")
+
+    def __init__(self, axis: np.ndarray, g: np.ndarray):
+        self.axis = axis
+        self.morning, self.evening, self.expense = g
+        self.total = self.morning + self.evening
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[Any]], until: Optional[date] = None) -> "Daily":
+        rows = list(rows)
+        until = until or date.today()
+        if rows:
+            first = np.array([r[0] for r in rows], dtype="datetime64[D]")
+            d1, d2 = first.min(), max(first.max(), np.datetime64(until, "D"))
+        else:
+            d1 = d2 = np.datetime64(until, "D")
+        axis = np.arange(d1, d2 + 1)
+        return cls(axis, series.grid(axis, rows))
+
+    def pos(self, d: date) -> int:
+        """d 在日軸上的位置（可能 < 0 或 ≥ len，呼叫端自行裁切）。"""
+        return int((np.datetime64(d, "D") - self.axis[0]).astype(np.int64))
+
+    def padded(self, d: date) -> "Daily":
+        """日軸不含 d 時往前 / 後補 0 延伸到 d（未來的基準日或資料開始前）。"""
+        i = self.pos(d)
+        if 0 <= i < len(self.axis):
+            return self
+        x = np.datetime64(d, "D")
+        axis = np.arange(min(self.axis[0], x), max(self.axis[-1], x) + 1)
+        g = np.zeros((3, len(axis)))
+        off = max(0, -i)
+        g[:, off:off + len(self.axis)] = np.vstack([self.morning, self.evening, self.expense])
+        return Daily(axis, g)
+
+    def window(self, arr: np.ndarray, d1: date, d2: date) -> np.ndarray:
+        i, j = max(self.pos(d1), 0), min(self.pos(d2) + 1, len(arr))
+        return arr[i:j] if i < j else arr[:0]
+
+
+# ---------------- 計算 ----------------
+def moving_average(x: np.ndarray, w: int) -> np.ndarray:
+    """尾端對齊的 w 日移動平均；前 w-1 天資料不足為 NaN。"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= w:
+        c = np.cumsum(np.r_[0.0, x])
+        out[w - 1:] = (c[w:] - c[:-w]) / w
+    return out
+
+def _weekday(axis: np.ndarray) -> np.ndarray:
+    return (axis.astype(np.int64) + 3) % 7           # 週一 = 0（1970-01-01 是週四）
+
+def weekday_means(d: Daily, ref: date, weeks: int = SEASON_WEEKS) -> np.ndarray:
+    """ref 之前 weeks 週（不含 ref 當天）各星期的平均營收，長度 7。"""
+    lo, hi = ref - timedelta(days=7 * weeks), ref - timedelta(days=1)
+    vals, wd = d.window(d.total, lo, hi), d.window(d.axis, lo, hi)
+    if not len(vals):
+        return np.zeros(7)
+    wd = _weekday(wd)
+    n = np.bincount(wd, minlength=7)
+    return np.divide(np.bincount(wd, weights=vals, minlength=7), n, out=np.zeros(7), where=n > 0)
+
+def month_projection(d: Daily, ref: date, weeks: int = SEASON_WEEKS) -> Dict[str, Any]:
+    m1 = ref.replace(day=1)
+    m2 = ref.replace(day=monthrange(ref.year, ref.month)[1])
+    rev_mtd = float(d.window(d.total, m1, ref).sum())
+    exp_mtd = float(d.window(d.expense, m1, ref).sum())
+    wd_mean = weekday_means(d, ref, weeks)
+    rest = np.arange(np.datetime64(ref, "D") + 1, np.datetime64(m2, "D") + 1)
+    rev_rest = float(wd_mean[_weekday(rest)].sum()) if len(rest) else 0.0
+    exp_daily = float(d.window(d.expense, ref - timedelta(days=28), ref - timedelta(days=1)).sum()) / 28
+    exp_rest = exp_daily * len(rest)
+    prev_end = m1 - timedelta(days=1)
+    last_month = float(d.window(d.total, prev_end.replace(day=1), prev_end).sum())
+    ly = date(ref.year - 1, ref.month, 1)
+    last_year = float(d.window(d.total, ly, ly.replace(day=monthrange(ly.year, ly.month)[1])).sum())
+    projected = rev_mtd + rev_rest
+    return {
+        "month": f"{ref:%Y-%m}", "days_elapsed": ref.day, "days_left": len(rest),
+        "revenue_mtd": rev_mtd, "expense_mtd": exp_mtd,
+        "revenue_projected": projected, "expense_projected": exp_mtd + exp_rest,
+        "net_projected": projected - exp_mtd - exp_rest,
+        "last_month_revenue": last_month, "last_year_revenue": last_year,
+        "vs_last_month_pct": round((projected - last_month) / last_month * 100, 2) if last_month else None,
+        "vs_last_year_pct": round((projected - last_year) / last_year * 100, 2) if last_year else None,
+    }
+
+def _f(v: float) -> Optional[float]:
+    return None if np.isnan(v) else round(float(v), 2)
+
+def summary(d: Daily, ref: Optional[date] = None, tail: int = TAIL_DAYS) -> Dict[str, Any]:
+    """給 API / AI 助理用的整包結果（JSON 可直接序列化）。"""
+    ref = ref or date.today()
+    d = d.padded(ref)
+    i = d.pos(ref)
+    ma7, ma28 = moving_average(d.total, 7), moving_average(d.total, 28)
+    wd_mean = weekday_means(d, ref)
+    base = wd_mean.mean() if wd_mean.any() else 0.0
+    index = wd_mean / base if base else np.zeros(7)
+    lo = max(0, i - tail + 1)
+    return {
+        "ref_date": ref,
+        "ma7": _f(ma7[i]), "ma28": _f(ma28[i]),
+        "trend_pct": _f((ma7[i] - ma28[i]) / ma28[i] * 100) if ma28[i] and not np.isnan(ma28[i]) else None,
+        "weekday": [{"weekday": WEEKDAYS[k], "mean": round(float(wd_mean[k]), 2), "index": round(float(index[k]), 3)}
+                    for k in range(7)],
+        "projection": month_projection(d, ref),
+        "tail": {"dates": np.datetime_as_string(d.axis[lo:i + 1], unit="D").tolist(),
+                 "total": d.total[lo:i + 1].tolist(), "expense": d.expense[lo:i + 1].tolist(),
+                 "ma7": [_f(v) for v in ma7[lo:i + 1]], "ma28": [_f(v) for v in ma28[lo:i + 1]]},
+    }
+
+def brief(s: Dict[str, Any]) -> List[str]:
+    """summary → 給 AI 助理顯示的幾句話。"""
+    p = s["projection"]
+    out = [f"本月（{p['month']}）至今營收 NT${p['revenue_mtd']:,.0f}，已過 {p['days_elapsed']} 天、剩 {p['days_left']} 天",
+           f"依近 {SEASON_WEEKS} 週同星期平均，預估月底營收 NT${p['revenue_projected']:,.0f}、"
+           f"支出 NT${p['expense_projected']:,.0f}、淨利 NT${p['net_projected']:,.0f}"]
+    if p["vs_last_month_pct"] is not None:
+        out.append(f"較上月（NT${p['last_month_revenue']:,.0f}）{p['vs_last_month_pct']:+.1f}%")
+    if p["vs_last_year_pct"] is not None:
+        out.append(f"較去年同月（NT${p['last_year_revenue']:,.0f}）{p['vs_last_year_pct']:+.1f}%")
+    if s["ma7"] is not None and s["ma28"] is not None:
+        trend = "" if s["trend_pct"] is None else f"，近一週{'高' if s['trend_pct'] >= 0 else '低'}於四週平均 {abs(s['trend_pct']):.1f}%"
+        out.append(f"7 日均 NT${s['ma7']:,.0f}／28 日均 NT${s['ma28']:,.0f}{trend}")
+    wk = [w for w in s["weekday"] if w["mean"]]
+    if wk:
+        hi, lo = max(wk, key=lambda w: w["index"]), min(wk, key=lambda w: w["index"])
+        if hi["index"] - lo["index"] < 0.05:
+            out.append("各星期營收差異不大")
+        else:
+            out.append(f"星期效應：週{hi['weekday']}最旺（{hi['index']:.2f}×），週{lo['weekday']}最淡（{lo['index']:.2f}×）")
+    return out
+
+
+# ---------------- 快取 ----------------
+def data_version(path: str) -> Tuple:
+    """資料版本：DB 檔與 -wal 的 (mtime, 大小)；有寫入就會變（跨門市合併報表也用它當快取鍵）。"""
+    v = []
+    for p in (path, path + "-wal"):
+        try:
+            st = os.stat(p)
+            v.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            v.append(None)
+    return tuple(v)
+
+class DailyCache:
+    """每個資料庫檔一份 Daily；檔案（含 WAL）沒變、且日軸已涵蓋今天就直接回傳。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[Tuple, Daily]] = {}
+
+    def get(self, path: str, loader: Callable[[], Iterable[Sequence[Any]]]) -> Daily:
+        key = os.path.abspath(path)
+        ver = data_version(key)
+        hit = self._data.get(key)
+        if hit and hit[0] == ver and hit[1].axis[-1] >= np.datetime64(date.today(), "D"):
+            return hit[1]
+        with self._lock:
+            hit = self._data.get(key)
+            if hit and hit[0] == ver and hit[1].axis[-1] >= np.datetime64(date.today(), "D"):
+                return hit[1]
+            d = Daily.from_rows(loader())
+            self._data[key] = (ver, d)
+            return d
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+cache = DailyCache()
+
+
+__all__ = ["WEEKDAYS", "Daily", "DailyCache", "cache", "data_version", "moving_average", "weekday_means", "month_projection",
+           "summary", "brief"]
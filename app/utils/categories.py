@@ -0,0 +1,189 @@
+# app/utils/categories.py
+# -*- coding: utf-8 -*-
+"""
+支出分類維度表：expense_categories(id, name)，expenses 只存整數外鍵（server / 桌機 / app 為 category_id，web_ui 為 cat_id）
+- 每筆支出不再重複存分類字串；GROUP BY / 索引都在整數鍵上，名稱只在輸出時 JOIN 一次
+- CategoryCache：每個資料庫一份「名稱 ↔ id」記憶體快取，寫入支出時以名稱換 id；
+  快取沒有的名稱以獨立連線 INSERT … ON CONFLICT DO NOTHING 後立即 commit，
+  不跟呼叫端的交易綁在一起（呼叫端 rollback 也不會讓快取指到不存在的 id）→ 請在寫入支出「之前」取 id
+- 分類只增不刪、不改名，快取不需失效；整個資料庫檔被換掉（還原備份）時呼叫 clear()
+- migrate_sqlite()：舊 SQLite 檔的 expenses 仍是文字欄位時，建維度表、回填 id、重建 expenses 拿掉文字欄位（冪等）；
+  decode_sql() 為反向，給 app/migrations.py 降版用
+連線可為 sqlite3.Connection 或 SQLAlchemy Connection / Session；SQL 一律用 :name 參數，兩邊通用。
+"""
+from __future__ import annotations
+
+import re, sqlite3, threading
+from typing import Any, Callable, ContextManager, Dict, List, Mapping, Optional
+
+TABLE = "expense_categories"
+DEFAULT_NAME = "未分類"
+NAME_MAX = 64
+DDL = (f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+       f"id INTEGER PRIMARY KEY, name VARCHAR({NAME_MAX}) NOT NULL UNIQUE)")
+
+
+def normalize(name: Any) -> str:
+    """前後空白去掉、過長截斷；空字串歸到「未分類」。"""
+    return str(name or "").strip()[:NAME_MAX] or DEFAULT_NAME
+
+def _exec(conn: Any, sql: str, params: Optional[Mapping[str, Any]] = None):
+    if isinstance(conn, sqlite3.Connection):
+        return conn.execute(sql, dict(params or {}))
+    from sqlalchemy import text
+    return conn.execute(text(sql), dict(params or {}))
+
+
+class CategoryCache:
+    """connect() 回傳一個 context manager，離開時 commit（sqlite3 連線本身、SQLAlchemy engine.begin 皆可）。"""
+
+    def __init__(self, connect: Callable[[], ContextManager[Any]]):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+
+    def _put(self, cid: int, name: str) -> None:
+        self._ids[name] = cid
+        self._names[cid] = name
+
+    def load(self) -> None:
+        """一次載入整張維度表（名稱 / id 查不到時自動呼叫）。"""
+        with self._connect() as c:
+            rows = _exec(c, f"SELECT id, name FROM {TABLE}").fetchall()
+        with self._lock:
+            for cid, name in rows:
+                self._put(int(cid), name)
+
+    def id_for(self, name: Any) -> int:
+        name = normalize(name)
+        cid = self._ids.get(name)
+        if cid is not None:
+            return cid
+        with self._lock:
+            cid = self._ids.get(name)
+            if cid is None:
+                with self._connect() as c:
+                    _exec(c, f"INSERT INTO {TABLE} (name) VALUES (:n) ON CONFLICT (name) DO NOTHING", {"n": name})
+                    cid = int(_exec(c, f"SELECT id FROM {TABLE} WHERE name = :n", {"n": name}).fetchone()[0])
+                self._put(cid, name)
+            return cid
+
+    def ids_for(self, names) -> Dict[str, int]:
+        """批次寫入用：先把所有名稱換成 id（原始字串 → id），再開始寫支出。"""
+        return {n: self.id_for(n) for n in set(names)}
+
+    def name_for(self, cid: Optional[int]) -> str:
+        if cid is None:
+            return DEFAULT_NAME
+        name = self._names.get(int(cid))
+        if name is None:
+            self.load()
+            name = self._names.get(int(cid), DEFAULT_NAME)
+        return name
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+
+
+# ---------------- 舊 SQLite 檔遷移 ----------------
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _rebuild_sql(conn: Any, table: str, old: str, new_def: str, new: str, value: str, join: str) -> List[str]:
+    """
+    SQLite 標準的「建新表 → 複製 → 刪舊表 → 改名」，把欄位 old 換成 new（定義 new_def、值 value）：
+    其餘欄位順序、型別、NOT NULL、預設值、AUTOINCREMENT 與序號、既有索引都保留，索引欄位中的 old 換成 new。
+    value / join 以 e 指原表。
+    """
+    info = _exec(conn, f"PRAGMA table_info({_q(table)})").fetchall()
+    src = (_exec(conn, "SELECT sql FROM sqlite_master WHERE type='table' AND name=:t", {"t": table}).fetchone() or [""])[0]
+    autoinc = "AUTOINCREMENT" in (src or "").upper()
+    pks = [r[1] for r in sorted(info, key=lambda r: r[5]) if r[5]]
+    defs, dst, sel = [], [], []
+    for _cid, name, typ, notnull, dflt, pk in info:
+        if name == old:
+            defs.append(f"{_q(new)} {new_def}")
+            dst.append(_q(new))
+            sel.append(value)
+            continue
+        d = f"{_q(name)} {typ}".rstrip()
+        if len(pks) == 1 and pk:
+            d += " PRIMARY KEY" + (" AUTOINCREMENT" if autoinc else "")
+        if notnull and not (len(pks) == 1 and pk):
+            d += " NOT NULL"
+        if dflt is not None:
+            d += f" DEFAULT {dflt}"
+        defs.append(d)
+        dst.append(_q(name))
+        sel.append(f"e.{_q(name)}")
+    if len(pks) > 1:
+        defs.append(f"PRIMARY KEY ({', '.join(map(_q, pks))})")
+
+    tmp = f"{table}__rebuild"
+    indexes = _exec(conn, "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=:t AND sql IS NOT NULL",
+                    {"t": table}).fetchall()
+    word = re.compile(rf'(?<![\w"]){re.escape(old)}(?![\w"])|"{re.escape(old)}"')
+    seq = _exec(conn, "SELECT seq FROM sqlite_sequence WHERE name=:t", {"t": table}).fetchone() if autoinc else None
+    out = [f"DROP TABLE IF EXISTS {_q(tmp)}",
+           f"CREATE TABLE {_q(tmp)} (\n    " + ",\n    ".join(defs) + "\n)",
+           f"INSERT INTO {_q(tmp)} ({', '.join(dst)}) SELECT {', '.join(sel)} FROM {_q(table)} e {join}",
+           f"DROP TABLE {_q(table)}",
+           f"ALTER TABLE {_q(tmp)} RENAME TO {_q(table)}"]
+    for (sql,) in indexes:
+        head, _, body = sql.partition("(")
+        out.append(head + "(" + word.sub(_q(new), body))
+    if seq is not None:
+        out += [f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', 0 "
+                f"WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = '{table}')",
+                f"UPDATE sqlite_sequence SET seq = MAX(seq, {int(seq[0])}) WHERE name = '{table}'"]
+    return out
+
+def _columns(conn: Any, table: str) -> set:
+    return {r[1] for r in _exec(conn, f"PRAGMA table_info({_q(table)})").fetchall()}
+
+def name_expr(col: str, alias: str = "e") -> str:
+    """SQL 端的 normalize()：去空白、截斷，空值歸「未分類」。"""
+    return f"COALESCE(NULLIF(substr(trim({alias}.{_q(col)}), 1, {NAME_MAX}), ''), '{DEFAULT_NAME}')"
+
+def migration_sql(conn: Any, name_col: str, id_col: str, table: str = "expenses") -> List[str]:
+    """table 仍有文字欄 name_col（且還沒有 id_col）時，回傳改存 id_col 外鍵所需的 SQL；否則回傳 []。"""
+    cols = _columns(conn, table)
+    if name_col not in cols or id_col in cols:
+        return []
+    norm = name_expr(name_col)
+    return [DDL,
+            f"INSERT INTO {TABLE} (name) SELECT DISTINCT {norm} FROM {_q(table)} e WHERE 1 ON CONFLICT (name) DO NOTHING",
+            *_rebuild_sql(conn, table, name_col, f"INTEGER NOT NULL REFERENCES {TABLE} (id)", id_col,
+                          "c.id", f"JOIN {TABLE} c ON c.name = {norm}")]
+
+def decode_sql(conn: Any, id_col: str, name_col: str, table: str = "expenses") -> List[str]:
+    """migration_sql 的反向（降版用）：id_col 換回文字欄 name_col；維度表保留，由呼叫端決定是否刪除。"""
+    cols = _columns(conn, table)
+    if id_col not in cols or name_col in cols:
+        return []
+    return _rebuild_sql(conn, table, id_col, f"VARCHAR({NAME_MAX}) NOT NULL", name_col,
+                        "c.name", f"JOIN {TABLE} c ON c.id = e.{_q(id_col)}")
+
+def migrate_sqlite(path: str, name_col: str, id_col: str, table: str = "expenses") -> bool:
+    """在單一 IMMEDIATE 交易內完成遷移；有做事回傳 True。程式啟動、ORM 建立前呼叫。"""
+    c = sqlite3.connect(path, isolation_level=None)
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            stmts = migration_sql(c, name_col, id_col, table)
+            for s in stmts:
+                c.execute(s)
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        return bool(stmts)
+    finally:
+        c.close()
+
+
+__all__ = ["TABLE", "DEFAULT_NAME", "NAME_MAX", "DDL", "normalize", "name_expr", "CategoryCache",
+           "migration_sql", "decode_sql", "migrate_sqlite"]
@@ -0,0 +1,173 @@
+# app/utils/columnar.py
+# -*- coding: utf-8 -*-
+"""
+Arrow / Parquet 匯出（給 BI 用，取代「整段 CSV → 再解析」）
+- orders / expenses 從 DB cursor 每 BATCH_ROWS 列轉成一個 Arrow RecordBatch，型別固定：
+  id int64、date date32、班別 / 分類為 dictionary（字串只存一次）、金額 float64、其餘 string
+- ipc_stream()：Arrow IPC streaming format（application/vnd.apache.arrow.stream），每批送出一段 bytes；
+  可選 zstd / lz4 壓縮 record batch（讀取端需支援）
+- write_dataset()：Parquet（zstd）依日期分割成 hive 目錄：orders/month=2024-01/part-0.parquet …，
+  查詢端（DuckDB、Spark、pandas.read_parquet）可只讀需要的分割；資料依日期排序時每個分割只開一個檔
+  open_fn(相對路徑) 決定寫到哪：zip 成員（HTTP 下載）或一般目錄（scripts/export_parquet.py）
+- pyarrow 為選用相依：沒裝時 available() 為 False，呼叫匯出函式丟 ArrowUnavailable（各 app 回 501）
+列的欄位順序同 TABLES；日期可為 date 或 ISO 字串（SQLite 直接取字串最快）。
+"""
+from __future__ import annotations
+
+import itertools
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MEDIA_TYPE_IPC = "application/vnd.apache.arrow.stream"
+BATCH_ROWS = 65536                  # 每批列數：Arrow 建議 64K 左右，夠大才有欄式壓縮 / 向量化的效益
+PARTITIONS = ("year", "month", "day")
+IPC_COMPRESSIONS = ("none", "zstd", "lz4")
+PARQUET_COMPRESSION = "zstd"
+
+# 欄位名稱 → 型別代號（_arrow_type 轉成 pyarrow 型別；匯入 pyarrow 延後到真正用到時）
+TABLES: Dict[str, List[Tuple[str, str]]] = {
+    "orders": [("id", "int64"), ("date", "date32"), ("shift", "dict"), ("order_no", "string"),
+               ("amount", "float64"), ("memo", "string")],
+    "expenses": [("id", "int64"), ("date", "date32"), ("category", "dict"), ("amount", "float64"),
+                 ("note", "string")],
+}
+
+
+class ArrowUnavailable(RuntimeError):
+    """沒有安裝 pyarrow；呼叫端應回 501。"""
+
+
+def _pa():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ArrowUnavailable("需要 pyarrow（pip install pyarrow）") from e
+    return pyarrow
+
+def available() -> bool:
+    try:
+        _pa()
+        return True
+    except ArrowUnavailable:
+        return False
+
+def _arrow_type(code: str):
+    pa = _pa()
+    return {"int64": pa.int64(), "date32": pa.date32(), "float64": pa.float64(), "string": pa.string(),
+            "dict": pa.dictionary(pa.int32(), pa.string())}[code]
+
+def schema(table: str):
+    pa = _pa()
+    return pa.schema([(name, _arrow_type(code)) for name, code in TABLES[table]])
+
+
+# ---------------- cursor → RecordBatch ----------------
+def _array(values: Sequence[Any], code: str):
+    pa = _pa()
+    if code == "dict":
+        return pa.array(values, pa.string()).dictionary_encode()
+    if code == "date32":
+        arr = pa.array(values)                         # date 物件或 ISO 字串都行
+        return arr if arr.type == pa.date32() else arr.cast(pa.date32())
+    if code == "float64":
+        try:
+            return pa.array(values, pa.float64())
+        except (TypeError, pa.ArrowInvalid, pa.ArrowTypeError):   # Decimal 等
+            return pa.array([None if v is None else float(v) for v in values], pa.float64())
+    return pa.array(values, _arrow_type(code))
+
+def batches(table: str, rows: Iterable[Sequence[Any]], size: int = BATCH_ROWS) -> Iterator[Any]:
+    """每 size 列轉置成欄、建一個 RecordBatch；記憶體只有一批。"""
+    pa = _pa()
+    sch, codes = schema(table), [code for _n, code in TABLES[table]]
+    it = iter(rows)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        cols = list(zip(*chunk))
+        yield pa.record_batch([_array(c, code) for c, code in zip(cols, codes)], schema=sch)
+
+
+# ---------------- Arrow IPC stream ----------------
+class _Sink:
+    """pyarrow 寫入的 bytes 暫存到被 drain() 取走（HTTP 串流用）。"""
+    closed = False
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def write(self, b) -> int:
+        self._buf += bytes(b)
+        return len(b)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out, self._buf = bytes(self._buf), bytearray()
+        return out
+
+def ipc_stream(table: str, rows: Callable[[], Iterable[Sequence[Any]]], compression: str = "none") -> Iterator[bytes]:
+    """rows 為函式，串流開始才呼叫（cursor 只在產生器內存在）；每個 record batch 送出一段。"""
+    pa = _pa()
+    sink = _Sink()
+    opts = pa.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+    with pa.ipc.new_stream(sink, schema(table), options=opts) as w:
+        yield sink.drain()                             # schema 先送，讀取端可以馬上開始
+        for b in batches(table, rows()):
+            w.write_batch(b)
+            yield sink.drain()
+    yield sink.drain()
+
+
+# ---------------- Parquet（依日期分割） ----------------
+def _partition_keys(dates, partition: str) -> np.ndarray:
+    """date32 陣列 → 每列的分割值（year=2024 / month=2024-01 / day=2024-01-02）。"""
+    d = dates.cast(_pa().int32()).to_numpy(zero_copy_only=False).astype("datetime64[D]")
+    unit = {"year": "Y", "month": "M", "day": "D"}[partition]
+    return np.datetime_as_string(d.astype(f"datetime64[{unit}]"), unit=unit)
+
+def write_dataset(table: str, rows: Iterable[Sequence[Any]], open_fn: Callable[[str], BinaryIO],
+                  partition: str = "month") -> Dict[str, int]:
+    """
+    寫成 {table}/{partition}={值}/part-{n}.parquet；回傳 {相對路徑: 列數}。
+    資料依日期排序時，每個分割值連續出現，同時只開著一個 ParquetWriter。
+    """
+    pa = _pa()
+    import pyarrow.parquet as pq
+    if partition not in PARTITIONS:
+        raise ValueError(f"未知的分割：{partition}")
+    sch = schema(table)
+    date_idx = sch.get_field_index("date")
+    files: Dict[str, int] = {}
+    parts: Dict[str, int] = {}
+    cur: Optional[Tuple[str, Any, Any]] = None        # (路徑, 檔案, writer)
+
+    def close():
+        if cur:
+            cur[2].close()
+            cur[1].close()
+    try:
+        for b in batches(table, rows):
+            keys = _partition_keys(b.column(date_idx), partition)
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            ends = np.r_[starts[1:], len(keys)]
+            for s, e in zip(starts, ends):
+                key = str(keys[s])
+                path = f"{table}/{partition}={key}/part-{parts.get(key, 0)}.parquet"
+                if cur is None or not cur[0].startswith(f"{table}/{partition}={key}/"):
+                    close()
+                    parts[key] = parts.get(key, 0) + 1
+                    f = open_fn(path)
+                    cur = (path, f, pq.ParquetWriter(f, sch, compression=PARQUET_COMPRESSION))
+                cur[2].write_batch(b.slice(s, e - s))
+                files[cur[0]] = files.get(cur[0], 0) + int(e - s)
+    finally:
+        close()
+    return files
+
+
+__all__ = ["MEDIA_TYPE_IPC", "BATCH_ROWS", "PARTITIONS", "IPC_COMPRESSIONS", "TABLES", "ArrowUnavailable",
+           "available", "schema", "batches", "ipc_stream", "write_dataset"]
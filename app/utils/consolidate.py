@@ -0,0 +1,197 @@
+# app/utils/consolidate.py
+# -*- coding: utf-8 -*-
+"""
+跨門市合併報表（總部用）：集團 KPI、時間序列、支出分類排行
+- 每家門市在子行程裡以唯讀連線查自己的 resto.db，只回「部分彙總」：
+    daily：[(日期, 類別, 金額)]（類別同 series：0=早班 1=晚班 2=支出，GROUP BY 日期）
+    categories：[(分類名稱, 金額)]（GROUP BY 分類 id 後才 JOIN 名稱）
+  主行程只做合併：各店日彙總串接後交給 series.dense（同一天自然相加），分類依名稱加總；
+  粒度（日 / 週 / 月）在合併時才決定，同一期間換粒度不必重查
+- 部分彙總以（DB 檔, 期間）快取，版本 = analytics.data_version（DB 與 -wal 的 mtime / 大小）：
+  沒有寫入的門市直接用快取，總部頁重新整理只會重跑有異動的門市
+- 單一門市查詢失敗（檔案不存在、鎖住…）列在 errors，其餘門市照常合併
+server.py 的 /api/v1/reports/group 與 scripts/group_report.py 共用。
+環境變數：
+  AURUM_GROUP_WORKERS   工作行程數（預設 min(CPU 核心數, 8)）
+  AURUM_GROUP_POOL      process（預設）或 thread（打包成 exe / 不能開子行程時用）
+  AURUM_GROUP_CACHE     快取筆數（門市 × 期間，預設 512）
+"""
+from __future__ import annotations
+
+import os, sqlite3, threading, time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import analytics, series
+
+GROUP_WORKERS = max(1, int(os.getenv("AURUM_GROUP_WORKERS", "0") or 0) or min(os.cpu_count() or 2, 8))
+GROUP_POOL_KIND = (os.getenv("AURUM_GROUP_POOL", "process") or "process").lower()
+CACHE_SIZE = max(1, int(os.getenv("AURUM_GROUP_CACHE", "512") or 512))
+
+# (門市代碼, 顯示名稱, DB 路徑)
+StoreRef = Tuple[str, str, str]
+
+
+# ---------------- 子行程內執行的函式（須為模組層級，才能 pickle） ----------------
+_DAILY_SQL = """
+SELECT date, CASE WHEN shift = 'MORNING' THEN 0 ELSE 1 END, SUM(amount)
+  FROM orders WHERE date BETWEEN :d1 AND :d2 GROUP BY date, shift
+UNION ALL
+SELECT date, 2, SUM(amount) FROM expenses WHERE date BETWEEN :d1 AND :d2 GROUP BY date
+"""
+_CATEGORY_SQL = """
+SELECT k.name, a.amount
+  FROM (SELECT category_id, SUM(amount) AS amount FROM expenses
+         WHERE date BETWEEN :d1 AND :d2 GROUP BY category_id) a
+  JOIN expense_categories k ON k.id = a.category_id
+"""
+# 還沒被 server / 桌機版遷移過的舊檔：分類仍是文字欄（唯讀連線不做遷移）
+_LEGACY_CATEGORY_SQL = """
+SELECT category, SUM(amount) FROM expenses WHERE date BETWEEN :d1 AND :d2 GROUP BY category
+"""
+
+def _store_job(path: str, d1: str, d2: str) -> Dict[str, Any]:
+    # mode=ro：不建檔、不寫入；門市 DB 不存在時直接丟錯
+    c = sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True, timeout=5)
+    try:
+        p = {"d1": d1, "d2": d2}
+        cols = {r[1] for r in c.execute("PRAGMA table_info(expenses)")}
+        daily = [(d, int(k), float(v or 0)) for d, k, v in c.execute(_DAILY_SQL, p)]
+        cats = c.execute(_CATEGORY_SQL if "category_id" in cols else _LEGACY_CATEGORY_SQL, p).fetchall()
+        return {"daily": daily, "categories": [(n, float(v or 0)) for n, v in cats]}
+    finally:
+        c.close()
+
+
+# ---------------- 執行器 ----------------
+_lock = threading.Lock()
+_pool: Optional[Executor] = None
+
+def _executor() -> Executor:
+    global _pool, GROUP_POOL_KIND
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                if GROUP_POOL_KIND == "process":
+                    try:
+                        _pool = ProcessPoolExecutor(max_workers=GROUP_WORKERS)
+                    except (OSError, NotImplementedError, PermissionError):
+                        GROUP_POOL_KIND = "thread"
+                if _pool is None:
+                    _pool = ThreadPoolExecutor(max_workers=GROUP_WORKERS, thread_name_prefix="group")
+    return _pool
+
+def shutdown() -> None:
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# ---------------- 快取 ----------------
+class PartialCache:
+    """(DB 檔, 期間) → (資料版本, 部分彙總)；LRU，資料版本不同視為未命中。"""
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Tuple[str, str, str], Tuple[Tuple, Dict[str, Any]]]" = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key: Tuple[str, str, str], ver: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit and hit[0] == ver:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[str, str, str], ver: Tuple, part: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data[key] = (ver, part)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+cache = PartialCache()
+
+
+# ---------------- 合併 ----------------
+def _kpi(daily: Sequence[Sequence[Any]]) -> Dict[str, float]:
+    sums = [0.0, 0.0, 0.0]
+    for _d, k, v in daily:
+        sums[k] += v
+    m, e, x = sums
+    return {"morning": m, "evening": e, "expense": x, "total": m + e, "net": m + e - x}
+
+def partials(stores: Sequence[StoreRef], d1: date, d2: date) -> Dict[str, Dict[str, Any]]:
+    """各門市的部分彙總（快取未命中的才丟進 pool 平行查）；失敗的門市回 {"error": …}。"""
+    a, b = d1.isoformat(), d2.isoformat()
+    out: Dict[str, Dict[str, Any]] = {}
+    todo = []
+    for sid, _name, path in stores:
+        key = (os.path.abspath(path), a, b)
+        ver = analytics.data_version(key[0])           # 先取版本：查詢期間有寫入，下次自然重查
+        t0 = time.perf_counter()
+        part = cache.get(key, ver)
+        if part is not None:
+            out[sid] = dict(part, cached=True, ms=round((time.perf_counter() - t0) * 1000, 2))
+        else:
+            todo.append((sid, key, ver, t0, _executor().submit(_store_job, key[0], a, b)))
+    for sid, key, ver, t0, fut in todo:
+        try:
+            part = fut.result()
+        except Exception as e:
+            out[sid] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        cache.put(key, ver, part)
+        out[sid] = dict(part, cached=False, ms=round((time.perf_counter() - t0) * 1000, 2))
+    return out
+
+def merge(stores: Sequence[StoreRef], parts: Dict[str, Dict[str, Any]], d1: date, d2: date,
+          grain: str) -> Dict[str, Any]:
+    rows: List[Sequence[Any]] = []
+    cats: Dict[str, float] = {}
+    per_store, errors = [], []
+    for sid, name, _path in stores:
+        p = parts.get(sid) or {"error": "not queried"}
+        if "error" in p:
+            errors.append({"store": sid, "name": name, "error": p["error"]})
+            continue
+        rows.extend(p["daily"])
+        for n, v in p["categories"]:
+            cats[n] = cats.get(n, 0.0) + v
+        per_store.append({"store": sid, "name": name, **_kpi(p["daily"]), "cached": p["cached"], "ms": p["ms"]})
+    s = series.dense(d1, d2, grain, rows)
+    s.update(date_from=d1, date_to=d2)
+    total_x = sum(cats.values())
+    ranked = sorted(cats.items(), key=lambda kv: -kv[1])
+    return {"date_from": d1, "date_to": d2, "grain": grain, "kpi": _kpi(rows),
+            "stores": sorted(per_store, key=lambda r: -r["total"]),
+            "categories": [{"category": n, "amount": v, "share": (v / total_x) if total_x else 0.0}
+                           for n, v in ranked],
+            "series": s, "errors": errors}
+
+def group_report(stores: Sequence[StoreRef], d1: date, d2: date, grain: str = "day") -> Dict[str, Any]:
+    """stores = [(門市代碼, 名稱, DB 路徑)]；回傳集團合計、各店 KPI、分類排行與合併時間序列。"""
+    if grain not in series.GRAINS:
+        raise ValueError(f"未知的粒度：{grain}")
+    return merge(stores, partials(stores, d1, d2), d1, d2, grain)
+
+def stats() -> Dict[str, Any]:
+    return {"workers": GROUP_WORKERS, "pool": GROUP_POOL_KIND, "cache_hits": cache.hits,
+            "cache_misses": cache.misses}
+
+
+__all__ = ["GROUP_WORKERS", "StoreRef", "PartialCache", "cache", "partials", "merge", "group_report",
+           "stats", "shutdown"]
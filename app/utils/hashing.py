@@ -0,0 +1,145 @@
+# app/utils/hashing.py
+# -*- coding: utf-8 -*-
+"""
+密碼雜湊專用執行器
+- PBKDF2 / bcrypt 都是刻意耗 CPU 的運算，放在 request 執行緒裡會把整個 threadpool 卡住
+- 這裡改丟到獨立的 process pool（預設 = CPU 核心數），呼叫端以 await 取得結果
+- 同時進行中的工作超過 HASH_QUEUE_LIMIT 時直接丟 HashBusy，由各 app 轉成 429
+- 工作行程意外結束時 pool 會永久 broken：丟掉重建一個新的，該筆再試一次
+- stats() 提供次數 / 拒絕數 / 重建次數 / 延遲（含排隊）統計
+環境變數：
+  AURUM_HASH_WORKERS   工作行程數（預設 os.cpu_count()）
+  AURUM_HASH_QUEUE     同時進行上限（預設 workers × 8）
+  AURUM_HASH_POOL      process（預設）或 thread（打包成 exe / 不能開子行程時用）
+"""
+from __future__ import annotations
+
+import asyncio, hashlib, hmac, os, threading, time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+HASH_WORKERS = max(1, int(os.getenv("AURUM_HASH_WORKERS", "0") or 0) or (os.cpu_count() or 2))
+HASH_QUEUE_LIMIT = max(1, int(os.getenv("AURUM_HASH_QUEUE", "0") or 0) or HASH_WORKERS * 8)
+HASH_POOL_KIND = (os.getenv("AURUM_HASH_POOL", "process") or "process").lower()
+RETRY_AFTER_SEC = 2
+
+
+class HashBusy(RuntimeError):
+    """雜湊佇列已滿；呼叫端應回 429 並帶 Retry-After。"""
+    retry_after = RETRY_AFTER_SEC
+
+
+# ---------------- 子行程內執行的函式（須為模組層級，才能 pickle） ----------------
+def _pbkdf2_job(pw: str, salt: bytes, rounds: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", pw.encode("utf-8"), salt, rounds)
+
+@lru_cache(maxsize=8)
+def _crypt_context(schemes: Tuple[str, ...]):
+    from passlib.context import CryptContext
+    return CryptContext(schemes=list(schemes), deprecated="auto")
+
+def _passlib_hash_job(schemes: Tuple[str, ...], plain: str) -> str:
+    return _crypt_context(schemes).hash(plain)
+
+def _passlib_verify_job(schemes: Tuple[str, ...], plain: str, hashed: str) -> bool:
+    try:
+        return _crypt_context(schemes).verify(plain, hashed)
+    except Exception:
+        return False
+
+
+# ---------------- 執行器 ----------------
+_lock = threading.Lock()
+_pool: Optional[Executor] = None
+_in_flight = 0
+_stats = {"count": 0, "errors": 0, "rejected": 0, "rebuilt": 0}
+_latency_ms: deque = deque(maxlen=1024)
+
+def _executor() -> Executor:
+    global _pool, HASH_POOL_KIND
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                if HASH_POOL_KIND == "process":
+                    try:
+                        _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+                    except (OSError, NotImplementedError, PermissionError):
+                        HASH_POOL_KIND = "thread"
+                if _pool is None:
+                    _pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hash")
+    return _pool
+
+def _discard(broken: Executor) -> None:
+    """丟掉 broken 的 pool（其他請求可能已先換過，只換一次）；下次 _executor() 重建。"""
+    global _pool
+    with _lock:
+        if _pool is broken:
+            _pool = None
+            _stats["rebuilt"] += 1
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def shutdown() -> None:
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+async def _run(fn, *args):
+    global _in_flight
+    with _lock:
+        if _in_flight >= HASH_QUEUE_LIMIT:
+            _stats["rejected"] += 1
+            raise HashBusy("雜湊佇列已滿，請稍後再試")
+        _in_flight += 1
+    t0 = time.perf_counter()
+    loop, pool = asyncio.get_running_loop(), _executor()
+    try:
+        try:
+            return await loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            _discard(pool)
+            return await loop.run_in_executor(_executor(), fn, *args)
+    except Exception:
+        with _lock: _stats["errors"] += 1
+        raise
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        with _lock:
+            _in_flight -= 1
+            _stats["count"] += 1
+            _latency_ms.append(ms)
+
+
+# ---------------- 對外 API ----------------
+async def pbkdf2_sha256(pw: str, salt: bytes, rounds: int) -> bytes:
+    return await _run(_pbkdf2_job, pw, salt, int(rounds))
+
+async def pbkdf2_verify(pw: str, salt: bytes, rounds: int, expect: bytes) -> bool:
+    dk = await pbkdf2_sha256(pw, salt, rounds)
+    return hmac.compare_digest(dk, expect)
+
+async def passlib_hash(schemes: Tuple[str, ...], plain: str) -> str:
+    return await _run(_passlib_hash_job, tuple(schemes), plain)
+
+async def passlib_verify(schemes: Tuple[str, ...], plain: str, hashed: str) -> bool:
+    return await _run(_passlib_verify_job, tuple(schemes), plain, hashed)
+
+
+def stats() -> Dict[str, float]:
+    with _lock:
+        lat = sorted(_latency_ms)
+        out = dict(_stats, in_flight=_in_flight, queue_limit=HASH_QUEUE_LIMIT,
+                   workers=HASH_WORKERS, pool=HASH_POOL_KIND)
+    pick = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))], 2) if lat else 0.0
+    out.update(p50_ms=pick(0.50), p95_ms=pick(0.95), p99_ms=pick(0.99),
+               max_ms=round(lat[-1], 2) if lat else 0.0,
+               avg_ms=round(sum(lat) / len(lat), 2) if lat else 0.0)
+    return out
+
+
+__all__ = ["HashBusy", "HASH_WORKERS", "HASH_QUEUE_LIMIT", "pbkdf2_sha256", "pbkdf2_verify",
+           "passlib_hash", "passlib_verify", "stats", "shutdown"]
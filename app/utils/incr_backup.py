@@ -0,0 +1,366 @@
+# app/utils/incr_backup.py
+# -*- coding: utf-8 -*-
+"""
+增量備份引擎（內容定址 + 去重）
+- 取得 SQLite 一致性快照後，以固定頁數（CHUNK_PAGES 頁）切塊並計算 SHA-256
+- 只把「倉庫裡還沒有的塊」以 zlib 壓縮寫入 objects/；每次快照另存一份 manifest
+- 支援：建立快照、列出快照、還原到指定時間點、依保留數/天數清理並回收無用的塊
+倉庫結構：
+  <store>/objects/ab/abcdef....   （壓縮後的塊）
+  <store>/snapshots/<id>.json      （manifest）
+  <store>/lock                     （倉庫鎖：建立快照與清理互斥，避免回收到寫到一半的塊）
+只用標準函式庫，桌機版與 Web 版共用。
+"""
+from __future__ import annotations
+
+import hashlib, json, os, sqlite3, tempfile, time, zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+CHUNK_PAGES = 16          # 每塊頁數（4 KiB 頁 → 64 KiB 一塊）
+MANIFEST_VERSION = 1
+LOCK_TIMEOUT = float(os.getenv("AURUM_BACKUP_LOCK_TIMEOUT", "600"))   # 等倉庫鎖的秒數（大 DB 快照可能要幾分鐘）
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+# ---------------- 倉庫路徑 ----------------
+def _objects_dir(store: Path) -> Path:
+    return store / "objects"
+
+def _snapshots_dir(store: Path) -> Path:
+    return store / "snapshots"
+
+def _object_path(store: Path, digest: str) -> Path:
+    return _objects_dir(store) / digest[:2] / digest
+
+def default_store_for(db_path: str | os.PathLike) -> Path:
+    """預設倉庫：與 DB 同目錄的 <db 檔名>.backups/"""
+    p = Path(db_path).resolve()
+    return p.with_name(p.name + ".backups")
+
+
+# ---------------- 倉庫鎖 ----------------
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(f) -> bool:
+        try:
+            f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1); return True
+        except OSError:
+            return False
+
+    def _unlock(f) -> None:
+        f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(f) -> bool:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB); return True
+        except OSError:
+            return False
+
+    def _unlock(f) -> None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def _repo_lock(store: Path, timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+    """
+    倉庫層級的排他鎖（<store>/lock，OS 檔案鎖，行程結束自動釋放，不會留下殭屍鎖）。
+    snapshot 先寫塊、最後才寫 manifest；中間若 prune 掃過，這些塊既沒被引用又可能是 .tmp，
+    會被當垃圾刪掉 → 兩者必須互斥。同一行程的不同執行緒也互斥。
+    """
+    store.mkdir(parents=True, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    with open(store / "lock", "a+b") as f:
+        while not _try_lock(f):
+            if time.monotonic() >= deadline:
+                raise BackupError(f"備份倉庫忙碌中（另一個快照或清理正在執行）：{store}")
+            time.sleep(0.2)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+# ---------------- 一致性快照 ----------------
+@contextmanager
+def _consistent_source(db_path: Path) -> Iterator[Path]:
+    """
+    回傳一個「可直接逐頁讀取」且內容一致的檔案路徑。
+    - rollback journal 模式：開讀取交易持有 SHARED lock，期間寫入者無法 commit，直接讀原檔
+    - WAL 模式：最新內容可能還在 -wal，改用 sqlite backup API 先複製到暫存檔
+    """
+    src = sqlite3.connect(str(db_path), isolation_level=None, timeout=30)
+    try:
+        mode = (src.execute("PRAGMA journal_mode").fetchone()[0] or "").lower()
+        if mode != "wal":
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()   # 取得 SHARED lock
+            try:
+                yield db_path
+            finally:
+                src.execute("COMMIT")
+            return
+        fd, tmp = tempfile.mkstemp(prefix="snap-", suffix=".db", dir=str(db_path.parent))
+        os.close(fd)
+        try:
+            dst = sqlite3.connect(tmp)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+            yield Path(tmp)
+        finally:
+            try: os.remove(tmp)
+            except OSError: pass
+    finally:
+        src.close()
+
+
+def _page_size(db_path: Path) -> int:
+    with open(db_path, "rb") as f:
+        head = f.read(100)
+    if len(head) < 100 or not head.startswith(b"SQLite format 3\x00"):
+        raise BackupError(f"不是 SQLite 資料庫：{db_path}")
+    size = int.from_bytes(head[16:18], "big")
+    return 65536 if size == 1 else size
+
+
+def _put_object(store: Path, digest: str, data: bytes) -> bool:
+    """寫入一個塊；已存在則略過。回傳是否為新塊。"""
+    p = _object_path(store, digest)
+    if p.exists():
+        return False
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(zlib.compress(data, 6))
+    os.replace(tmp, p)
+    return True
+
+
+# ---------------- 建立快照 ----------------
+def snapshot(db_path: str | os.PathLike, store: str | os.PathLike | None = None,
+             label: str = "") -> Dict:
+    """建立一次增量快照，回傳 manifest（含 new_chunks / new_bytes 統計）。"""
+    db = Path(db_path).resolve()
+    if not db.exists():
+        raise BackupError(f"找不到資料庫：{db}")
+    st = Path(store) if store else default_store_for(db)
+    with _repo_lock(st):
+        return _snapshot_locked(db, st, label)
+
+
+def _snapshot_locked(db: Path, st: Path, label: str) -> Dict:
+    _objects_dir(st).mkdir(parents=True, exist_ok=True)
+    _snapshots_dir(st).mkdir(parents=True, exist_ok=True)
+
+    chunks: List[str] = []
+    new_chunks = new_bytes = total = 0
+    whole = hashlib.sha256()
+    with _consistent_source(db) as src:
+        page_size = _page_size(src)
+        chunk_size = page_size * CHUNK_PAGES
+        with open(src, "rb") as f:
+            while True:
+                buf = f.read(chunk_size)
+                if not buf:
+                    break
+                total += len(buf)
+                whole.update(buf)
+                digest = hashlib.sha256(buf).hexdigest()
+                if _put_object(st, digest, buf):
+                    new_chunks += 1; new_bytes += len(buf)
+                chunks.append(digest)
+
+    now = datetime.now()
+    snap_id = now.strftime("%Y%m%d-%H%M%S-%f")
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "id": snap_id,
+        "created": now.isoformat(timespec="seconds"),
+        "label": label,
+        "source": str(db),
+        "page_size": page_size,
+        "chunk_size": chunk_size,
+        "size": total,
+        "sha256": whole.hexdigest(),
+        "chunks": chunks,
+        "new_chunks": new_chunks,
+        "new_bytes": new_bytes,
+    }
+    tmp = _snapshots_dir(st) / f"{snap_id}.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, _snapshots_dir(st) / f"{snap_id}.json")
+    return manifest
+
+
+# ---------------- 查詢 ----------------
+def _read_manifest(p: Path) -> Optional[Dict]:
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def list_snapshots(store: str | os.PathLike) -> List[Dict]:
+    """由舊到新列出快照（不含 chunks 清單，避免大量資料）。"""
+    out = []
+    sd = _snapshots_dir(Path(store))
+    if not sd.exists():
+        return out
+    for p in sorted(sd.glob("*.json")):
+        m = _read_manifest(p)
+        if not m:
+            continue
+        out.append({k: v for k, v in m.items() if k != "chunks"} | {"chunk_count": len(m.get("chunks", []))})
+    return out
+
+def _find(store: Path, at: str) -> Dict:
+    """
+    at 可為：快照 id、'latest'、或時間點（YYYY-MM-DD[THH:MM[:SS]]，取該時間點以前最新的一份）
+    """
+    snaps = list_snapshots(store)
+    if not snaps:
+        raise BackupError("倉庫內沒有任何快照")
+    if at in ("", "latest"):
+        pick = snaps[-1]
+    else:
+        pick = next((s for s in snaps if s["id"] == at), None)
+        if pick is None:
+            try:
+                t = datetime.fromisoformat(at)
+            except ValueError:
+                raise BackupError(f"找不到快照：{at}")
+            older = [s for s in snaps if datetime.fromisoformat(s["created"]) <= t]
+            if not older:
+                raise BackupError(f"{at} 以前沒有快照")
+            pick = older[-1]
+    m = _read_manifest(_snapshots_dir(store) / f"{pick['id']}.json")
+    if not m:
+        raise BackupError(f"manifest 損毀：{pick['id']}")
+    return m
+
+
+# ---------------- 還原 ----------------
+def materialize(store: str | os.PathLike, at: str, out_path: str | os.PathLike) -> Dict:
+    """把快照組回一個完整 DB 檔（會驗證整體 SHA-256）。"""
+    st = Path(store)
+    m = _find(st, at)
+    out = Path(out_path)
+    tmp = out.with_name(out.name + ".restore.tmp")
+    whole = hashlib.sha256()
+    missing = None
+    with open(tmp, "wb") as f:
+        for digest in m["chunks"]:
+            p = _object_path(st, digest)
+            try:
+                with open(p, "rb") as cf:
+                    data = zlib.decompress(cf.read())
+            except FileNotFoundError:
+                missing = digest
+                break
+            whole.update(data)
+            f.write(data)
+    if missing:
+        os.remove(tmp)
+        raise BackupError(f"缺少資料塊：{missing}")
+    if whole.hexdigest() != m["sha256"]:
+        os.remove(tmp)
+        raise BackupError(f"快照 {m['id']} 校驗失敗")
+    os.replace(tmp, out)
+    return m
+
+def restore(store: str | os.PathLike, at: str, db_path: str | os.PathLike) -> Dict:
+    """
+    還原到指定時間點。
+    目標 DB 存在時以 sqlite backup API 寫回（其他連線持有中也安全），否則直接放檔。
+    """
+    db = Path(db_path).resolve()
+    if not db.exists():
+        return materialize(store, at, db)
+    fd, tmp = tempfile.mkstemp(prefix="restore-", suffix=".db", dir=str(db.parent))
+    os.close(fd)
+    try:
+        m = materialize(store, at, tmp)
+        src = sqlite3.connect(tmp)
+        dst = sqlite3.connect(str(db), timeout=30)
+        try:
+            src.backup(dst)
+        finally:
+            src.close(); dst.close()
+        return m
+    finally:
+        try: os.remove(tmp)
+        except OSError: pass
+
+
+# ---------------- 清理 ----------------
+def prune(store: str | os.PathLike, keep_last: int = 24, keep_days: int = 0) -> Dict[str, int]:
+    """
+    保留最新 keep_last 份；keep_days>0 時，該天數內的快照也一律保留。
+    之後回收不再被任何 manifest 引用的塊。
+    """
+    st = Path(store)
+    if not st.exists():
+        return {"snapshots_removed": 0, "objects_removed": 0, "bytes_freed": 0}
+    with _repo_lock(st):
+        return _prune_locked(st, keep_last, keep_days)
+
+
+def _prune_locked(st: Path, keep_last: int, keep_days: int) -> Dict[str, int]:
+    snaps = list_snapshots(st)
+    keep = {s["id"] for s in snaps[-keep_last:]} if keep_last > 0 else set()
+    if keep_days > 0:
+        since = datetime.now() - timedelta(days=keep_days)
+        keep |= {s["id"] for s in snaps if datetime.fromisoformat(s["created"]) >= since}
+    removed = 0
+    for s in snaps:
+        if s["id"] not in keep:
+            try:
+                os.remove(_snapshots_dir(st) / f"{s['id']}.json"); removed += 1
+            except OSError:
+                pass
+
+    live = set()
+    for p in _snapshots_dir(st).glob("*.json"):
+        m = _read_manifest(p)
+        if m: live.update(m.get("chunks", []))
+    freed_objects = freed_bytes = 0
+    od = _objects_dir(st)
+    if od.exists():
+        for sub in od.iterdir():
+            if not sub.is_dir():
+                continue
+            for obj in sub.iterdir():
+                # 持有倉庫鎖時不會有進行中的快照，殘留的 .tmp 只可能是中斷的寫入
+                if obj.name.endswith(".tmp") or obj.name not in live:
+                    try:
+                        freed_bytes += obj.stat().st_size
+                        obj.unlink(); freed_objects += 1
+                    except OSError:
+                        pass
+            try: sub.rmdir()
+            except OSError: pass
+    return {"snapshots_removed": removed, "objects_removed": freed_objects, "bytes_freed": freed_bytes}
+
+
+def store_size(store: str | os.PathLike) -> int:
+    total = 0
+    for root, _, files in os.walk(store):
+        for fn in files:
+            try: total += os.path.getsize(os.path.join(root, fn))
+            except OSError: pass
+    return total
+
+
+__all__ = ["BackupError", "CHUNK_PAGES", "default_store_for", "snapshot", "list_snapshots",
+           "materialize", "restore", "prune", "store_size"]
@@ -0,0 +1,437 @@
+# app/utils/jobs.py
+# -*- coding: utf-8 -*-
+"""
+背景工作佇列（大量匯入、匯出、備份不再綁在 HTTP request / GUI 執行緒上）
+- 佇列存在 SQLite（<DB 檔名>.jobs/jobs.db）：enqueue 只寫一列就回 job id，重啟後佇列還在
+- 同行程內 JOB_WORKERS 條工作執行緒，以單一 UPDATE … RETURNING 原子地領取工作（多行程共用同一佇列也安全），
+  只領自己有 register 的種類
+- 處理函式簽名 fn(ctx, **params)：ctx.progress() 回報進度（節流寫 DB，同時檢查取消）、
+  ctx.artifact(檔名) 取得產出檔路徑（放在 artifacts/<job id>/，下載端點直接送檔）
+- 失敗自動重試：第 n 次失敗後延後 RETRY_BASE_SEC × 2^(n-1) 秒再排；用完 max_attempts 標為 failed
+  （處理函式丟 JobFailed 表示重試無用，直接 failed）
+- 當機復原：執行中的工作每 HEARTBEAT_SEC 更新心跳；心跳超過 STALE_SEC 沒更新（行程被砍 / 當機）
+  的工作由任一存活行程放回佇列（次數用完則 failed）
+- 完成超過 TTL_HOURS 的工作連同產出檔自動清掉
+狀態：queued → running → done / failed / cancelled（running 失敗可重試時回到 queued）
+環境變數：
+  AURUM_JOB_WORKERS     工作執行緒數（預設 2）
+  AURUM_JOB_ATTEMPTS    預設最多嘗試次數（預設 3）
+  AURUM_JOB_RETRY       重試基準秒數（預設 5）
+  AURUM_JOB_TTL_HOURS   完成的工作保留時數（預設 72）
+"""
+from __future__ import annotations
+
+import json, logging, os, shutil, socket, sqlite3, threading, time, uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+JOB_WORKERS = max(1, int(os.getenv("AURUM_JOB_WORKERS", "2") or 2))
+MAX_ATTEMPTS = max(1, int(os.getenv("AURUM_JOB_ATTEMPTS", "3") or 3))
+RETRY_BASE_SEC = float(os.getenv("AURUM_JOB_RETRY", "5") or 5)
+TTL_HOURS = float(os.getenv("AURUM_JOB_TTL_HOURS", "72") or 72)
+HEARTBEAT_SEC = 10.0
+STALE_SEC = HEARTBEAT_SEC * 6
+POLL_SEC = 1.0                      # 沒被喚醒時多久看一次佇列（其他行程排進來的、延後重試的）
+PROGRESS_EVERY_SEC = 0.5            # 進度寫 DB 的最短間隔
+STATUSES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED = ("done", "failed", "cancelled")
+
+log = logging.getLogger("aurum.jobs")
+
+Handler = Callable[..., Any]
+
+
+class UnknownJobKind(ValueError):
+    """enqueue 了沒有 register 的種類。"""
+
+
+class JobFailed(Exception):
+    """資料本身有問題（欄位缺少、違反唯一鍵…），重試也不會成功：直接標為 failed。"""
+
+
+class JobCancelled(Exception):
+    """工作被取消；由 ctx.progress() / ctx.check() 丟出，處理函式不必攔。"""
+
+
+def default_dir_for(db_path: Union[str, os.PathLike]) -> Path:
+    """預設佇列目錄：與 DB 同目錄的 <db 檔名>.jobs/"""
+    p = Path(db_path).resolve()
+    return p.with_name(p.name + ".jobs")
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id TEXT PRIMARY KEY,
+  kind TEXT NOT NULL,
+  store TEXT NOT NULL DEFAULT '',
+  owner TEXT NOT NULL DEFAULT '',
+  params TEXT NOT NULL DEFAULT '{}',
+  status TEXT NOT NULL DEFAULT 'queued',
+  progress REAL NOT NULL DEFAULT 0,
+  message TEXT NOT NULL DEFAULT '',
+  result TEXT,
+  error TEXT,
+  artifact TEXT,
+  media_type TEXT,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  max_attempts INTEGER NOT NULL DEFAULT 3,
+  cancel INTEGER NOT NULL DEFAULT 0,
+  worker TEXT,
+  created REAL NOT NULL,
+  run_after REAL NOT NULL,
+  started REAL,
+  finished REAL,
+  heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_claim ON jobs(status, run_after);
+CREATE INDEX IF NOT EXISTS ix_jobs_owner ON jobs(owner, store, created);
+"""
+
+
+# ---------------- 處理函式拿到的 context ----------------
+class JobContext:
+    def __init__(self, queue: "JobQueue", row: sqlite3.Row):
+        self.queue = queue
+        self.id: str = row["id"]
+        self.kind: str = row["kind"]
+        self.store: str = row["store"]
+        self.owner: str = row["owner"]
+        self.params: Dict[str, Any] = json.loads(row["params"] or "{}")
+        self.attempt: int = row["attempts"]
+        self.dir = queue.job_dir(self.id)
+        self.done = 0
+        self.total: Optional[int] = None
+        self._last = 0.0
+
+    def check(self) -> None:
+        """被取消就丟 JobCancelled。"""
+        if self.queue._cancel_requested(self.id):
+            raise JobCancelled(self.id)
+
+    def progress(self, done: float, total: Optional[float] = None, message: Optional[str] = None,
+                 force: bool = False) -> None:
+        """done / total（total 省略時 done 即 0~1 的比例）；最多每 PROGRESS_EVERY_SEC 寫一次 DB。"""
+        now = time.monotonic()
+        if not force and now - self._last < PROGRESS_EVERY_SEC:
+            return
+        self._last = now
+        frac = done if total is None else (done / total if total else 0.0)
+        self.queue._progress(self.id, max(0.0, min(1.0, float(frac))), message)
+        self.check()
+
+    def track(self, items: Iterable[Any], message: str = "") -> Iterator[Any]:
+        """
+        逐項產出並累計到 ctx.done，每 1000 項回報一次；ctx.total 為整個工作的總項數（處理函式先設，
+        未知時為 None，只顯示筆數）。同一工作內多段 track 接續累計。
+        """
+        for x in items:
+            yield x
+            self.done += 1
+            if self.done % 1000 == 0:
+                self.progress(self.done if self.total else 0.0, self.total,
+                              f"{message}{self.done:,}" + (f" / {self.total:,}" if self.total else ""))
+
+    def input(self, name: str) -> Path:
+        """enqueue 時附上的輸入檔（例如上傳的 CSV）。"""
+        return self.dir / "input" / name
+
+    def artifact(self, name: str, media_type: str = "application/octet-stream") -> Path:
+        """產出檔路徑；重試時覆寫同一個檔。下載時以 name 為檔名。"""
+        out = self.dir / "out"
+        out.mkdir(parents=True, exist_ok=True)
+        self.queue._exec("UPDATE jobs SET artifact = ?, media_type = ? WHERE id = ?", (name, media_type, self.id))
+        return out / name
+
+
+# ---------------- 佇列 ----------------
+class JobQueue:
+    def __init__(self, root: Union[str, os.PathLike], workers: int = JOB_WORKERS, name: str = "jobs"):
+        self.root = Path(root)
+        self.path = self.root / "jobs.db"
+        self.workers = max(1, int(workers))
+        self.name = name
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, Tuple[Handler, int]] = {}
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._ready = False
+        self.runs = self.failures = self.retries = self.recovered = 0
+
+    # ---- DB ----
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    self.root.mkdir(parents=True, exist_ok=True)
+                    c = sqlite3.connect(self.path, timeout=30)
+                    try:
+                        c.execute("PRAGMA journal_mode=WAL")
+                        c.executescript(_SCHEMA)
+                    finally:
+                        c.close()
+                    self._ready = True
+        c = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        c.row_factory = sqlite3.Row
+        return c
+
+    def _exec(self, sql: str, args: Tuple = ()) -> int:
+        c = self._connect()
+        try:
+            return c.execute(sql, args).rowcount
+        finally:
+            c.close()
+
+    def _one(self, sql: str, args: Tuple = ()) -> Optional[sqlite3.Row]:
+        c = self._connect()
+        try:
+            return c.execute(sql, args).fetchone()
+        finally:
+            c.close()
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.root / "artifacts" / job_id
+
+    # ---- 註冊 / 啟停 ----
+    def register(self, kind: str, fn: Handler, max_attempts: int = MAX_ATTEMPTS) -> Handler:
+        self._handlers[kind] = (fn, max(1, int(max_attempts)))
+        if self._threads:
+            self._wake.set()
+        return fn
+
+    def kinds(self) -> List[str]:
+        return sorted(self._handlers)
+
+    def start(self) -> "JobQueue":
+        """開工作執行緒與監督執行緒；重複呼叫無作用。啟動時先收回上次當掉留下的工作。"""
+        with self._lock:
+            if self._threads:
+                return self
+            self._stop.clear()
+        self.recover()
+        self._threads = [threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+                         for i in range(self.workers)]
+        self._threads.append(threading.Thread(target=self._supervise, name=f"{self.name}-sup", daemon=True))
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止領新工作；執行中的工作在 timeout 內沒結束的，下次啟動（或其他行程）會依心跳收回重跑。"""
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    # ---- 排入 / 查詢 ----
+    def enqueue(self, kind: str, params: Optional[Dict[str, Any]] = None, *, store: str = "", owner: str = "",
+                inputs: Optional[Dict[str, Union[bytes, BinaryIO]]] = None, delay: float = 0.0) -> Dict[str, Any]:
+        """排入一個工作；inputs = {檔名: bytes 或檔案物件}，先寫進工作目錄（大檔以串流複製）。"""
+        if kind not in self._handlers:
+            raise UnknownJobKind(kind)
+        job_id = uuid.uuid4().hex
+        for name, data in (inputs or {}).items():
+            p = self.job_dir(job_id) / "input" / Path(name).name
+            p.parent.mkdir(parents=True, exist_ok=True)
+            with open(p, "wb") as f:
+                if isinstance(data, (bytes, bytearray)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f, 1 << 20)
+        now = time.time()
+        self._exec("INSERT INTO jobs (id, kind, store, owner, params, max_attempts, created, run_after) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                   (job_id, kind, store, owner, json.dumps(params or {}, default=str, ensure_ascii=False),
+                    self._handlers[kind][1], now, now + delay))
+        self._wake.set()
+        return self.get(job_id)
+
+    @staticmethod
+    def _public(r: sqlite3.Row) -> Dict[str, Any]:
+        return {"id": r["id"], "kind": r["kind"], "store": r["store"], "owner": r["owner"],
+                "params": json.loads(r["params"] or "{}"), "status": r["status"],
+                "progress": round(r["progress"], 4), "message": r["message"],
+                "result": json.loads(r["result"]) if r["result"] else None, "error": r["error"],
+                "attempts": r["attempts"], "max_attempts": r["max_attempts"],
+                "artifact": r["artifact"] if r["status"] == "done" else None,
+                "created": _iso(r["created"]), "started": _iso(r["started"]), "finished": _iso(r["finished"])}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        r = self._one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._public(r) if r else None
+
+    def list(self, owner: Optional[str] = None, store: Optional[str] = None, status: Optional[str] = None,
+             limit: int = 50) -> List[Dict[str, Any]]:
+        cond, args = [], []
+        for col, v in (("owner", owner), ("store", store), ("status", status)):
+            if v is not None:
+                cond.append(f"{col} = ?")
+                args.append(v)
+        where = ("WHERE " + " AND ".join(cond)) if cond else ""
+        c = self._connect()
+        try:
+            rows = c.execute(f"SELECT * FROM jobs {where} ORDER BY created DESC LIMIT ?", (*args, int(limit)))
+            return [self._public(r) for r in rows]
+        finally:
+            c.close()
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """排隊中的直接取消；執行中的設旗標，下次 ctx.progress() 時停下。"""
+        now = time.time()
+        self._exec("UPDATE jobs SET status = 'cancelled', finished = ?, message = '已取消' "
+                   "WHERE id = ? AND status = 'queued'", (now, job_id))
+        self._exec("UPDATE jobs SET cancel = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return self.get(job_id)
+
+    def artifact(self, job_id: str) -> Optional[Tuple[Path, str, str]]:
+        """完成工作的產出檔 → (路徑, 下載檔名, media type)；沒有則 None。"""
+        r = self._one("SELECT artifact, media_type FROM jobs WHERE id = ? AND status = 'done'", (job_id,))
+        if not r or not r["artifact"]:
+            return None
+        p = self.job_dir(job_id) / "out" / r["artifact"]
+        return (p, r["artifact"], r["media_type"] or "application/octet-stream") if p.is_file() else None
+
+    def stats(self) -> Dict[str, Any]:
+        c = self._connect()
+        try:
+            counts = dict(c.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        finally:
+            c.close()
+        return {"workers": self.workers, "started": bool(self._threads), "kinds": self.kinds(),
+                **{s: counts.get(s, 0) for s in STATUSES}, "runs": self.runs, "failures": self.failures,
+                "retries": self.retries, "recovered": self.recovered}
+
+    # ---- 內部：狀態更新 ----
+    def _cancel_requested(self, job_id: str) -> bool:
+        r = self._one("SELECT cancel FROM jobs WHERE id = ?", (job_id,))
+        return bool(r is None or r["cancel"])
+
+    def _progress(self, job_id: str, frac: float, message: Optional[str]) -> None:
+        if message is None:
+            self._exec("UPDATE jobs SET progress = ?, heartbeat = ? WHERE id = ?", (frac, time.time(), job_id))
+        else:
+            self._exec("UPDATE jobs SET progress = ?, message = ?, heartbeat = ? WHERE id = ?",
+                       (frac, message, time.time(), job_id))
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        kinds = self.kinds()
+        if not kinds:
+            return None
+        now = time.time()
+        marks = ",".join("?" * len(kinds))
+        c = self._connect()
+        try:
+            # 單一敘述：選取與改狀態在同一個寫入交易裡，兩條執行緒 / 兩個行程不會領到同一筆
+            return c.execute(
+                f"UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, started = ?, "
+                f"heartbeat = ?, progress = 0, error = NULL "
+                f"WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND run_after <= ? AND kind IN ({marks}) "
+                f"ORDER BY run_after, created LIMIT 1) AND status = 'queued' RETURNING *",
+                (self.worker_id, now, now, now, *kinds)).fetchone()
+        finally:
+            c.close()
+
+    def _finish(self, job_id: str, status: str, **cols: Any) -> None:
+        sets = ", ".join(f"{k} = ?" for k in cols)
+        self._exec(f"UPDATE jobs SET status = ?, finished = ?, worker = NULL{', ' + sets if sets else ''} "
+                   f"WHERE id = ?", (status, time.time(), *cols.values(), job_id))
+
+    def _run(self, row: sqlite3.Row) -> None:
+        fn, _max = self._handlers[row["kind"]]
+        ctx = JobContext(self, row)
+        self.runs += 1
+        t0 = time.perf_counter()
+        try:
+            result = fn(ctx, **ctx.params)
+        except JobCancelled:
+            self._finish(ctx.id, "cancelled", message="已取消")
+            shutil.rmtree(ctx.dir / "out", ignore_errors=True)
+        except JobFailed as e:
+            self.failures += 1
+            self._finish(ctx.id, "failed", error=str(e), message="失敗")
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"
+            log.exception("job %s (%s) 第 %d 次失敗", ctx.id, ctx.kind, row["attempts"])
+            if row["attempts"] < row["max_attempts"] and not self._cancel_requested(ctx.id):
+                self.retries += 1
+                wait = RETRY_BASE_SEC * 2 ** (row["attempts"] - 1)
+                self._exec("UPDATE jobs SET status = 'queued', worker = NULL, error = ?, run_after = ?, "
+                           "message = ? WHERE id = ?",
+                           (err, time.time() + wait, f"失敗，{wait:.0f} 秒後重試", ctx.id))
+            else:
+                self.failures += 1
+                self._finish(ctx.id, "failed", error=err, message="失敗")
+        else:
+            self._finish(ctx.id, "done", progress=1.0, message=f"完成（{time.perf_counter() - t0:.1f}s）",
+                         result=json.dumps(result, default=str, ensure_ascii=False) if result is not None else None)
+
+    # ---- 內部：執行緒 ----
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                row = self._claim()
+            except sqlite3.Error:
+                log.exception("領取工作失敗")
+                row = None
+            if row is None:
+                self._wake.wait(POLL_SEC)
+                self._wake.clear()
+                continue
+            self._run(row)
+
+    def recover(self) -> int:
+        """心跳逾時的 running 工作：還有次數的放回佇列，否則標為 failed。回傳處理筆數。"""
+        now = time.time()
+        c = self._connect()
+        try:
+            n = c.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts AND cancel = 0 THEN 'queued' "
+                "ELSE 'failed' END, "
+                "finished = CASE WHEN attempts < max_attempts AND cancel = 0 THEN NULL ELSE ? END, "
+                "error = '執行中斷（行程結束或當機）', worker = NULL, run_after = ? "
+                "WHERE status = 'running' AND COALESCE(heartbeat, 0) < ? AND COALESCE(worker, '') != ?",
+                (now, now, now - STALE_SEC, self.worker_id)).rowcount
+        finally:
+            c.close()
+        if n:
+            self.recovered += n
+            log.warning("收回 %d 個中斷的工作", n)
+            self._wake.set()
+        return n
+
+    def prune(self) -> int:
+        """刪掉完成超過 TTL_HOURS 的工作與其檔案。"""
+        cutoff = time.time() - TTL_HOURS * 3600
+        c = self._connect()
+        try:
+            ids = [r[0] for r in c.execute(
+                f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED))}) AND finished < ? RETURNING id",
+                (*FINISHED, cutoff))]
+        finally:
+            c.close()
+        for job_id in ids:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return len(ids)
+
+    def _supervise(self) -> None:
+        last_prune = 0.0
+        while not self._stop.wait(HEARTBEAT_SEC):
+            try:
+                self._exec("UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND worker = ?",
+                           (time.time(), self.worker_id))
+                self.recover()
+                if time.monotonic() - last_prune > 600:
+                    last_prune = time.monotonic()
+                    self.prune()
+            except sqlite3.Error:
+                log.exception("工作佇列監督失敗")
+
+
+__all__ = ["JOB_WORKERS", "MAX_ATTEMPTS", "STATUSES", "FINISHED", "UnknownJobKind", "JobFailed", "JobCancelled",
+           "JobContext", "JobQueue", "default_dir_for"]
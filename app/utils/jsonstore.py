@@ -0,0 +1,126 @@
+# app/utils/jsonstore.py
+# -*- coding: utf-8 -*-
+"""
+小型 JSON 設定 / 帳號檔快取（auth.json、settings.json）
+- 讀：解析結果留在記憶體，每次只做一次 os.stat；mtime / inode / size 有變才重新解析
+- 寫：先寫暫存檔再 os.replace（不會留下寫一半的檔案）
+- debounce > 0 時延遲寫入，期間多次 save 只落地最後一次；程式結束時 atexit 一律補寫
+同一個路徑在同一行程內共用一個 JsonStore（store_for），server.py / web_ui / 桌機版皆用此模組。
+"""
+from __future__ import annotations
+
+import atexit, copy, json, os, threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+class JsonStore:
+    def __init__(self, path: str | os.PathLike, debounce: float = 0.0,
+                 indent: Optional[int] = 2, quarantine_broken: bool = False):
+        self.path = Path(path)
+        self.debounce = float(debounce)
+        self.indent = indent
+        self.quarantine_broken = quarantine_broken   # 解析失敗時改名為 .broken（桌機版舊行為）
+        self._lock = threading.RLock()
+        self._sig: Optional[Tuple[int, int, int]] = None
+        self._data: Any = None
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+
+    # ---------------- 讀 ----------------
+    def _stat_sig(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def load(self) -> Optional[Any]:
+        """回傳解析後內容的複本；檔案不存在或損毀時回 None。"""
+        with self._lock:
+            if self._dirty:                       # 尚未落地的寫入最新
+                return copy.deepcopy(self._data)
+            sig = self._stat_sig()
+            if sig is None:
+                self._sig, self._data = None, None
+                return None
+            if sig != self._sig:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._data = json.load(f)
+                except (OSError, ValueError):
+                    self._data = None
+                    if self.quarantine_broken:
+                        try: os.replace(self.path, str(self.path) + ".broken")
+                        except OSError: pass
+                        sig = None
+                self._sig = sig
+            return copy.deepcopy(self._data)
+
+    def exists(self) -> bool:
+        with self._lock:
+            return self._dirty or self._stat_sig() is not None
+
+    # ---------------- 寫 ----------------
+    def save(self, data: Any) -> None:
+        """更新記憶體內容；debounce=0 時立即落地，否則延遲合併寫入。"""
+        with self._lock:
+            self._data = copy.deepcopy(data)
+            self._dirty = True
+            if self.debounce <= 0:
+                self._write_locked()
+                return
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def update(self, **fields) -> Dict[str, Any]:
+        """讀-改-寫：合併欄位後存回，回傳新內容。"""
+        with self._lock:
+            d = self.load() or {}
+            d.update(fields)
+            self.save(d)
+            return d
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self._write_locked()
+
+    def _write_locked(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=self.indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self._sig = self._stat_sig()
+
+
+# ---------------- 共用實例 ----------------
+_stores: Dict[str, JsonStore] = {}
+_stores_lock = threading.Lock()
+
+def store_for(path: str | os.PathLike, **opts) -> JsonStore:
+    """同一路徑回傳同一個 JsonStore；opts 只在第一次建立時生效。"""
+    key = os.path.abspath(os.fspath(path))
+    with _stores_lock:
+        st = _stores.get(key)
+        if st is None:
+            st = _stores[key] = JsonStore(key, **opts)
+        return st
+
+@atexit.register
+def flush_all() -> None:
+    for st in list(_stores.values()):
+        try: st.flush()
+        except Exception: pass
+
+
+__all__ = ["JsonStore", "store_for", "flush_all"]
@@ -0,0 +1,236 @@
+# app/utils/metrics.py
+# -*- coding: utf-8 -*-
+"""
+請求計時 + Prometheus 文字格式 /metrics
+- MetricsMiddleware：純 ASGI middleware，依「路由樣板」（/api/v1/orders/{oid}，而非實際路徑）統計
+  延遲直方圖、狀態碼次數、回應大小直方圖、進行中請求數；固定桶 + bisect，每次請求只做幾次加法
+- /metrics 另附：SQLAlchemy 連線池使用量、AnyIO threadpool（sync 端點）佔用量、密碼雜湊佇列
+- install(app, name=..., engines=...) 一行掛上；server.py / api.py / app.main / app.web_ui 共用
+環境變數：
+  AURUM_METRICS_TOKEN   有設定時 /metrics 需帶 Authorization: Bearer <token> 或 ?token=<token>
+"""
+from __future__ import annotations
+
+import hmac, os, threading, time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 延遲（秒）/ 回應大小（bytes）固定桶；最後一桶 +Inf 由 count 表示
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+METRICS_PATH = "/metrics"
+UNMATCHED = "<unmatched>"
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        out, acc = [], 0
+        for b, n in zip(self.bounds, self.counts):
+            acc += n
+            out.append((_fmt(b), acc))
+        out.append(("+Inf", self.count))
+        return out
+
+
+class _RouteStats:
+    __slots__ = ("latency", "size", "status")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.status: Dict[int, int] = {}
+
+
+class Registry:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], _RouteStats] = {}
+        self._in_flight = 0
+        self._gauges: List[Tuple[str, str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = []
+
+    # ---------------- 請求 ----------------
+    def begin(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+
+    def end(self, method: str, route: str, status: int, seconds: float, nbytes: int) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            st = self._routes.get((method, route))
+            if st is None:
+                st = self._routes[(method, route)] = _RouteStats()
+            st.latency.observe(seconds)
+            st.size.observe(nbytes)
+            st.status[status] = st.status.get(status, 0) + 1
+
+    # ---------------- 額外 gauge ----------------
+    def gauge(self, metric: str, help_text: str, fn: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> None:
+        """fn() 回傳 [(labels, value), ...]；取值失敗的 gauge 在該次輸出略過。"""
+        self._gauges.append((metric, help_text, fn))
+
+    def add_engine(self, engine, label: str = "default") -> None:
+        pool = engine.pool
+
+        def _pool():
+            out = []
+            for key, attr in (("size", "size"), ("checked_out", "checkedout"),
+                              ("checked_in", "checkedin"), ("overflow", "overflow")):
+                fn = getattr(pool, attr, None)
+                if callable(fn):
+                    out.append(({"engine": label, "state": key}, float(fn())))
+            return out
+
+        self.gauge("aurum_db_pool_connections", "SQLAlchemy 連線池狀態（size / checked_out / checked_in / overflow）", _pool)
+
+    # ---------------- 輸出 ----------------
+    def render(self) -> str:
+        app = _esc(self.name)
+        with self._lock:
+            routes = sorted(self._routes.items())
+            snap = [(m, r, dict(s.status), s.latency.cumulative(), s.latency.sum, s.size.cumulative(), s.size.sum)
+                    for (m, r), s in routes]
+            in_flight = self._in_flight
+
+        lines = ["# HELP aurum_http_requests_total 已完成的 HTTP 請求數",
+                 "# TYPE aurum_http_requests_total counter"]
+        for m, r, status, *_ in snap:
+            for code, n in sorted(status.items()):
+                lines.append(f'aurum_http_requests_total{{app="{app}",method="{m}",route="{_esc(r)}",status="{code}"}} {n}')
+
+        for metric, idx, help_text in (("aurum_http_request_duration_seconds", 3, "請求延遲（秒）"),
+                                       ("aurum_http_response_size_bytes", 5, "回應本文大小（bytes）")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            for row in snap:
+                base = f'app="{app}",method="{row[0]}",route="{_esc(row[1])}"'
+                buckets = row[idx]
+                for le, n in buckets:
+                    lines.append(f'{metric}_bucket{{{base},le="{le}"}} {n}')
+                lines.append(f"{metric}_sum{{{base}}} {_fmt(row[idx + 1])}")
+                lines.append(f"{metric}_count{{{base}}} {buckets[-1][1]}")
+
+        lines += ["# HELP aurum_http_requests_in_flight 進行中的請求數（含本次 /metrics）",
+                  "# TYPE aurum_http_requests_in_flight gauge",
+                  f'aurum_http_requests_in_flight{{app="{app}"}} {in_flight}',
+                  "# HELP aurum_process_start_time_seconds 行程啟動時間（Unix 秒）",
+                  "# TYPE aurum_process_start_time_seconds gauge",
+                  f'aurum_process_start_time_seconds{{app="{app}"}} {_fmt(self.started)}']
+
+        for metric, help_text, fn in self._gauges:
+            try:
+                samples = list(fn())
+            except Exception:
+                continue
+            if not samples:
+                continue
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for labels, value in samples:
+                lab = ",".join([f'app="{app}"'] + [f'{k}="{_esc(str(v))}"' for k, v in labels.items()])
+                lines.append(f"{metric}{{{lab}}} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) and not float(v).is_integer() else str(int(v))
+
+def _esc(s: str) -> str:
+    return s.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ---------------- 內建 gauge ----------------
+def _threadpool_samples():
+    # sync 端點（def）都跑在 AnyIO 預設 threadpool；borrowed == total 代表已飽和、後續請求在排隊
+    from anyio import to_thread
+    lim = to_thread.current_default_thread_limiter()
+    return [({"state": "borrowed"}, float(lim.borrowed_tokens)), ({"state": "total"}, float(lim.total_tokens))]
+
+def _hashing_samples():
+    from . import hashing
+    st = hashing.stats()
+    return [({"state": k}, float(st[k])) for k in ("in_flight", "queue_limit", "workers", "count", "rejected", "errors")]
+
+
+# ---------------- ASGI middleware ----------------
+class MetricsMiddleware:
+    def __init__(self, app, registry: Registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        reg = self.registry
+        reg.begin()
+        root0 = scope.get("root_path", "")
+        t0 = time.perf_counter()
+        box = [500, 0]                              # status, 已送出的 body bytes
+
+        async def _send(msg):
+            t = msg["type"]
+            if t == "http.response.start":
+                box[0] = msg["status"]
+            elif t == "http.response.body":
+                box[1] += len(msg.get("body", b""))
+            await send(msg)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            reg.end(scope.get("method", "GET"), _route_label(scope, root0, box[0]),
+                    box[0], time.perf_counter() - t0, box[1])
+
+
+def _route_label(scope, root0: str, status: int) -> str:
+    # FastAPI 比對到路由後會把 APIRoute 放進 scope["route"]（帶參數的樣板）；
+    # Mount（/static）會把前綴接到 root_path；其餘 404 歸到同一桶，避免實際路徑讓標籤爆量
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    root1 = scope.get("root_path", "")
+    if root1 != root0 and root1.startswith(root0):
+        return root1[len(root0):] + "/*"
+    if status != 404 and "endpoint" in scope:
+        return scope.get("path", UNMATCHED)
+    return UNMATCHED
+
+
+# ---------------- 安裝 ----------------
+def install(app, name: str, engines: Optional[Dict[str, object]] = None, path: str = METRICS_PATH) -> Registry:
+    """掛上 middleware 與 /metrics；engines = {"標籤": SQLAlchemy engine}。回傳 Registry 供再加 gauge。"""
+    from starlette.requests import Request
+    from starlette.responses import PlainTextResponse, Response
+
+    reg = Registry(name)
+    for label, eng in (engines or {}).items():
+        reg.add_engine(eng, label)
+    reg.gauge("aurum_threadpool_tokens", "AnyIO threadpool 佔用量（borrowed / total）", _threadpool_samples)
+    reg.gauge("aurum_hash_pool", "密碼雜湊執行器（app/utils/hashing.py）", _hashing_samples)
+
+    async def metrics(request: Request):
+        token = os.getenv("AURUM_METRICS_TOKEN", "")
+        if token:
+            got = request.query_params.get("token") or request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+            if not hmac.compare_digest(got.encode(), token.encode()):
+                return Response(status_code=401)
+        return PlainTextResponse(reg.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    app.add_route(path, metrics, methods=["GET"], include_in_schema=False)
+    app.add_middleware(MetricsMiddleware, registry=reg)
+    return reg
+
+
+__all__ = ["Histogram", "Registry", "MetricsMiddleware", "install", "LATENCY_BUCKETS", "SIZE_BUCKETS"]
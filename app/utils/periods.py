@@ -0,0 +1,52 @@
+# app/utils/periods.py
+# -*- coding: utf-8 -*-
+"""
+期間切分：日 / 月 / 年，以基準日往回推 N 期（舊 → 新）
+server.py 的 /api/v1/reports/compare 與 web_ui 的報表比較共用；各自再用一條
+「期間 CTE JOIN 訂單 / 支出 GROUP BY 期間」的查詢算出所有期間，不用每期各查一次。
+"""
+from __future__ import annotations
+
+from calendar import monthrange
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+MODES = ("day", "month", "year")
+MAX_PERIODS = 120
+
+Period = Tuple[str, date, date]      # (標籤, 起, 迄)
+
+
+def period_of(mode: str, d: date) -> Period:
+    if mode == "day":
+        return d.isoformat(), d, d
+    if mode == "month":
+        return f"{d:%Y-%m}", d.replace(day=1), d.replace(day=monthrange(d.year, d.month)[1])
+    if mode == "year":
+        return str(d.year), date(d.year, 1, 1), date(d.year, 12, 31)
+    raise ValueError(f"未知的期間模式：{mode}")
+
+def step_back(mode: str, d: date, n: int = 1) -> date:
+    """回傳往前 n 期的期間起日。"""
+    if mode == "day":
+        return d - timedelta(days=n)
+    if mode == "month":
+        k = d.year * 12 + (d.month - 1) - n
+        return date(k // 12, k % 12 + 1, 1)
+    return date(d.year - n, 1, 1)
+
+def buckets(mode: str, ref: date, n: int) -> List[Period]:
+    """以 ref 所在期間為最後一期，往回共 n 期（1..MAX_PERIODS），舊的在前。"""
+    n = max(1, min(int(n), MAX_PERIODS))
+    start = period_of(mode, ref)[1]
+    return [period_of(mode, step_back(mode, start, i)) for i in range(n - 1, -1, -1)]
+
+def delta(cur: float, prev: Optional[float]) -> Tuple[Optional[float], Optional[float]]:
+    """(差額, 百分比)；沒有前一期或前一期為 0 時百分比為 None。"""
+    if prev is None:
+        return None, None
+    diff = cur - prev
+    return diff, (round(diff / abs(prev) * 100, 2) if prev else None)   # 前期為負（淨額虧損）時方向才不會反
+
+
+__all__ = ["MODES", "MAX_PERIODS", "Period", "period_of", "step_back", "buckets", "delta"]
@@ -0,0 +1,179 @@
+# app/utils/profiling.py
+# -*- coding: utf-8 -*-
+"""
+線上單次請求剖析（管理員用）
+- 觸發方式（兩者擇一，金鑰 = 環境變數 AURUM_PROFILE_KEY；未設定時 middleware 根本不掛，零成本）
+    1) 標頭  X-Profile: <AURUM_PROFILE_KEY>
+    2) 查詢  ?_profile=<到期 unix 秒>.<簽章>   簽章 = HMAC-SHA256(key, "路徑|到期")，用 sign() 產生：
+       python -m app.utils.profiling /api/v1/orders --ttl 600
+- 觸發後以背景執行緒每 AURUM_PROFILE_INTERVAL_MS 毫秒取樣 sys._current_frames()，
+  輸出 folded stacks（flamegraph.pl / speedscope / inferno 可直接讀）
+  sync 端點跑在 threadpool，所以會取樣所有執行緒（以執行緒名稱當根節點，閒置等待中的略過）；
+  同時間其他請求也會被取到，建議在離峰時使用
+- 預設存檔到 AURUM_PROFILE_DIR（預設 ./profiles），回應帶 X-Profile-File；
+  標頭 X-Profile-Output: inline 或 ?_profile_out=inline 則直接以文字回傳剖析結果（取代原回應）
+"""
+from __future__ import annotations
+
+import hashlib, hmac, os, sys, threading, time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs
+
+PROFILE_KEY = os.getenv("AURUM_PROFILE_KEY", "")
+PROFILE_DIR = Path(os.getenv("AURUM_PROFILE_DIR", "profiles"))
+INTERVAL_MS = max(0.5, float(os.getenv("AURUM_PROFILE_INTERVAL_MS", "2") or 2))
+MAX_SECONDS = 60.0          # 取樣上限，避免卡住的請求一直跑下去
+
+# 葉節點落在這些函式 = 執行緒在等工作，不算進剖析
+_IDLE = {("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("selectors.py", "select"),
+         ("queue.py", "get"), ("thread.py", "_worker")}
+
+
+# ---------------- 簽章 ----------------
+def _sig(key: str, path: str, exp: int) -> str:
+    return hmac.new(key.encode(), f"{path}|{exp}".encode(), hashlib.sha256).hexdigest()[:32]
+
+def sign(path: str, ttl: int = 600, key: Optional[str] = None) -> str:
+    """回傳 _profile 查詢參數值（只對該路徑、到期前有效）。"""
+    key = key or PROFILE_KEY
+    if not key:
+        raise RuntimeError("未設定 AURUM_PROFILE_KEY")
+    exp = int(time.time()) + int(ttl)
+    return f"{exp}.{_sig(key, path, exp)}"
+
+def _verify_flag(value: str, path: str) -> bool:
+    exp_s, _, sig = value.partition(".")
+    if not exp_s.isdigit() or int(exp_s) < time.time():
+        return False
+    return hmac.compare_digest(sig, _sig(PROFILE_KEY, path, int(exp_s)))
+
+
+# ---------------- 取樣器 ----------------
+class Sampler:
+    def __init__(self, interval_ms: float = INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="aurum-profiler", daemon=True)
+
+    def start(self) -> "Sampler":
+        self.t0 = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        return time.perf_counter() - self.t0
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        deadline = time.perf_counter() + MAX_SECONDS
+        while not self._stop.is_set() and time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE:
+                    continue
+                stack = []
+                while frame is not None:
+                    c = frame.f_code
+                    stack.append(f"{c.co_name} ({os.path.basename(c.co_filename)}:{c.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+
+    def folded(self) -> str:
+        return "".join(f"{k} {n}\n" for k, n in self.stacks.most_common())
+
+
+# ---------------- ASGI middleware ----------------
+class ProfilerMiddleware:
+    def __init__(self, app, out_dir: Path = PROFILE_DIR):
+        self.app = app
+        self.out_dir = Path(out_dir)
+
+    def _wanted(self, scope):
+        """回傳 (要剖析?, 是否 inline)；沒有觸發時只做一次標頭掃描與字串比對。"""
+        hdr = out = None
+        for k, v in scope.get("headers", ()):
+            if k == b"x-profile":
+                hdr = v.decode("latin-1")
+            elif k == b"x-profile-output":
+                out = v.decode("latin-1")
+        qs = scope.get("query_string", b"")
+        if hdr is None and b"_profile=" not in qs:
+            return False, False
+        q = parse_qs(qs.decode("latin-1")) if qs else {}
+        ok = (hdr is not None and hmac.compare_digest(hdr, PROFILE_KEY)) or \
+             any(_verify_flag(v, scope.get("path", "")) for v in q.get("_profile", []))
+        inline = (out or (q.get("_profile_out") or [""])[0]) == "inline"
+        return ok, inline
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        ok, inline = self._wanted(scope)
+        if not ok:
+            return await self.app(scope, receive, send)
+
+        sampler = Sampler().start()
+        status = [0]
+        fname = f"{datetime.now():%Y%m%d-%H%M%S}-{scope.get('method', 'GET')}-" \
+                f"{scope.get('path', '').strip('/').replace('/', '_') or 'root'}.folded"
+
+        async def _send(msg):
+            if inline:                          # 原回應丟掉，最後改送剖析結果
+                if msg["type"] == "http.response.start":
+                    status[0] = msg["status"]
+                return
+            if msg["type"] == "http.response.start":
+                msg = dict(msg, headers=list(msg.get("headers", [])) + [(b"x-profile-file", fname.encode())])
+            await send(msg)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            secs = sampler.stop()
+            body = sampler.folded()
+            if not inline:
+                try:
+                    self.out_dir.mkdir(parents=True, exist_ok=True)
+                    (self.out_dir / fname).write_text(body, encoding="utf-8")
+                except OSError:
+                    pass
+        if inline:
+            data = body.encode("utf-8")
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(data)).encode()),
+                (b"x-profile-status", str(status[0]).encode()), (b"x-profile-samples", str(sampler.samples).encode()),
+                (b"x-profile-seconds", f"{secs:.3f}".encode())]})
+            await send({"type": "http.response.body", "body": data})
+
+
+def install(app) -> bool:
+    """有設定 AURUM_PROFILE_KEY 才掛 middleware；回傳是否已掛上。"""
+    if not PROFILE_KEY:
+        return False
+    app.add_middleware(ProfilerMiddleware)
+    return True
+
+
+__all__ = ["PROFILE_KEY", "Sampler", "ProfilerMiddleware", "install", "sign"]
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="產生單次剖析用的 _profile 查詢參數")
+    ap.add_argument("path", help="要剖析的路徑，例如 /api/v1/orders")
+    ap.add_argument("--ttl", type=int, default=600, help="有效秒數")
+    a = ap.parse_args()
+    print(f"{a.path}?_profile={sign(a.path, a.ttl)}")
@@ -0,0 +1,74 @@
+# app/utils/series.py
+# -*- coding: utf-8 -*-
+"""
+圖表用的連續時間序列（日 / 週 / 月），沒有資料的日子補 0
+- 輸入是一條 GROUP BY date, 類別 的彙總結果：(日期, 類別, 金額)，類別 0=早班 1=晚班 2=支出
+- 以日期偏移量 np.bincount 一次散佈到整段日軸，再以 np.add.reduceat 併成週 / 月，
+  不逐日建 dict 合併；一年期約 365×3 個點，成本幾乎都在 SQL 那一條彙總
+- 週以週一為起點，標籤為該週週一（第一週可能早於 from）；月標籤為 YYYY-MM
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+
+GRAINS = ("day", "week", "month")
+MAX_DAYS = 3700                     # 約 10 年；再長請改用月報或期間比較
+MORNING, EVENING, EXPENSE = 0, 1, 2
+
+
+def day_axis(d1: date, d2: date) -> np.ndarray:
+    """d1..d2（含）的 datetime64[D] 日軸。"""
+    return np.arange(np.datetime64(d1, "D"), np.datetime64(d2, "D") + 1)
+
+def _bucket_keys(axis: np.ndarray, grain: str) -> np.ndarray:
+    if grain == "day":
+        return axis.astype(np.int64)
+    if grain == "week":
+        return (axis.astype(np.int64) + 3) // 7          # 1970-01-01 是週四，+3 讓週一成為邊界
+    if grain == "month":
+        return axis.astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"未知的粒度：{grain}")
+
+def _labels(keys: np.ndarray, grain: str) -> List[str]:
+    if grain == "day":
+        return np.datetime_as_string(keys.astype("datetime64[D]"), unit="D").tolist()
+    if grain == "week":
+        return np.datetime_as_string((keys * 7 - 3).astype("datetime64[D]"), unit="D").tolist()
+    return np.datetime_as_string(keys.astype("datetime64[M]"), unit="M").tolist()
+
+def bucket_labels(d1: date, d2: date, grain: str) -> List[str]:
+    """d1..d2 涵蓋的各期標籤（已排序，字串順序即時間順序）。"""
+    keys = _bucket_keys(day_axis(d1, d2), grain)
+    return _labels(np.unique(keys), grain)
+
+def grid(axis: np.ndarray, rows: Iterable[Sequence[Any]]) -> np.ndarray:
+    """rows = [(日期, 類別, 金額)] 散佈到日軸上 → shape (3, len(axis))，列依序為早班 / 晚班 / 支出；軸外的列略過。"""
+    n = len(axis)
+    rows = list(rows)
+    if not rows or not n:
+        return np.zeros((3, n))
+    ds, ks, vs = zip(*rows)
+    off = (np.array(ds, dtype="datetime64[D]") - axis[0]).astype(np.int64)
+    ks = np.asarray(ks, dtype=np.int64)
+    vs = np.asarray([float(v or 0) for v in vs])
+    ok = (off >= 0) & (off < n)
+    # (類別, 日) 攤平成一維索引，一次 bincount 完成散佈 + 加總
+    return np.bincount(ks[ok] * n + off[ok], weights=vs[ok], minlength=3 * n).reshape(3, n)
+
+def dense(d1: date, d2: date, grain: str, rows: Iterable[Sequence[Any]]) -> Dict[str, Any]:
+    """rows = [(日期, 類別, 金額)]；回傳等長陣列 dates / morning / evening / total / expense / net。"""
+    axis = day_axis(d1, d2)
+    grid_ = grid(axis, rows)
+    keys = _bucket_keys(axis, grain)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    morning, evening, expense = np.add.reduceat(grid_, starts, axis=1)
+    total = morning + evening
+    return {"grain": grain, "dates": _labels(keys[starts], grain),
+            "morning": morning.tolist(), "evening": evening.tolist(), "total": total.tolist(),
+            "expense": expense.tolist(), "net": (total - expense).tolist()}
+
+
+__all__ = ["GRAINS", "MAX_DAYS", "MORNING", "EVENING", "EXPENSE", "day_axis", "bucket_labels", "grid", "dense"]
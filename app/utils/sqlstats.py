@@ -0,0 +1,195 @@
+# app/utils/sqlstats.py
+# -*- coding: utf-8 -*-
+"""
+SQL 執行統計：每個請求（或桌機版的一個動作）打了幾條 SQL、花多少時間
+- instrument_engine(engine)：掛 SQLAlchemy before/after_cursor_execute（server.py / app.db / 桌機版）
+- InstrumentedConnection：sqlite3.connect(..., factory=InstrumentedConnection)，給 web_ui 的原生 sqlite3
+- install(app)：ASGI middleware，以 contextvar 把統計歸到目前請求，回應帶 X-SQL-Count / X-SQL-Time-ms
+- track("DashboardTab.refresh")：桌機版用的 with 區塊，結束時記一行摘要
+超過門檻的語句記到 logger "aurum.sql"（參數只留型別，不落實際值）；同一請求內
+完全相同的語句 + 參數重複執行、或同一語句執行次數過多（N+1）也會警告。
+註：原生 sqlite3 的 SELECT 只計到 execute 回傳（第一列），之後 fetch 的時間不計入。
+環境變數：
+  AURUM_SLOW_SQL_MS   慢查詢門檻（毫秒，預設 200）
+  AURUM_SQL_REPEAT    同一語句在單一請求內執行幾次以上視為 N+1（預設 10）
+"""
+from __future__ import annotations
+
+import contextvars, logging, os, sqlite3, time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+SLOW_SQL_MS = float(os.getenv("AURUM_SLOW_SQL_MS", "200") or 200)
+REPEAT_LIMIT = max(2, int(os.getenv("AURUM_SQL_REPEAT", "10") or 10))
+LOG_SQL_CHARS = 500
+
+log = logging.getLogger("aurum.sql")
+
+
+class SqlStats:
+    __slots__ = ("label", "count", "ms", "by_sql", "exact")
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.count = 0
+        self.ms = 0.0
+        self.by_sql: Dict[str, int] = {}             # 語句 → 次數
+        self.exact: Dict[Tuple[str, str], int] = {}  # (語句, 參數 repr) → 次數
+
+    def add(self, sql: str, params: Any, ms: float, many: bool) -> None:
+        self.count += 1
+        self.ms += ms
+        self.by_sql[sql] = self.by_sql.get(sql, 0) + 1
+        if not many:
+            key = (sql, repr(params))
+            self.exact[key] = self.exact.get(key, 0) + 1
+
+    def repeats(self):
+        """[(語句, 次數, 是否連參數都相同)]，只列出值得注意的。"""
+        out = [(sql, n, True) for (sql, _p), n in self.exact.items() if n >= 2]
+        seen = {sql for sql, _n, _x in out}
+        out += [(sql, n, False) for sql, n in self.by_sql.items() if n >= REPEAT_LIMIT and sql not in seen]
+        return sorted(out, key=lambda r: -r[1])
+
+    def report(self) -> None:
+        for sql, n, identical in self.repeats():
+            kind = "相同語句與參數" if identical else "同一語句（疑似 N+1）"
+            log.warning("[%s] %s 重複 %d 次：%s", self.label, kind, n, _clip(sql))
+        log.debug("[%s] %d 條 SQL，%.1f ms", self.label, self.count, self.ms)
+
+
+_current: contextvars.ContextVar[Optional[SqlStats]] = contextvars.ContextVar("aurum_sqlstats", default=None)
+
+
+def current() -> Optional[SqlStats]:
+    return _current.get()
+
+
+def _clip(sql: str) -> str:
+    sql = " ".join(sql.split())
+    return sql if len(sql) <= LOG_SQL_CHARS else sql[:LOG_SQL_CHARS] + " …"
+
+def redact(params: Any, many: bool = False) -> str:
+    """只留參數型別（與字串長度），不記實際值。"""
+    if params is None:
+        return "()"
+    if many:
+        try: return f"<{len(params)} rows>"
+        except TypeError: return "<many>"
+    def one(v):
+        if v is None: return "NULL"
+        if isinstance(v, (str, bytes)): return f"<{type(v).__name__}:{len(v)}>"
+        return f"<{type(v).__name__}>"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}={one(v)}" for k, v in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        return "(" + ", ".join(one(v) for v in params) + ")"
+    return one(params)
+
+_listeners: List[Callable[[str, Any, float, bool], None]] = []
+
+def add_listener(fn: Callable[[str, Any, float, bool], None]) -> None:
+    """每條 SQL 執行後呼叫 fn(sql, params, ms, many)（scripts/query_audit.py 用來收集語句）。"""
+    _listeners.append(fn)
+
+def record(sql: str, params: Any, ms: float, many: bool = False) -> None:
+    for fn in _listeners:
+        fn(sql, params, ms, many)
+    st = _current.get()
+    if st is not None:
+        st.add(sql, params, ms, many)
+    if ms >= SLOW_SQL_MS:
+        log.warning("[%s] 慢查詢 %.1f ms：%s params=%s", st.label if st else "-", ms, _clip(sql), redact(params, many))
+
+
+# ---------------- SQLAlchemy ----------------
+def _sa_before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("aurum_sql_t0", []).append(time.perf_counter())
+
+def _sa_after(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("aurum_sql_t0")
+    if stack:
+        record(statement, parameters, (time.perf_counter() - stack.pop()) * 1000, executemany)
+
+def instrument_engine(engine) -> None:
+    from sqlalchemy import event
+    if not event.contains(engine, "before_cursor_execute", _sa_before):
+        event.listen(engine, "before_cursor_execute", _sa_before)
+        event.listen(engine, "after_cursor_execute", _sa_after)
+
+
+# ---------------- 原生 sqlite3 ----------------
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record(sql, parameters, (time.perf_counter() - t0) * 1000)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record(sql, seq_of_parameters, (time.perf_counter() - t0) * 1000, many=True)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3.connect(path, factory=InstrumentedConnection)；conn.execute / cursor() 都會計入。"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# ---------------- 歸屬：請求 / 動作 ----------------
+@contextmanager
+def track(label: str) -> Iterator[SqlStats]:
+    st = SqlStats(label)
+    token = _current.set(st)
+    try:
+        yield st
+    finally:
+        _current.reset(token)
+        st.report()
+
+
+class SqlStatsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        st = SqlStats(f"{scope.get('method', 'GET')} {scope.get('path', '')}")
+        token = _current.set(st)
+
+        async def _send(msg):
+            # 串流回應的標頭先送出，之後的 SQL 不會反映在標頭上（log 仍完整）
+            if msg["type"] == "http.response.start":
+                headers = list(msg.get("headers", []))
+                headers += [(b"x-sql-count", str(st.count).encode()), (b"x-sql-time-ms", f"{st.ms:.1f}".encode())]
+                msg = dict(msg, headers=headers)
+            await send(msg)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _current.reset(token)
+            st.report()
+
+
+def install(app) -> None:
+    app.add_middleware(SqlStatsMiddleware)
+
+
+__all__ = ["SqlStats", "SLOW_SQL_MS", "REPEAT_LIMIT", "current", "add_listener", "record", "redact", "instrument_engine",
+           "InstrumentedConnection", "InstrumentedCursor", "track", "install", "SqlStatsMiddleware"]
@@ -0,0 +1,234 @@
+# app/utils/tenants.py
+# -*- coding: utf-8 -*-
+"""
+多門市（tenant）路由：一個行程服務所有門市，每家門市仍是自己的 SQLite 檔
+- StoreMap：門市設定檔（server.py 為 RESTO_STORES、web_ui 為 AURUM_STORES，預設 stores.json）
+    {"A01": {"db": "stores/A01/resto.db", "name": "台北店", "users": ["boss", "a01"]}, ...}
+  db 為相對路徑時以設定檔所在目錄為準；users 省略表示所有帳號皆可登入。
+  設定檔不存在時只有一家 "default"，沿用原本的 RESTO_DB / aurum.db（單店部署不需任何設定）
+- TenantRouter：store id → Tenant（該店的 engine / 連線資源），第一次用到才 open（含 schema 初始化），
+  LRU 最多保留 max_open 家；閒置超過 idle_seconds、或超出上限時，關掉最久沒用且沒有進行中請求的那家
+- 每家門市有自己的併發上限 limit：同時佔用資料庫的請求超過上限時最多等 wait 秒，仍拿不到就丟 TenantBusy
+  （各 app 轉成 429）。各 app 的連線池大小設成同一個 limit，忙碌的門市只會排自己的隊，
+  不會把共用的 threadpool 或別家門市的連線吃光
+環境變數：
+  AURUM_TENANT_MAX_OPEN   同時開著的門市數（預設 16）
+  AURUM_TENANT_IDLE       閒置幾秒後關閉（預設 900）
+  AURUM_TENANT_LIMIT      每家門市同時佔用資料庫的請求數（預設 8）
+  AURUM_TENANT_WAIT       超過上限時最多等幾秒（預設 0.5）
+"""
+from __future__ import annotations
+
+import asyncio, os, re, threading, time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import jsonstore
+
+MAX_OPEN = max(1, int(os.getenv("AURUM_TENANT_MAX_OPEN", "16") or 16))
+IDLE_SECONDS = float(os.getenv("AURUM_TENANT_IDLE", "900") or 900)
+LIMIT = max(1, int(os.getenv("AURUM_TENANT_LIMIT", "8") or 8))
+WAIT_SECONDS = float(os.getenv("AURUM_TENANT_WAIT", "0.5") or 0)
+RETRY_AFTER_SEC = 1
+
+DEFAULT_STORE = "default"
+STORE_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+class UnknownStore(LookupError):
+    """門市代碼格式不符或不在設定檔內。"""
+
+class TenantBusy(RuntimeError):
+    """該門市同時進行的請求已達上限；呼叫端應回 429 並帶 Retry-After。"""
+    retry_after = RETRY_AFTER_SEC
+
+
+# ---------------- 門市設定 ----------------
+class StoreMap:
+    """default_db 是函式：單店模式沿用各 app 的 DB_PATH（匯入後才改的也看得到）。"""
+
+    def __init__(self, path: str | os.PathLike, default_db: Callable[[], Any]):
+        self.path = Path(path)
+        self._default_db = default_db
+
+    def _stores(self) -> Dict[str, Dict[str, Any]]:
+        data = jsonstore.store_for(self.path).load()   # 只 stat，檔案有變才重新解析
+        return {str(k): v for k, v in data.items() if isinstance(v, dict)} if isinstance(data, dict) else {}
+
+    def ids(self) -> List[str]:
+        stores = self._stores()
+        return list(stores) if stores else [DEFAULT_STORE]
+
+    def db_path(self, store: str) -> str:
+        if not STORE_RE.match(store or ""):
+            raise UnknownStore(store)
+        stores = self._stores()
+        if not stores and store == DEFAULT_STORE:
+            return str(self._default_db())
+        cfg = stores.get(store)
+        if not cfg or not cfg.get("db"):
+            raise UnknownStore(store)
+        p = Path(cfg["db"])
+        return str(p if p.is_absolute() else self.path.parent / p)
+
+    def name(self, store: str) -> str:
+        return str(self._stores().get(store, {}).get("name") or store)
+
+    def allows(self, store: str, user: str) -> bool:
+        users = self._stores().get(store, {}).get("users")
+        return users is None or user in users
+
+
+# ---------------- 路由 ----------------
+class Tenant:
+    __slots__ = ("store", "path", "resource", "limit", "active", "last_used", "rejected", "_sem", "_lock")
+
+    def __init__(self, store: str, path: str, resource: Any, limit: int):
+        self.store, self.path, self.resource, self.limit = store, path, resource, limit
+        self.active = self.rejected = 0
+        self.last_used = time.monotonic()
+        self._sem = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.active += 1
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.active -= 1
+            self.last_used = time.monotonic()
+        self._sem.release()
+
+    def _busy(self) -> TenantBusy:
+        with self._lock:
+            self.rejected += 1
+        return TenantBusy(self.store)
+
+    @contextmanager
+    def slot(self, wait: float = WAIT_SECONDS):
+        """同步版（threadpool 內的 dependency 用）：拿不到名額最多阻塞 wait 秒。"""
+        if not self._sem.acquire(timeout=max(0.0, wait)):
+            raise self._busy()
+        self._enter()
+        try:
+            yield self.resource
+        finally:
+            self._exit()
+
+    @asynccontextmanager
+    async def aslot(self, wait: float = WAIT_SECONDS):
+        """async 版（middleware 用）：以短暫 sleep 輪詢，不阻塞事件迴圈。"""
+        deadline = time.monotonic() + max(0.0, wait)
+        while not self._sem.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise self._busy()
+            await asyncio.sleep(0.01)
+        self._enter()
+        try:
+            yield self.resource
+        finally:
+            self._exit()
+
+
+class TenantRouter:
+    """
+    open_fn(store, path) → 資源（engine / session factory / 快取…），close_fn(資源) 釋放；
+    pinned 內的門市不因閒置或 LRU 關閉（例如沿用模組層級 engine 的 default）。
+    """
+
+    def __init__(self, stores: StoreMap, open_fn: Callable[[str, str], Any],
+                 close_fn: Callable[[Any], None] = lambda _r: None, *, max_open: int = MAX_OPEN,
+                 idle_seconds: float = IDLE_SECONDS, limit: int = LIMIT, wait: float = WAIT_SECONDS,
+                 pinned: Iterable[str] = ()):
+        self.stores = stores
+        self._open_fn, self._close_fn = open_fn, close_fn
+        self.max_open, self.idle_seconds, self.limit, self.wait = max_open, idle_seconds, limit, wait
+        self.pinned = set(pinned)
+        self._open: "OrderedDict[str, Tenant]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._opening: Dict[str, threading.Lock] = {}
+        self.opened = self.evicted = 0
+
+    def get(self, store: str) -> Tenant:
+        path = self.stores.db_path(store)                 # UnknownStore 直接往外丟
+        with self._lock:
+            t = self._open.get(store)
+            if t is not None and t.path == path:
+                self._open.move_to_end(store)
+                return t
+            gate = self._opening.setdefault(store, threading.Lock())
+        # 開檔（可能含 schema 遷移）只鎖這一家，其他門市照常服務
+        with gate:
+            with self._lock:
+                t = self._open.get(store)
+                if t is not None and t.path == path:
+                    self._open.move_to_end(store)
+                    return t
+            stale = t                                      # 設定檔把這家改指到別的檔案
+            t = Tenant(store, path, self._open_fn(store, path), self.limit)
+            with self._lock:
+                self._open[store] = t
+                self.opened += 1
+                victims = self._victims()
+        if stale is not None:
+            victims.append(stale)
+        for v in victims:
+            self._close(v)
+        return t
+
+    def _victims(self) -> List[Tenant]:
+        """（持有 _lock）挑出要關的門市：閒置過久的，以及超出 max_open 時最久沒用的；進行中的不關。"""
+        now, out = time.monotonic(), []
+        for store, t in list(self._open.items()):
+            if store in self.pinned or t.active:
+                continue
+            if now - t.last_used > self.idle_seconds or len(self._open) > self.max_open:
+                out.append(self._open.pop(store))
+        return out
+
+    def _close(self, t: Tenant) -> None:
+        self.evicted += 1
+        try:
+            self._close_fn(t.resource)
+        except Exception:
+            pass
+
+    def sweep(self) -> int:
+        """關掉閒置過久的門市（get 時也會順便做）；回傳關閉數。"""
+        with self._lock:
+            victims = self._victims()
+        for v in victims:
+            self._close(v)
+        return len(victims)
+
+    @contextmanager
+    def slot(self, store: str):
+        with self.get(store).slot(self.wait) as r:
+            yield r
+
+    def close_all(self) -> None:
+        with self._lock:
+            victims = list(self._open.values())
+            self._open.clear()
+        for v in victims:
+            self._close(v)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [{"store": t.store, "name": self.stores.name(t.store), "active": t.active, "limit": t.limit,
+                     "rejected": t.rejected, "idle_s": round(now - t.last_used, 1)} for t in self._open.values()]
+
+    def samples(self) -> List[Tuple[Dict[str, str], float]]:
+        """metrics gauge 用：每家門市 active / limit / rejected。"""
+        out = []
+        for s in self.stats():
+            for key in ("active", "limit", "rejected"):
+                out.append(({"store": s["store"], "state": key}, float(s[key])))
+        return out
+
+
+__all__ = ["DEFAULT_STORE", "STORE_RE", "LIMIT", "UnknownStore", "TenantBusy", "StoreMap", "Tenant", "TenantRouter"]
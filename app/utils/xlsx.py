@@ -0,0 +1,277 @@
+# app/utils/xlsx.py
+# -*- coding: utf-8 -*-
+"""
+串流 XLSX 寫出（write-only，不需 openpyxl）
+- 列從 cursor / 產生器逐批取出，每 CHUNK_ROWS 列組成一段 XML 直接寫進 zip 成員（deflate 串流），
+  整份活頁簿不會出現在記憶體裡；字串一律 inline（不建 sharedStrings 表），記憶體與列數無關
+- 輸出端可為檔案路徑、可 seek 的檔案，或不可 seek 的串流：
+    Workbook(path) … add_sheet() … close()         寫到磁碟（桌機版匯出、批次腳本）
+    stream([Sheet(...), ...])                       產生器，一段段 bytes 直接交給 HTTP StreamingResponse
+- 多工作表；單表超過 Excel 上限（1,048,576 列）時自動續寫到「名稱 (2)」
+- 型別：int / float / Decimal → 數值；date / datetime → Excel 日期（yyyy-mm-dd / yyyy-mm-dd hh:mm:ss）；
+  bool → TRUE / FALSE；None → 空格；其餘轉字串。money 欄位套千分位格式
+- 首列為粗體表頭並凍結窗格
+"""
+from __future__ import annotations
+
+import math, re, zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List, Optional, Sequence, Union
+from xml.sax.saxutils import escape
+
+MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CHUNK_ROWS = 1000                   # 每批列數：組成一段 XML 寫入，串流時每批送出一次
+MAX_ROWS = 1048576                  # Excel 單表上限（含表頭）
+MAX_CELL_CHARS = 32767
+COMPRESS_LEVEL = 1                  # 匯出以速度為先；等級 6 只再小一成半，卻慢約五成
+
+_EPOCH = date(1899, 12, 30)
+_BAD_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_BAD_SHEET = re.compile(r"[\[\]:*?/\\]")
+# cellXfs 索引（見 _STYLES）
+_S_DATE, _S_DATETIME, _S_HEADER, _S_MONEY = 1, 2, 3, 4
+
+_NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+_NS_R = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_STYLES = (_XML_HEAD + f'<styleSheet {_NS}>'
+           '<numFmts count="2"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/>'
+           '<numFmt numFmtId="165" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+           '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+           '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+           '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+           '<fill><patternFill patternType="gray125"/></fill></fills>'
+           '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+           '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+           '<cellXfs count="5"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+           '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+           '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+           '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+           '<xf numFmtId="3" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+           '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+           '</styleSheet>')
+
+
+class Sheet:
+    """
+    一張工作表的定義。rows 可為可迭代物件，或「回傳可迭代物件的函式」——
+    後者在真正寫到這張表時才呼叫，讓 cursor / DB 連線只在串流期間存在。
+    widths：各欄寬度（字元數），money：套千分位格式的欄位索引。
+    """
+    __slots__ = ("name", "header", "rows", "widths", "money")
+
+    def __init__(self, name: str, header: Sequence[str],
+                 rows: Union[Iterable[Sequence[Any]], Callable[[], Iterable[Sequence[Any]]]],
+                 widths: Optional[Sequence[float]] = None, money: Iterable[int] = ()):
+        self.name, self.header, self.rows = name, list(header), rows
+        self.widths, self.money = list(widths or []), set(money)
+
+
+def _col_letters(n: int) -> List[str]:
+    out = []
+    for i in range(1, n + 1):
+        s = ""
+        while i:
+            i, r = divmod(i - 1, 26)
+            s = chr(65 + r) + s
+        out.append(s)
+    return out
+
+_PLAIN = re.compile('[&<>\x00-\x1f\ufffe\uffff]')
+
+def _text(v: str) -> str:
+    if _PLAIN.search(v) is None and len(v) <= MAX_CELL_CHARS and not (v[:1].isspace() or v[-1:].isspace()):
+        return f"<is><t>{v}</t></is>"                    # 絕大多數字串：不必跳脫
+    v = _BAD_XML.sub("", v)[:MAX_CELL_CHARS]
+    sp = ' xml:space="preserve"' if v[:1].isspace() or v[-1:].isspace() else ""
+    return f"<is><t{sp}>{escape(v)}</t></is>"
+
+def _c_str(ref: str, v: Any, money: bool) -> str:
+    return f'<c r="{ref}" t="inlineStr">{_text(v)}</c>'
+
+def _c_num(ref: str, v: Any, money: bool) -> str:
+    return f'<c r="{ref}" s="{_S_MONEY}"><v>{v}</v></c>' if money else f'<c r="{ref}"><v>{v}</v></c>'
+
+def _c_float(ref: str, v: float, money: bool) -> str:
+    return _c_num(ref, v, money) if math.isfinite(v) else ""
+
+def _c_date(ref: str, v: date, money: bool) -> str:
+    return f'<c r="{ref}" s="{_S_DATE}"><v>{(v - _EPOCH).days}</v></c>'
+
+def _c_datetime(ref: str, v: datetime, money: bool) -> str:
+    serial = (v - datetime(1899, 12, 30)).total_seconds() / 86400
+    return f'<c r="{ref}" s="{_S_DATETIME}"><v>{serial:.10f}</v></c>'
+
+def _c_bool(ref: str, v: bool, money: bool) -> str:
+    return f'<c r="{ref}" t="b"><v>{int(v)}</v></c>'
+
+# 依 type() 直接查表（每格一次 dict 查詢）；子類別（Enum、numpy 數值…）才走 isinstance
+_BY_TYPE = {str: _c_str, int: _c_num, float: _c_float, Decimal: _c_num, date: _c_date,
+            datetime: _c_datetime, bool: _c_bool, type(None): lambda ref, v, money: ""}
+
+def _cell(ref: str, v: Any, money: bool) -> str:
+    f = _BY_TYPE.get(type(v))
+    if f is not None:
+        return f(ref, v, money)
+    if isinstance(v, Enum):                             # 例：班別 (str, Enum) → 存的值
+        return _cell(ref, v.value, money)
+    if isinstance(v, bool):
+        return _c_bool(ref, v, money)
+    if isinstance(v, (int, Decimal)):
+        return _c_num(ref, int(v) if isinstance(v, int) else v, money)
+    if isinstance(v, float):
+        return _c_float(ref, float(v), money)
+    if isinstance(v, datetime):
+        return _c_datetime(ref, v, money)
+    if isinstance(v, date):
+        return _c_date(ref, v, money)
+    try:
+        return _c_float(ref, float(v), money) if hasattr(v, "dtype") else _c_str(ref, str(v), money)
+    except (TypeError, ValueError):
+        return _c_str(ref, str(v), money)
+
+
+class _Sink:
+    """不可 seek 的輸出端（zipfile 會改用 data descriptor）；寫入的 bytes 暫存到被 drain() 取走。"""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def write(self, b) -> int:
+        self._buf += b
+        return len(b)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out, self._buf = bytes(self._buf), bytearray()
+        return out
+
+
+class Workbook:
+    """fp 為路徑或二進位檔案物件；add_sheet 逐批寫入，close（或 with 結束）時補上活頁簿索引。"""
+
+    def __init__(self, fp: Union[str, Path, BinaryIO]):
+        self._zf = zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL)
+        self._names: List[str] = []
+        self.rows = 0
+
+    def __enter__(self) -> "Workbook":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _unique(self, name: str) -> str:
+        base = _BAD_SHEET.sub("_", name).strip("'")[:31] or f"Sheet{len(self._names) + 1}"
+        name, n = base, 2
+        while name.lower() in (x.lower() for x in self._names):
+            suffix = f" ({n})"
+            name, n = base[:31 - len(suffix)] + suffix, n + 1
+        return name
+
+    def _sheet_steps(self, sheet: Sheet) -> Iterator[None]:
+        """寫一張表（超過上限時續寫成多張）；每寫完一批 yield 一次，給串流送出。"""
+        rows = sheet.rows() if callable(sheet.rows) else sheet.rows
+        cols = _col_letters(max(len(sheet.header), 1))
+        money = [i in sheet.money for i in range(len(cols))]
+        head = "".join(f'<c r="{c}1" t="inlineStr" s="{_S_HEADER}">{_text(str(h))}</c>'
+                       for c, h in zip(cols, sheet.header))
+        widths = "".join(f'<col min="{i}" max="{i}" width="{w}" customWidth="1"/>'
+                         for i, w in enumerate(sheet.widths, 1) if w)
+        it = iter(rows)
+        more = True
+        while more:
+            self._names.append(self._unique(sheet.name))
+            with self._zf.open(f"xl/worksheets/sheet{len(self._names)}.xml", "w", force_zip64=True) as f:
+                f.write((_XML_HEAD + f"<worksheet {_NS} {_NS_R}>"
+                         '<sheetViews><sheetView workbookViewId="0">'
+                         '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                         "</sheetView></sheetViews>"
+                         + (f"<cols>{widths}</cols>" if widths else "")
+                         + f'<sheetData><row r="1">{head}</row>').encode("utf-8"))
+                r, buf = 1, []
+                more = False
+                for row in it:
+                    r += 1
+                    if len(row) > len(cols):
+                        cols = _col_letters(len(row))
+                        money = [i in sheet.money for i in range(len(cols))]
+                    rs = str(r)
+                    buf.append(f'<row r="{rs}">' + "".join([
+                        _cell(c + rs, v, m) for c, v, m in zip(cols, row, money)]) + "</row>")
+                    if len(buf) >= CHUNK_ROWS:
+                        f.write("".join(buf).encode("utf-8"))
+                        buf.clear()
+                        yield
+                    if r >= MAX_ROWS:
+                        more = True
+                        break
+                f.write(("".join(buf) + "</sheetData></worksheet>").encode("utf-8"))
+                self.rows += r - 1
+            yield
+
+    def add_sheet(self, sheet: Sheet) -> None:
+        for _ in self._sheet_steps(sheet):
+            pass
+
+    def close(self) -> None:
+        if self._zf.fp is None:
+            return
+        if not self._names:
+            self.add_sheet(Sheet("Sheet1", [], []))
+        n = len(self._names)
+        ct = (_XML_HEAD + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+              '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+              '<Default Extension="xml" ContentType="application/xml"/>'
+              '<Override PartName="/xl/workbook.xml" '
+              'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+              '<Override PartName="/xl/styles.xml" '
+              'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+              + "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                        for i in range(1, n + 1))
+              + "</Types>")
+        rels = (_XML_HEAD + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+                'officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        wb = (_XML_HEAD + f"<workbook {_NS} {_NS_R}><sheets>"
+              + "".join(f'<sheet name="{escape(nm, {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+                        for i, nm in enumerate(self._names, 1))
+              + "</sheets></workbook>")
+        wb_rels = (_XML_HEAD + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   + "".join(f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/'
+                             f'2006/relationships/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in range(1, n + 1))
+                   + f'<Relationship Id="rId{n + 1}" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+                     'relationships/styles" Target="styles.xml"/></Relationships>')
+        for name, body in (("xl/workbook.xml", wb), ("xl/_rels/workbook.xml.rels", wb_rels),
+                           ("xl/styles.xml", _STYLES), ("_rels/.rels", rels), ("[Content_Types].xml", ct)):
+            self._zf.writestr(name, body)
+        self._zf.close()
+
+
+def stream(sheets: Iterable[Sheet]) -> Iterator[bytes]:
+    """依序寫出各表，每批列送出一段 bytes；交給 StreamingResponse(…, media_type=MEDIA_TYPE)。"""
+    sink = _Sink()
+    wb = Workbook(sink)
+    for sheet in sheets:
+        for _ in wb._sheet_steps(sheet):
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    wb.close()
+    yield sink.drain()
+
+def write(path: Union[str, Path], sheets: Iterable[Sheet]) -> int:
+    """寫到檔案；回傳資料列數（不含表頭）。"""
+    with Workbook(path) as wb:
+        for sheet in sheets:
+            wb.add_sheet(sheet)
+    return wb.rows
+
+
+__all__ = ["MEDIA_TYPE", "CHUNK_ROWS", "MAX_ROWS", "Sheet", "Workbook", "stream", "write"]
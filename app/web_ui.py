@@ -2,36 +2,92 @@
 from __future__ import annotations
 from pathlib import Path
 from datetime import date, datetime, timedelta
-from typing import Any, Optional, Dict, List, Tuple
-import json, os, base64, hashlib, hmac, sqlite3, re, io, zipfile
+from typing import Any, Optional, Dict, Iterable, List, Tuple
+import json, os, base64, sqlite3, re, io, itertools, zipfile
+from contextlib import closing
+from contextvars import ContextVar
 from urllib.parse import quote
 
-from fastapi import FastAPI, Request, Form, UploadFile, File
+from fastapi import FastAPI, Request, Form, Query, UploadFile, File
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from starlette.responses import RedirectResponse, StreamingResponse, JSONResponse
+from starlette.responses import FileResponse, RedirectResponse, StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 
+from app.utils import analytics, categories, hashing, incr_backup, jobs, jsonstore, metrics, periods, pivot, profiling, series, sqlstats, tenants, xlsx
+
 APP_DIR = Path(__file__).resolve().parent
-DB_PATH = APP_DIR / "aurum.db"
-AUTH_PATH = APP_DIR / "auth.json"
+# 可用環境變數指到別的檔案（效能測試 / 多環境）；預設仍是 app/aurum.db、app/auth.json
+DB_PATH = Path(os.getenv("AURUM_DB") or APP_DIR / "aurum.db")
+AUTH_PATH = Path(os.getenv("AURUM_AUTH") or APP_DIR / "auth.json")
+# 多門市：各店 DB 列在 stores.json（格式見 app/utils/tenants.py）；檔案不存在 = 單店，只用 DB_PATH
+STORES_PATH = Path(os.getenv("AURUM_STORES") or APP_DIR / "stores.json")
+# 背景工作（大量匯出、整包備份）：佇列與產出檔預設在 <aurum.db>.jobs/
+JOBS_DIR = Path(os.getenv("AURUM_JOBS_DIR") or jobs.default_dir_for(DB_PATH))
 
 # 保持你的設定（支援 ROOT_PATH、會話）
 app = FastAPI(root_path=os.getenv("ROOT_PATH", ""))
+
+class _StoreMiddleware:
+    """
+    掛在 SessionMiddleware 之內：依 session 的門市設定本請求的 _STORE，並佔用該店一個併發名額；
+    名額滿回 429（只擋這家門市），session 的門市已不在設定檔 → 回登入頁。
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(_STORELESS_PATHS):
+            return await self.app(scope, receive, send)
+        store = scope.get("session", {}).get("store") or tenants.DEFAULT_STORE
+        try:
+            t = await run_in_threadpool(TENANTS.get, store)     # 第一次開店要初始化 schema，不佔事件迴圈
+        except tenants.UnknownStore:
+            scope.get("session", {}).clear()
+            return await RedirectResponse("/login", status_code=303)(scope, receive, send)
+        slot = t.aslot(TENANTS.wait)
+        try:
+            st = await slot.__aenter__()
+        except tenants.TenantBusy as e:
+            return await JSONResponse({"ok": False, "msg": "store busy"}, status_code=429,
+                                      headers={"Retry-After": str(e.retry_after)})(scope, receive, send)
+        token = _STORE.set(st)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _STORE.reset(token)
+            await slot.__aexit__(None, None, None)
+
+_STORELESS_PATHS = ("/login", "/logout", "/static", "/metrics")   # 不碰門市資料庫
+app.add_middleware(_StoreMiddleware)                               # 先加 = 在 SessionMiddleware 之內
 app.add_middleware(SessionMiddleware, secret_key="CHANGE_ME_32+CHARS")
+_metrics = metrics.install(app, name="web_ui")   # GET /metrics；raw sqlite3 無連線池，只有 threadpool / 雜湊佇列 / 門市 gauge
+sqlstats.install(app)                 # 每請求 SQL 條數 / 時間；連線由 _conn() 以 InstrumentedConnection 建立
+profiling.install(app)                # 管理員單次剖析；未設定 AURUM_PROFILE_KEY 時不掛
 
 templates = Jinja2Templates(directory=str(APP_DIR / "templates"))
 templates.env.filters["money"] = lambda v: f"{float(v):,.0f}" if v not in (None, "", "None") else "0"
 app.mount("/static", StaticFiles(directory=str(APP_DIR / "static")), name="static")
 
 # ---------------- DB ----------------
-def _conn() -> sqlite3.Connection:
-    c = sqlite3.connect(DB_PATH)
+# 訂單清單排序：同日早班在前、晚班在後；索引 idx_orders_sort 用同一個運算式，排序與分頁都走索引
+SHIFT_RANK_SQL = "CASE WHEN shift='早班' THEN 0 ELSE 1 END"
+ORDERS_PAGE_SIZE = 100
+
+def _conn(path: Optional[Path] = None, **kw) -> sqlite3.Connection:
+    """path 省略 = 本請求的門市（單店時即 DB_PATH）。"""
+    c = sqlite3.connect(path or _db_path(), factory=sqlstats.InstrumentedConnection, **kw)
     c.row_factory = sqlite3.Row
     return c
 
-def _init_db() -> None:
-    with _conn() as c:
+def _init_db(path: Optional[Path] = None) -> None:
+    path = Path(path or _db_path())
+    # 舊檔 expenses.cat 仍是分類字串 → 改存 expense_categories 的整數 id（cat_id），其餘結構不變
+    if path.exists():
+        categories.migrate_sqlite(str(path), "cat", "cat_id")
+    with _conn(path) as c:
+        c.execute(categories.DDL)
         c.execute("""CREATE TABLE IF NOT EXISTS orders(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             shift TEXT NOT NULL,
@@ -42,7 +98,7 @@ def _init_db() -> None:
         )""")
         c.execute("""CREATE TABLE IF NOT EXISTS expenses(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            cat TEXT NOT NULL,
+            cat_id INTEGER NOT NULL REFERENCES expense_categories(id),
             amount INTEGER NOT NULL,
             odt TEXT NOT NULL,
             memo TEXT DEFAULT '',
@@ -53,29 +109,100 @@ def _init_db() -> None:
         c.execute("CREATE INDEX IF NOT EXISTS idx_orders_order_no ON orders(order_no)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_orders_amount   ON orders(amount)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_odt    ON expenses(odt)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_odt_cat ON expenses(odt, cat_id, amount)")   # 分類樞紐表用，covering
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_orders_sort    ON orders(odt DESC, ({SHIFT_RANK_SQL}), id)")
         c.commit()
-_init_db()
+
+# ---------------- 門市（tenant） ----------------
+class _Store:
+    """一家門市：DB 檔、分類 id 快取（新增 / 編輯支出時以名稱換 cat_id）、增量備份目錄。"""
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.categories = categories.CategoryCache(lambda: _conn(self.path))
+
+    @property
+    def backups(self) -> Path:
+        return BACKUP_STORE if self.path == DB_PATH else incr_backup.default_store_for(self.path)
+
+def _open_store(_store_id: str, path: str) -> _Store:
+    _init_db(Path(path))
+    return _Store(Path(path))
+
+TENANTS = tenants.TenantRouter(tenants.StoreMap(STORES_PATH, lambda: DB_PATH), _open_store,
+                               pinned={tenants.DEFAULT_STORE})
+_STORE: ContextVar[Optional[_Store]] = ContextVar("aurum_store", default=None)
+_metrics.gauge("aurum_tenant_requests", "各門市進行中的請求 / 上限 / 累計拒絕數", TENANTS.samples)
+
+def _store() -> _Store:
+    """本請求的門市；請求以外（啟動、批次腳本）為 default。"""
+    return _STORE.get() or TENANTS.get(tenants.DEFAULT_STORE).resource
+
+def _db_path() -> Path:
+    st = _STORE.get()
+    return st.path if st else DB_PATH
+
+_init_db(DB_PATH)
+
+# ---------------- 背景工作 ----------------
+JOBS = jobs.JobQueue(JOBS_DIR, name="web-jobs")
+_metrics.gauge("aurum_jobs", "背景工作數（依狀態）",
+               lambda: [({"status": s}, float(JOBS.stats()[s])) for s in jobs.STATUSES])
+
+def _job(kind: str, max_attempts: int = jobs.MAX_ATTEMPTS):
+    """註冊背景工作：執行時佔該門市一個併發名額並設定 _STORE，處理函式裡的 _conn() / _db_path() 照常可用。"""
+    def deco(fn):
+        def run(ctx: jobs.JobContext, **params):
+            with TENANTS.slot(ctx.store) as st:
+                token = _STORE.set(st)
+                try:
+                    return fn(ctx, **params)
+                finally:
+                    _STORE.reset(token)
+        JOBS.register(kind, run, max_attempts)
+        return fn
+    return deco
+
+def _enqueue(request: Request, kind: str, params: Dict[str, Any]):
+    """
+    ?async=1：排入背景工作。fetch（Accept: application/json）回 202 + 工作狀態，Location 指向查詢端點；
+    一般表單 / 連結導到 /jobs 看進度與下載。
+    """
+    job = JOBS.enqueue(kind, params, store=request.session.get("store") or tenants.DEFAULT_STORE,
+                       owner=request.session.get("user") or "")
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse({"ok": True, "job": job, "url": f"/jobs/{job['id']}"}, status_code=202,
+                            headers={"Location": f"/jobs/{job['id']}"})
+    return RedirectResponse(f"/jobs?new={job['id']}", status_code=303)
+
+@app.on_event("startup")
+def _start_jobs():
+    JOBS.start()                        # 上次中斷（重啟 / 當機）的工作在這裡收回重排
+
+@app.on_event("shutdown")
+def _stop_jobs():
+    JOBS.stop()
+
+# 讀取一律 JOIN expense_categories 取回分類名稱
+EXPENSE_SELECT = "SELECT e.id, k.name AS cat, e.amount, e.odt, e.memo, e.ctime FROM expenses e JOIN expense_categories k ON k.id = e.cat_id"
 
 # -------------- Auth helpers --------------
-def _hash_pbkdf2(pw: str, salt: bytes | None = None) -> str:
+# PBKDF2 在雜湊專用 process pool 執行（app/utils/hashing.py），佇列滿時丟 HashBusy → 429
+async def _hash_pbkdf2(pw: str, salt: bytes | None = None) -> str:
     if salt is None: salt = os.urandom(16)
-    dk = hashlib.pbkdf2_hmac("sha256", pw.encode("utf-8"), salt, 120_000)
+    dk = await hashing.pbkdf2_sha256(pw, salt, 120_000)
     return "pbkdf2$120000$%s$%s" % (base64.b64encode(salt).decode(), base64.b64encode(dk).decode())
 
-def _verify_pbkdf2(pw: str, stored: str) -> bool:
+async def _verify_pbkdf2(pw: str, stored: str) -> bool:
     try:
         _, rounds, b64salt, b64hash = stored.split("$")
-        salt = base64.b64decode(b64salt); expect = base64.b64decode(b64hash)
-        dk = hashlib.pbkdf2_hmac("sha256", pw.encode("utf-8"), salt, int(rounds))
-        return hmac.compare_digest(dk, expect)
+        salt = base64.b64decode(b64salt); expect = base64.b64decode(b64hash); rounds = int(rounds)
     except Exception:
         return False
+    return await hashing.pbkdf2_verify(pw, salt, rounds, expect)
 
+# auth.json 經 jsonstore 快取：每次只 stat，檔案有變才重新解析；寫入為原子替換
 def _load_auth() -> Optional[Dict[str,str]]:
-    if AUTH_PATH.exists():
-        with open(AUTH_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return None
+    return jsonstore.store_for(AUTH_PATH).load()
 
 def _save_auth(username: str, pw_hash: str, kpi_pin_hash: Optional[str] = None) -> None:
     old = _load_auth() or {}
@@ -84,8 +211,7 @@ def _save_auth(username: str, pw_hash: str, kpi_pin_hash: Optional[str] = None)
         "pw_hash": pw_hash,
         "kpi_pin_hash": kpi_pin_hash or old.get("kpi_pin_hash")
     }
-    with open(AUTH_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    jsonstore.store_for(AUTH_PATH).save(data)
 
 # -------------- helpers --------------
 def _today() -> str:
@@ -100,7 +226,10 @@ def _to_int(s: Optional[str]) -> Optional[int]:
     except Exception: return None
 
 def _ctx(request: Request, extra: Dict[str, Any] | None = None) -> Dict[str, Any]:
-    base = {"request": request, "user": request.session.get("user")}
+    store = request.session.get("store") or tenants.DEFAULT_STORE
+    base = {"request": request, "user": request.session.get("user"),
+            "store": store, "store_name": TENANTS.stores.name(store),
+            "stores": [(s, TENANTS.stores.name(s)) for s in TENANTS.stores.ids()]}
     if extra: base.update(extra)
     return base
 
@@ -150,7 +279,26 @@ def _nav(mode: str, dt: Optional[str]) -> Dict[str,str]:
 def root():
     return RedirectResponse("/orders")
 
+# SQLite 寫鎖逾時：回 503 + Retry-After（表內編輯的批次佇列會把格子還原，使用者可再試）
+@app.exception_handler(sqlite3.OperationalError)
+async def _db_operational(request: Request, exc: sqlite3.OperationalError):
+    if "locked" in str(exc).lower():
+        return JSONResponse({"ok": False, "msg": "database is locked"}, status_code=503, headers={"Retry-After": "1"})
+    return JSONResponse({"ok": False, "msg": "database error"}, status_code=500)
+
 # ---------- Auth ----------
+# 雜湊佇列滿：回 429 並留在原頁面顯示提示，不讓登入尖峰拖垮其他請求
+_BUSY_PAGES = {"/kpi/guard": "kpi_pin.html", "/account/update": "account.html"}
+
+@app.exception_handler(hashing.HashBusy)
+async def _hash_busy(request: Request, exc: hashing.HashBusy):
+    page = _BUSY_PAGES.get(request.url.path, "login.html")
+    extra = {"error": "目前登入人數較多，請稍後再試。"}
+    if page == "login.html": extra.update(first_setup=False, auth_only=True, remembered="")
+    if page == "account.html": extra["username"] = request.session.get("user", "")
+    return templates.TemplateResponse(page, _ctx(request, extra), status_code=429,
+                                      headers={"Retry-After": str(exc.retry_after)})
+
 @app.get("/login")
 def login_page(request: Request):
     first_setup = _load_auth() is None
@@ -159,23 +307,33 @@ def login_page(request: Request):
         _ctx(request, {"first_setup": first_setup, "auth_only": True, "remembered": remembered}))
 
 @app.post("/login")
-def login_submit(request: Request, username: str = Form(...), password: str = Form(...),
-                 remember: Optional[str] = Form(None), mode: str = Form("login")):
-    auth = _load_auth()
+async def login_submit(request: Request, username: str = Form(...), password: str = Form(...),
+                 remember: Optional[str] = Form(None), mode: str = Form("login"),
+                 store: str = Form(tenants.DEFAULT_STORE)):
+    try:
+        TENANTS.stores.db_path(store)
+        allowed = TENANTS.stores.allows(store, username)
+    except tenants.UnknownStore:
+        allowed = False
+    if not allowed:
+        return templates.TemplateResponse("login.html",
+            _ctx(request, {"error":"無此門市或沒有該門市的權限。","first_setup":await run_in_threadpool(_load_auth) is None,
+                           "auth_only":True,"remembered":username}))
+    auth = await run_in_threadpool(_load_auth)
     if auth is None or mode == "setup":
         if not username or not password:
             return RedirectResponse("/login", status_code=303)
-        _save_auth(username, _hash_pbkdf2(password), None)
+        await run_in_threadpool(_save_auth, username, await _hash_pbkdf2(password), None)
         resp = RedirectResponse("/orders", status_code=303)
         if remember: resp.set_cookie("remember_user", username, max_age=30*86400)
         else: resp.delete_cookie("remember_user")
-        request.session.clear(); request.session["user"] = username
+        request.session.clear(); request.session["user"] = username; request.session["store"] = store
         return resp
-    if username == auth.get("username") and _verify_pbkdf2(password, auth.get("pw_hash","")):
+    if username == auth.get("username") and await _verify_pbkdf2(password, auth.get("pw_hash","")):
         resp = RedirectResponse("/orders", status_code=303)
         if remember: resp.set_cookie("remember_user", username, max_age=30*86400)
         else: resp.delete_cookie("remember_user")
-        request.session.clear(); request.session["user"] = username
+        request.session.clear(); request.session["user"] = username; request.session["store"] = store
         return resp
     return templates.TemplateResponse("login.html",
         _ctx(request, {"error":"帳號或密碼錯誤。","first_setup":False,"auth_only":True,"remembered":username}))
@@ -196,16 +354,16 @@ def account_page(request: Request):
     return templates.TemplateResponse("account.html", _ctx(request, {"username": auth.get("username","")}))
 
 @app.post("/account/update")
-def account_update(request: Request, current_password: str = Form(...),
+async def account_update(request: Request, current_password: str = Form(...),
                    new_username: str = Form(""), new_password: str = Form(""), new_kpi_pin: str = Form("")):
     if _need_login(request): return RedirectResponse("/login", status_code=303)
-    auth = _load_auth() or {}
-    if not _verify_pbkdf2(current_password, auth.get("pw_hash","")):
+    auth = await run_in_threadpool(_load_auth) or {}
+    if not await _verify_pbkdf2(current_password, auth.get("pw_hash","")):
         return templates.TemplateResponse("account.html", _ctx(request, {"username":auth.get("username",""), "error":"目前密碼不正確。"}))
     uname = new_username.strip() or auth.get("username","")
-    pwh  = _hash_pbkdf2(new_password.strip()) if new_password.strip() else auth.get("pw_hash","")
-    kpin = _hash_pbkdf2(new_kpi_pin.strip()) if new_kpi_pin.strip() else auth.get("kpi_pin_hash")
-    _save_auth(uname, pwh, kpin); request.session["user"] = uname; request.session.pop("kpi_ok", None)
+    pwh  = await _hash_pbkdf2(new_password.strip()) if new_password.strip() else auth.get("pw_hash","")
+    kpin = await _hash_pbkdf2(new_kpi_pin.strip()) if new_kpi_pin.strip() else auth.get("kpi_pin_hash")
+    await run_in_threadpool(_save_auth, uname, pwh, kpin); request.session["user"] = uname; request.session.pop("kpi_ok", None)
     return templates.TemplateResponse("account.html", _ctx(request, {"username":uname, "ok":"已更新。"}))
 
 # ---------- KPI guard ----------
@@ -215,19 +373,24 @@ def kpi_guard(request: Request):
     return templates.TemplateResponse("kpi_pin.html", _ctx(request, {}))
 
 @app.post("/kpi/guard")
-def kpi_guard_go(request: Request, pin: str = Form(...)):
+async def kpi_guard_go(request: Request, pin: str = Form(...)):
     if _need_login(request): return RedirectResponse("/login", status_code=303)
-    auth = _load_auth() or {}
-    if auth.get("kpi_pin_hash") and _verify_pbkdf2(pin, auth["kpi_pin_hash"]):
+    auth = await run_in_threadpool(_load_auth) or {}
+    if auth.get("kpi_pin_hash") and await _verify_pbkdf2(pin, auth["kpi_pin_hash"]):
         request.session["kpi_ok"] = True
         return RedirectResponse("/kpi", status_code=303)
     return templates.TemplateResponse("kpi_pin.html", _ctx(request, {"error":"二次密碼錯誤。"}))
 
 # ---------- Orders ----------
-@app.get("/orders")
-def orders_page(request: Request, q: Optional[str] = None,
-                from_: Optional[str] = None, to: Optional[str] = None):
-    if _need_login(request): return RedirectResponse("/login", status_code=303)
+def _orders_cursor(r: Dict[str, Any]) -> str:
+    return f'{r["odt"]}|{0 if r["shift"] == "早班" else 1}|{r["id"]}'
+
+def _orders_query(q: Optional[str], from_: Optional[str], to: Optional[str],
+                  after: Optional[str] = None, limit: int = ORDERS_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    keyset 分頁：after = 上一頁最後一列的 "odt|班別序|id"。
+    回傳 (rows, next_cursor)；沒有下一頁時 next_cursor 為 None。
+    """
     sql = "SELECT id,shift,order_no,amount,odt FROM orders"
     where, params = [], []
     if q and q.strip():
@@ -238,16 +401,45 @@ def orders_page(request: Request, q: Optional[str] = None,
             where.append("(order_no LIKE ?)"); params += [f"%{q.strip()}%"]
     if from_: where.append("odt>=?"); params.append(from_)
     if to:    where.append("odt<=?"); params.append(to)
+    if after:
+        try:
+            a_odt, a_rank, a_id = after.split("|")
+            a_rank, a_id = int(a_rank), int(a_id)
+        except ValueError:
+            a_odt = None
+        if a_odt:
+            # 先以 odt<=? 限縮索引範圍，再比 (班別序, id)
+            where.append(f"odt<=? AND (odt<? OR {SHIFT_RANK_SQL}>? OR ({SHIFT_RANK_SQL}=? AND id>?))")
+            params += [a_odt, a_odt, a_rank, a_rank, a_id]
     if where: sql += " WHERE " + " AND ".join(where)
     # 同日：早班在前、晚班在後；同班別 id 由小到大 → 新增列自然在該班別最尾端
-    sql += " ORDER BY odt DESC, CASE WHEN shift='早班' THEN 0 ELSE 1 END, id ASC"
+    sql += f" ORDER BY odt DESC, {SHIFT_RANK_SQL}, id ASC LIMIT ?"
+    params.append(limit + 1)
     with _conn() as c:
         rows = [dict(r) for r in c.execute(sql, params)]
-        for i, r in enumerate(rows): r["idx"] = i
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (_orders_cursor(rows[-1]) if more and rows else None)
+
+@app.get("/orders")
+def orders_page(request: Request, q: Optional[str] = None,
+                from_: Optional[str] = None, to: Optional[str] = None):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
+    # 只渲染第一屏；其餘由 app.js 捲動時向 /orders/rows 取
+    rows, nxt = _orders_query(q, from_, to)
+    for i, r in enumerate(rows): r["idx"] = i
     return templates.TemplateResponse("orders.html", _ctx(request, {
-        "orders": rows, "today": _today(), "q": q or "", "from_": from_ or "", "to": to or ""
+        "orders": rows, "today": _today(), "q": q or "", "from_": from_ or "", "to": to or "",
+        "next_cursor": nxt or ""
     }))
 
+@app.get("/orders/rows")
+def orders_rows(request: Request, q: Optional[str] = None, from_: Optional[str] = None,
+                to: Optional[str] = None, after: Optional[str] = None, limit: int = ORDERS_PAGE_SIZE):
+    if _need_login(request): return JSONResponse({"ok": False, "msg": "auth"}, status_code=403)
+    rows, nxt = _orders_query(q, from_, to, after, max(1, min(limit, 500)))
+    return JSONResponse({"ok": True, "rows": rows, "next": nxt})
+
 @app.post("/orders/create")
 def orders_create(request: Request, odt: str = Form(...), shift: str = Form(...),
                   order_no: str = Form(...), amount: str = Form(...)):
@@ -265,24 +457,98 @@ def orders_create(request: Request, odt: str = Form(...), shift: str = Form(...)
     # ★ 關鍵修正：導回「當天」範圍，讓新單顯示在該班別最尾端，並聚焦新增區
     return RedirectResponse(f"/orders?from_={odt}&to={odt}#create", status_code=303)
 
+# ---------- 表內編輯：欄位正規化（單筆 update-json 與批次 update-batch 共用） ----------
+ORDER_EDIT_FIELDS = {"shift", "order_no", "amount", "odt"}
+EXPENSE_EDIT_FIELDS = {"cat", "amount", "odt", "memo"}
+BATCH_MAX_EDITS = 500
+
+def _norm_order_value(field: str, value: str) -> str:
+    if field == "shift":
+        return "早班" if value == "早班" else "晚班"
+    if field == "amount":
+        return str(_to_int(value) or 0)
+    if field == "odt":
+        try: datetime.strptime(value, "%Y-%m-%d")
+        except Exception: return _today()
+    return value
+
+def _norm_expense_value(field: str, value: str) -> str:
+    if field == "cat":
+        return categories.normalize(value)
+    if field == "amount":
+        return str(_to_int(value) or 0)
+    if field == "odt":
+        try: datetime.strptime(value, "%Y-%m-%d")
+        except Exception: return _today()
+    return value
+
+def _store_expense_value(field: str, value: str) -> Tuple[str, Any]:
+    """分類欄位實際寫 cat_id；id 在開寫入交易之前取得（新分類由分類快取另開交易建立）。"""
+    if field == "cat":
+        return "cat_id", _store().categories.id_for(value)
+    return field, value
+
+def _apply_cell_edits(table: str, allowed: set, norm, edits: List[Dict[str, Any]],
+                      store=lambda field, value: (field, value)) -> List[Dict[str, Any]]:
+    """
+    同一個交易內套用多筆欄位修改，逐筆回報結果：
+    {"key", "id", "field", "ok", "value"} 或 {"key", ..., "ok": False, "msg"}
+    store(field, 正規化後的值) → (實際欄位, 寫入值)
+    """
+    results: List[Dict[str, Any]] = []
+    todo: List[Tuple[int, Dict[str, Any], str, Any]] = []
+    for e in edits:
+        res = {"key": e.get("key"), "id": e.get("id"), "field": e.get("field"), "ok": False}
+        results.append(res)
+        try: rid = int(e.get("id"))
+        except Exception: res["msg"] = "id"; continue
+        field = e.get("field")
+        if field not in allowed: res["msg"] = "field"; continue
+        res["value"] = norm(field, str(e.get("value") or "").strip())
+        todo.append((rid, res, *store(field, res["value"])))
+    if not todo:
+        return results
+    try:
+        with _conn() as c:
+            for rid, res, col, val in todo:
+                cur = c.execute(f"UPDATE {table} SET {col}=? WHERE id=?", (val, rid))
+                if cur.rowcount: res["ok"] = True
+                else: res["msg"] = "missing"; res.pop("value", None)
+            c.commit()
+    except sqlite3.Error:
+        for _, res, _, _ in todo:
+            res["ok"] = False; res["msg"] = "db"; res.pop("value", None)
+    return results
+
+async def _read_batch(request: Request) -> Optional[List[Dict[str, Any]]]:
+    try: data = await request.json()
+    except Exception: return None
+    edits = data.get("edits") if isinstance(data, dict) else None
+    if not isinstance(edits, list) or len(edits) > BATCH_MAX_EDITS:
+        return None
+    return [e for e in edits if isinstance(e, dict)]
+
 @app.post("/orders/update-json")
 async def orders_update_json(request: Request):
     if _need_login(request): return JSONResponse({"ok": False, "msg": "auth"}, status_code=403)
     data = await request.json()
     oid, field, value = int(data.get("id")), data.get("field"), (data.get("value") or "").strip()
-    if field not in {"shift","order_no","amount","odt"}:
+    if field not in ORDER_EDIT_FIELDS:
         return JSONResponse({"ok": False, "msg": "field"})
-    if field == "shift":
-        value = "早班" if value == "早班" else "晚班"
-    elif field == "amount":
-        value = str(_to_int(value) or 0)
-    elif field == "odt":
-        try: datetime.strptime(value, "%Y-%m-%d")
-        except: value = _today()
+    value = _norm_order_value(field, value)
     with _conn() as c:
         c.execute(f"UPDATE orders SET {field}=? WHERE id=?", (value, oid)); c.commit()
     return JSONResponse({"ok": True, "value": value})
 
+@app.post("/orders/update-batch")
+async def orders_update_batch(request: Request):
+    if _need_login(request): return JSONResponse({"ok": False, "msg": "auth"}, status_code=403)
+    edits = await _read_batch(request)
+    if edits is None: return JSONResponse({"ok": False, "msg": "edits"}, status_code=400)
+    # 最多 BATCH_MAX_EDITS 筆 UPDATE + commit 是同步 sqlite：丟 threadpool，不卡其他請求
+    results = await run_in_threadpool(_apply_cell_edits, "orders", ORDER_EDIT_FIELDS, _norm_order_value, edits)
+    return JSONResponse({"ok": True, "results": results})
+
 @app.post("/orders/delete")
 async def orders_delete(request: Request):
     if _need_login(request): return RedirectResponse("/login", status_code=303)
@@ -305,11 +571,12 @@ def expenses_page(request: Request, mode: str = "day", dt: Optional[str] = None,
     frm, to, base = _range(mode, dt)
     if start: frm = start
     if end:   to = end
-    where = ["odt BETWEEN ? AND ?"]; params = [frm, to]
+    where = ["e.odt BETWEEN ? AND ?"]; params = [frm, to]
     if q.strip():
-        where.append("(cat LIKE ? OR memo LIKE ?)")
+        # 分類名稱只在維度表上 LIKE，支出比對整數 id
+        where.append("(e.cat_id IN (SELECT id FROM expense_categories WHERE name LIKE ?) OR e.memo LIKE ?)")
         params += [f"%{q.strip()}%", f"%{q.strip()}%"]
-    sql = "SELECT id,cat,amount,odt,memo FROM expenses WHERE " + " AND ".join(where) + " ORDER BY odt DESC, id DESC"
+    sql = EXPENSE_SELECT + " WHERE " + " AND ".join(where) + " ORDER BY e.odt DESC, e.id DESC"
     with _conn() as c:
         rows = [dict(r) for r in c.execute(sql, params)]
     return templates.TemplateResponse("expenses.html", _ctx(request, {
@@ -324,9 +591,10 @@ def expenses_create(request: Request, odt: str = Form(...), cat: str = Form(...)
     try: datetime.strptime(odt, "%Y-%m-%d")
     except: odt = _today()
     amt = _to_int(amount) or 0
+    cat_id = _store().categories.id_for(cat)
     with _conn() as c:
-        c.execute("INSERT INTO expenses (cat,amount,odt,memo,ctime) VALUES(?,?,?,?,?)",
-                  (cat.strip() or "未分類", amt, odt, memo.strip(), datetime.utcnow().isoformat()))
+        c.execute("INSERT INTO expenses (cat_id,amount,odt,memo,ctime) VALUES(?,?,?,?,?)",
+                  (cat_id, amt, odt, memo.strip(), datetime.utcnow().isoformat()))
         c.commit()
     return RedirectResponse("/expenses", status_code=303)
 
@@ -352,18 +620,25 @@ async def expenses_update_json(request: Request):
     eid   = int(data.get("id"))
     field = data.get("field")
     value = (data.get("value") or "").strip()
-    if field not in {"cat", "amount", "odt", "memo"}:
+    if field not in EXPENSE_EDIT_FIELDS:
         return JSONResponse({"ok": False, "msg": "field"})
-    if field == "amount":
-        value = str(_to_int(value) or 0)
-    elif field == "odt":
-        try: datetime.strptime(value, "%Y-%m-%d")
-        except Exception: value = _today()
+    value = _norm_expense_value(field, value)
+    col, val = _store_expense_value(field, value)
     with _conn() as c:
-        c.execute(f"UPDATE expenses SET {field}=? WHERE id=?", (value, eid))
+        c.execute(f"UPDATE expenses SET {col}=? WHERE id=?", (val, eid))
         c.commit()
     return JSONResponse({"ok": True, "value": value})
 
+@app.post("/expenses/update-batch")
+async def expenses_update_batch(request: Request):
+    if _need_login(request):
+        return JSONResponse({"ok": False, "msg": "auth"}, status_code=403)
+    edits = await _read_batch(request)
+    if edits is None: return JSONResponse({"ok": False, "msg": "edits"}, status_code=400)
+    results = await run_in_threadpool(_apply_cell_edits, "expenses", EXPENSE_EDIT_FIELDS, _norm_expense_value, edits,
+                                      _store_expense_value)     # 新分類寫入也在這裡
+    return JSONResponse({"ok": True, "results": results})
+
 # ---------- KPI ----------
 @app.get("/kpi")
 def kpi_page(request: Request, mode: str = "day", dt: Optional[str] = None):
@@ -383,41 +658,138 @@ def kpi_page(request: Request, mode: str = "day", dt: Optional[str] = None):
     }))
 
 # ---------- Reports（export only, UTF-8 BOM + CRLF） ----------
-def _csv_response(filename_ascii: str, lines: List[str]):
+def _csv_body(lines: Iterable[str]):
+    yield "\ufeff"  # BOM
+    for ln in lines:
+        if not ln.endswith("\r\n"): ln = ln.rstrip("\n") + "\r\n"
+        yield ln
+
+def _csv_response(filename_ascii: str, lines: Iterable[str]):
     headers = {
         "Content-Disposition": f"attachment; filename={filename_ascii}; filename*=UTF-8''{quote(filename_ascii)}"
     }
+    return StreamingResponse(_csv_body(lines), media_type="text/csv; charset=utf-8", headers=headers)
+
+def _csv_artifact(ctx: jobs.JobContext, filename: str, lines: Iterable[str]) -> Dict[str, Any]:
+    """背景工作版：同樣的內容寫到工作的產出檔。"""
+    path = ctx.artifact(filename, "text/csv; charset=utf-8")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.writelines(_csv_body(lines))
+    return {"rows": ctx.done, "bytes": path.stat().st_size}
+
+def _stream_rows(sql: str, args: Tuple[Any, ...]):
+    """
+    匯出用：邊讀 cursor 邊產出，不先收成 list。連線在產生器內開關（門市路徑先取好）；
+    StreamingResponse 逐批取資料可能換 threadpool 執行緒，同一時間只有一條在讀 → check_same_thread=False
+    """
+    path = _db_path()
     def gen():
-        yield "\ufeff"  # BOM
-        for ln in lines:
-            if not ln.endswith("\r\n"): ln = ln.rstrip("\n") + "\r\n"
-            yield ln
-    return StreamingResponse(gen(), media_type="text/csv; charset=utf-8", headers=headers)
+        with closing(_conn(path, check_same_thread=False)) as c:
+            yield from c.execute(sql, args)
+    return gen()
+
+def _count_rows(frm: str, to: str, tables: Iterable[str] = ("orders", "expenses")) -> int:
+    """期間內列數（背景工作的進度分母；走 odt 索引）。"""
+    with _conn() as c:
+        return sum(c.execute(f"SELECT COUNT(*) FROM {t} WHERE odt BETWEEN ? AND ?", (frm, to)).fetchone()[0]
+                   for t in tables)
+
+def _no_track(rows, _label: str):
+    return rows
+
+ORDER_EXPORT_SQL = "SELECT id,shift,order_no,amount,odt,ctime FROM orders WHERE odt BETWEEN ? AND ? ORDER BY odt,id"
+EXPENSE_EXPORT_SQL = EXPENSE_SELECT + " WHERE e.odt BETWEEN ? AND ? ORDER BY e.odt, e.id"
+
+def _orders_csv(frm: str, to: str, track=_no_track) -> Iterable[str]:
+    rows = track(_stream_rows(ORDER_EXPORT_SQL, (frm, to)), "訂單 ")
+    lines = (f'{r["id"]},{r["shift"]},{r["order_no"]},{r["amount"]},{r["odt"]},{r["ctime"]}' for r in rows)
+    return itertools.chain(["id,班別,單號,金額,日期,建立時間"], lines)
+
+def _expenses_csv(frm: str, to: str, track=_no_track) -> Iterable[str]:
+    rows = track(_stream_rows(EXPENSE_EXPORT_SQL, (frm, to)), "支出 ")
+    lines = (f'{r["id"]},{r["cat"]},{r["amount"]},{r["odt"]},{(r["memo"] or "").replace(",", "，")},{r["ctime"]}'
+             for r in rows)
+    return itertools.chain(["id,類別,金額,日期,備註,建立時間"], lines)
+
+def _compare_rows(mode: str, base: date, n: int) -> List[Dict[str, Any]]:
+    """N 期比較：期間表 CTE 各 JOIN 訂單 / 支出一次，整段一條 SQL。"""
+    bks = periods.buckets(mode, base, n)
+    cte = " UNION ALL ".join("SELECT ?,?,?" for _ in bks)
+    args: List[Any] = [v for i, (_l, d1, d2) in enumerate(bks) for v in (i, d1.isoformat(), d2.isoformat())]
+    sql = f"""
+        WITH p(idx,d1,d2) AS ({cte}),
+        o AS (SELECT p.idx,
+                     SUM(CASE WHEN o.shift='早班' THEN o.amount ELSE 0 END) m,
+                     SUM(CASE WHEN o.shift='晚班' THEN o.amount ELSE 0 END) e
+              FROM p JOIN orders o ON o.odt BETWEEN p.d1 AND p.d2 GROUP BY p.idx),
+        x AS (SELECT p.idx, SUM(x.amount) v FROM p JOIN expenses x ON x.odt BETWEEN p.d1 AND p.d2 GROUP BY p.idx)
+        SELECT p.idx, COALESCE(o.m,0) m, COALESCE(o.e,0) e, COALESCE(x.v,0) v
+        FROM p LEFT JOIN o ON o.idx=p.idx LEFT JOIN x ON x.idx=p.idx ORDER BY p.idx"""
+    out: List[Dict[str, Any]] = []
+    with _conn() as c:
+        for r in c.execute(sql, args):
+            label, d1, d2 = bks[r["idx"]]
+            total = r["m"] + r["e"]
+            row = {"label": label, "frm": d1.isoformat(), "to": d2.isoformat(), "early": r["m"], "late": r["e"],
+                   "total": total, "exp": r["v"], "net": total - r["v"]}
+            prev = out[-1] if out else None
+            row["d_total"], row["d_total_pct"] = periods.delta(total, prev and prev["total"])
+            row["d_net"], row["d_net_pct"] = periods.delta(row["net"], prev and prev["net"])
+            out.append(row)
+    return out
+
+def _expense_pivot(mode: str, base: date) -> Dict[str, Any]:
+    """支出 期間 × 分類：當年以月為列，其餘以日為列；一條 GROUP BY 期間, cat_id，彙總後才 JOIN 分類名稱。"""
+    frm, to, _ = _range(mode, base.isoformat())
+    grain = "month" if mode == "year" else "day"
+    period = "substr(odt,1,7)" if grain == "month" else "odt"
+    with _conn() as c:
+        rows = c.execute(f"""SELECT a.p, k.name, a.v FROM (
+                                SELECT {period} p, cat_id, SUM(amount) v FROM expenses
+                                WHERE odt BETWEEN ? AND ? GROUP BY 1, cat_id) a
+                             JOIN expense_categories k ON k.id = a.cat_id""", (frm, to)).fetchall()
+    return pivot.build(rows, date.fromisoformat(frm), date.fromisoformat(to), grain)
 
 @app.get("/reports")
-def reports_page(request: Request, mode: str = "day", dt: Optional[str] = None):
+def reports_page(request: Request, mode: str = "day", dt: Optional[str] = None, n: int = 6):
     if _need_login(request): return RedirectResponse("/login", status_code=303)
     _, _, base = _range(mode, dt); nav = _nav(mode, dt)
-    return templates.TemplateResponse("reports.html", _ctx(request, {"mode": mode, "dt": base.isoformat(), "nav": nav}))
+    n = max(1, min(n, periods.MAX_PERIODS))
+    # 比較表含營收 / 淨額，與 KPI 同樣要過二次密碼
+    cmp_rows = _compare_rows(mode, base, n) if request.session.get("kpi_ok") and mode in periods.MODES else None
+    pv = _expense_pivot(mode, base) if mode in periods.MODES else None
+    return templates.TemplateResponse("reports.html", _ctx(request, {
+        "mode": mode, "dt": base.isoformat(), "nav": nav, "n": n, "cmp_rows": cmp_rows, "pv": pv}))
 
 @app.get("/export/orders.csv")
-def export_orders_csv(scope: str = "day", base: Optional[str] = None):
+def export_orders_csv(request: Request, scope: str = "day", base: Optional[str] = None,
+                      async_: int = Query(0, alias="async")):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
     frm, to, d = _range(scope, base)
-    lines = ["id,班別,單號,金額,日期,建立時間"]
-    with _conn() as c:
-        for r in c.execute("SELECT id,shift,order_no,amount,odt,ctime FROM orders WHERE odt BETWEEN ? AND ? ORDER BY odt,id", (frm,to)):
-            lines.append(f'{r["id"]},{r["shift"]},{r["order_no"]},{r["amount"]},{r["odt"]},{r["ctime"]}')
-    return _csv_response(f"orders_{scope}_{d}.csv", lines)
+    if async_:
+        return _enqueue(request, "export.orders_csv", {"scope": scope, "base": d.isoformat()})
+    return _csv_response(f"orders_{scope}_{d}.csv", _orders_csv(frm, to))
 
 @app.get("/export/expenses.csv")
-def export_expenses_csv(scope: str = "day", base: Optional[str] = None):
+def export_expenses_csv(request: Request, scope: str = "day", base: Optional[str] = None,
+                        async_: int = Query(0, alias="async")):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
     frm, to, d = _range(scope, base)
-    lines = ["id,類別,金額,日期,備註,建立時間"]
-    with _conn() as c:
-        for r in c.execute("SELECT id,cat,amount,odt,memo,ctime FROM expenses WHERE odt BETWEEN ? AND ? ORDER BY odt,id", (frm,to)):
-            memo = (r["memo"] or "").replace(",", "，")
-            lines.append(f'{r["id"]},{r["cat"]},{r["amount"]},{r["odt"]},{memo},{r["ctime"]}')
-    return _csv_response(f"expenses_{scope}_{d}.csv", lines)
+    if async_:
+        return _enqueue(request, "export.expenses_csv", {"scope": scope, "base": d.isoformat()})
+    return _csv_response(f"expenses_{scope}_{d}.csv", _expenses_csv(frm, to))
+
+@_job("export.orders_csv")
+def _job_orders_csv(ctx: jobs.JobContext, scope: str, base: str):
+    frm, to, d = _range(scope, base)
+    ctx.total = _count_rows(frm, to, ["orders"])
+    return _csv_artifact(ctx, f"orders_{scope}_{d}.csv", _orders_csv(frm, to, ctx.track))
+
+@_job("export.expenses_csv")
+def _job_expenses_csv(ctx: jobs.JobContext, scope: str, base: str):
+    frm, to, d = _range(scope, base)
+    ctx.total = _count_rows(frm, to, ["expenses"])
+    return _csv_artifact(ctx, f"expenses_{scope}_{d}.csv", _expenses_csv(frm, to, ctx.track))
 
 @app.get("/export/sales.csv")
 def export_sales_csv(scope: str = "day", base: Optional[str] = None):
@@ -428,12 +800,77 @@ def export_sales_csv(scope: str = "day", base: Optional[str] = None):
     lines = ["期間,營業額,支出,淨利", f"{frm}~{to},{s},{e},{s-e}"]
     return _csv_response(f"sales_{scope}_{d}.csv", lines)
 
+@app.get("/export/expense_pivot.csv")
+def export_expense_pivot_csv(request: Request, scope: str = "month", base: Optional[str] = None):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
+    if scope not in periods.MODES: scope = "month"
+    d = _parse_dt(base)
+    return _csv_response(f"expense_pivot_{scope}_{d}.csv", pivot.csv_lines(_expense_pivot(scope, d)))
+
+def _report_sheets(frm: str, to: str, track=_no_track) -> List[xlsx.Sheet]:
+    """訂單 / 支出 / 每日彙總三張表；各表的列在寫到該表時才查。"""
+    day = lambda s: date.fromisoformat(s) if s else None
+    orders = lambda: ((r["id"], r["shift"], r["order_no"], r["amount"], day(r["odt"]), r["ctime"])
+                      for r in track(_stream_rows(ORDER_EXPORT_SQL, (frm, to)), "訂單 "))
+    expenses = lambda: ((r["id"], r["cat"], r["amount"], day(r["odt"]), r["memo"] or "", r["ctime"])
+                        for r in track(_stream_rows(EXPENSE_EXPORT_SQL, (frm, to)), "支出 "))
+    def daily():
+        # 每日彙總只有「天數」列：GROUP BY 結果直接交給 series.dense 補齊沒有營業的日子
+        rows = list(_stream_rows("""
+            SELECT odt, CASE WHEN shift='早班' THEN 0 ELSE 1 END, SUM(amount) FROM orders
+             WHERE odt BETWEEN ? AND ? GROUP BY odt, shift
+            UNION ALL
+            SELECT odt, 2, SUM(amount) FROM expenses WHERE odt BETWEEN ? AND ? GROUP BY odt""", (frm, to, frm, to)))
+        if not rows: return iter(())
+        d1 = max(date.fromisoformat(frm), min(date.fromisoformat(r[0]) for r in rows))
+        d2 = min(date.fromisoformat(to), max(date.fromisoformat(r[0]) for r in rows))
+        s = series.dense(d1, d2, "day", rows)
+        return zip(map(day, s["dates"]), s["morning"], s["evening"], s["total"], s["expense"], s["net"])
+    return [
+        xlsx.Sheet("訂單", ["id", "班別", "單號", "金額", "日期", "建立時間"], orders,
+                   widths=[8, 8, 16, 12, 12, 22], money=[3]),
+        xlsx.Sheet("支出", ["id", "類別", "金額", "日期", "備註", "建立時間"], expenses,
+                   widths=[8, 14, 12, 12, 30, 22], money=[2]),
+        xlsx.Sheet("每日彙總", ["日期", "早班", "晚班", "營業額", "支出", "淨利"], daily,
+                   widths=[12, 12, 12, 12, 12, 12], money=[1, 2, 3, 4, 5]),
+    ]
+
+@app.get("/export/report.xlsx")
+def export_report_xlsx(request: Request, scope: str = "month", base: Optional[str] = None,
+                       async_: int = Query(0, alias="async")):
+    """訂單 / 支出 / 每日彙總三張表的 Excel；邊查邊寫、邊壓縮邊送出，記憶體與筆數無關。"""
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
+    frm, to, d = _range(scope, base)
+    if async_:
+        return _enqueue(request, "export.report_xlsx", {"scope": scope, "base": d.isoformat()})
+    fname = f"report_{scope}_{d}.xlsx"
+    headers = {"Content-Disposition": f"attachment; filename={fname}; filename*=UTF-8''{quote(fname)}"}
+    return StreamingResponse(xlsx.stream(_report_sheets(frm, to)), media_type=xlsx.MEDIA_TYPE, headers=headers)
+
+@_job("export.report_xlsx")
+def _job_report_xlsx(ctx: jobs.JobContext, scope: str, base: str):
+    frm, to, d = _range(scope, base)
+    ctx.total = _count_rows(frm, to)
+    path = ctx.artifact(f"report_{scope}_{d}.xlsx", xlsx.MEDIA_TYPE)
+    n = xlsx.write(path, _report_sheets(frm, to, ctx.track))
+    return {"rows": n, "bytes": path.stat().st_size}
+
 # ---------- AI Assistant ----------
 @app.get("/ai")
 def ai_page(request: Request):
     if _need_login(request): return RedirectResponse("/login", status_code=303)
     return templates.TemplateResponse("ai.html", _ctx(request, {}))
 
+_TREND_WORDS = ("走勢", "趨勢", "預估", "預測", "月底", "移動平均", "均線", "星期幾", "週幾", "淡旺")
+
+def _daily_rows() -> List[Tuple[str, int, float]]:
+    """analytics 用：每日 × (早班 0 / 晚班 1 / 支出 2) 的全歷史彙總，一條 SQL。"""
+    with _conn() as c:
+        return [tuple(r) for r in c.execute("""
+            SELECT odt, CASE WHEN shift='早班' THEN 0 ELSE 1 END, SUM(amount) FROM orders GROUP BY odt, shift
+            UNION ALL
+            SELECT odt, 2, SUM(amount) FROM expenses GROUP BY odt""")]
+
 @app.post("/ai/analyze")
 def ai_analyze(request: Request, q: str = Form(""), mode: str = Form("auto"),
                start: str = Form(""), end: str = Form("")):
@@ -480,6 +917,18 @@ def ai_analyze(request: Request, q: str = Form(""), mode: str = Form("auto"),
         html.append("</tbody></table>")
         return templates.TemplateResponse("ai.html", _ctx(request, {"answer_html": "".join(html), "q": q}))
 
+    # 走勢 / 預估（全歷史每日彙總快取在行程內，DB 有寫入才重查）
+    if any(k in txt for k in _TREND_WORDS):
+        s = analytics.summary(analytics.cache.get(str(_db_path()), _daily_rows))
+        html = ["<h3>本月走勢與預估</h3><div class='card'><ul>"]
+        html += [f"<li>{ln}</li>" for ln in analytics.brief(s)]
+        html.append("</ul><table class='table'><thead><tr><th>星期</th><th>近 8 週平均</th><th>指數</th></tr></thead><tbody>")
+        for w in s["weekday"]:
+            html.append(f"<tr><td class='center'>週{w['weekday']}</td><td class='center'>{w['mean']:,.0f}</td>"
+                        f"<td class='center'>{w['index']:.2f}</td></tr>")
+        html.append("</tbody></table></div>")
+        return templates.TemplateResponse("ai.html", _ctx(request, {"answer_html": "".join(html), "q": q}))
+
     # 聚合
     early = fetch("SELECT COALESCE(SUM(amount),0) v FROM orders WHERE odt BETWEEN ? AND ? AND shift='早班'", (frm,to))[0]["v"]
     late  = fetch("SELECT COALESCE(SUM(amount),0) v FROM orders WHERE odt BETWEEN ? AND ? AND shift='晚班'", (frm,to))[0]["v"]
@@ -488,8 +937,10 @@ def ai_analyze(request: Request, q: str = Form(""), mode: str = Form("auto"),
     net   = total - exp
 
     if any(k in txt for k in ["top","TOP","Top","TOP3","前三","top3","分類"]):
-        rows = fetch("""SELECT cat, SUM(amount) s FROM expenses
-                        WHERE odt BETWEEN ? AND ? GROUP BY cat ORDER BY s DESC LIMIT 3""", (frm,to))
+        rows = fetch("""SELECT k.name cat, a.s FROM (
+                            SELECT cat_id, SUM(amount) s FROM expenses
+                            WHERE odt BETWEEN ? AND ? GROUP BY cat_id ORDER BY s DESC LIMIT 3) a
+                        JOIN expense_categories k ON k.id = a.cat_id ORDER BY a.s DESC""", (frm,to))
         html = [f"<h3>{tag}TOP3 支出分類</h3><table class='table'><thead><tr><th>分類</th><th>金額</th></tr></thead><tbody>"]
         for r in rows:
             html.append(f"<tr><td class='center'>{r['cat']}</td><td class='center'>{r['s']:,}</td></tr>")
@@ -508,17 +959,52 @@ def ai_analyze(request: Request, q: str = Form(""), mode: str = Form("auto"),
     return templates.TemplateResponse("ai.html", _ctx(request, {"answer_html": "".join(html), "q": q}))
 
 # ===================== 備份 / 還原 =====================
+BACKUP_STORE = incr_backup.default_store_for(DB_PATH)
+
 @app.get("/backup")
 def backup_page(request: Request, ok: str | None = None, err: str | None = None):
     if _need_login(request): return RedirectResponse("/login", status_code=303)
-    return templates.TemplateResponse("backup.html", _ctx(request, {"ok": ok, "error": err}))
+    backups = _store().backups
+    snaps = list(reversed(incr_backup.list_snapshots(backups)))
+    return templates.TemplateResponse("backup.html", _ctx(request, {
+        "ok": ok, "error": err, "snapshots": snaps,
+        "store_mb": round(incr_backup.store_size(backups) / 1048576, 2) if snaps else 0,
+    }))
 
-@app.get("/backup/download")
-def backup_download(request: Request, inc_db: int = 1, inc_auth: int = 1):
+# ---- 增量快照（只存變動的資料塊；與整包 ZIP 並存） ----
+@app.post("/backup/snapshot")
+def backup_snapshot(request: Request, label: str = Form("")):
     if _need_login(request): return RedirectResponse("/login", status_code=303)
+    try:
+        m = incr_backup.snapshot(_db_path(), _store().backups, label=label.strip())
+    except incr_backup.BackupError as e:
+        return RedirectResponse(f"/backup?err={quote('快照失敗：' + str(e))}", status_code=303)
+    msg = f"已建立快照 {m['id']}（新增 {m['new_chunks']}/{len(m['chunks'])} 塊）"
+    return RedirectResponse(f"/backup?ok={quote(msg)}", status_code=303)
 
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
+@app.post("/backup/snapshot/restore")
+def backup_snapshot_restore(request: Request, at: str = Form("latest")):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
+    try:
+        m = incr_backup.restore(_store().backups, at.strip() or "latest", _db_path())
+    except incr_backup.BackupError as e:
+        return RedirectResponse(f"/backup?err={quote('還原失敗：' + str(e))}", status_code=303)
+    # 還原的可能是舊格式快照：分類 id 快取作廢、必要時就地遷移
+    _store().categories.clear(); _init_db()
+    return RedirectResponse(f"/backup?ok={quote('已還原到 ' + m['created'])}", status_code=303)
+
+@app.post("/backup/snapshot/prune")
+def backup_snapshot_prune(request: Request, keep: int = Form(24), days: int = Form(0)):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
+    try:
+        r = incr_backup.prune(_store().backups, keep_last=max(1, keep), keep_days=max(0, days))
+    except incr_backup.BackupError as e:
+        return RedirectResponse(f"/backup?err={quote('清理失敗：' + str(e))}", status_code=303)
+    msg = f"已清理 {r['snapshots_removed']} 份快照，釋放 {r['bytes_freed'] / 1048576:,.2f} MB"
+    return RedirectResponse(f"/backup?ok={quote(msg)}", status_code=303)
+
+def _write_backup(fp, inc_db: int, inc_auth: int, step=lambda _name: None) -> None:
+    with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED) as z:
         # templates
         tpl_dir = APP_DIR / "templates"
         for f in sorted(tpl_dir.glob("*.html")):
@@ -529,29 +1015,88 @@ def backup_download(request: Request, inc_db: int = 1, inc_auth: int = 1):
         # main app file
         z.write(APP_DIR / "web_ui.py", arcname="web_ui.py")
         # db / auth（依選項）
-        if inc_db and DB_PATH.exists(): z.write(DB_PATH, arcname="aurum.db")
+        db_path = _db_path()
+        if inc_db and db_path.exists():
+            step("aurum.db")
+            z.write(db_path, arcname="aurum.db")
         if inc_auth and AUTH_PATH.exists(): z.write(AUTH_PATH, arcname="auth.json")
 
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    fname = f"aurum_backup_{ts}.zip"
+def _backup_name() -> str:
+    return f"aurum_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+
+@app.get("/backup/download")
+def backup_download(request: Request, inc_db: int = 1, inc_auth: int = 1, async_: int = Query(0, alias="async")):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
+    if async_:
+        # 大 DB 壓縮要一段時間：背景打包，完成後到 /jobs 下載（連線中斷也不會白做）
+        return _enqueue(request, "backup.zip", {"inc_db": inc_db, "inc_auth": inc_auth})
+
+    buf = io.BytesIO()
+    _write_backup(buf, inc_db, inc_auth)
+    fname = _backup_name()
     headers = {
         "Content-Disposition": f"attachment; filename={fname}; filename*=UTF-8''{quote(fname)}"
     }
     buf.seek(0)
     return StreamingResponse(buf, media_type="application/zip", headers=headers)
 
+@_job("backup.zip")
+def _job_backup(ctx: jobs.JobContext, inc_db: int, inc_auth: int):
+    path = ctx.artifact(_backup_name(), "application/zip")
+    with open(path, "wb") as f:
+        _write_backup(f, inc_db, inc_auth, lambda name: ctx.progress(0.1, message=f"壓縮 {name}", force=True))
+    return {"bytes": path.stat().st_size}
+
+# ---- 背景工作：進度 / 下載 / 取消（只看得到自己在目前門市排的工作） ----
+def _my_job(request: Request, job_id: str) -> Optional[Dict[str, Any]]:
+    job = JOBS.get(job_id)
+    store = request.session.get("store") or tenants.DEFAULT_STORE
+    if job is None or job["owner"] != request.session.get("user") or job["store"] != store:
+        return None
+    return job
+
+@app.get("/jobs")
+def jobs_page(request: Request, new: Optional[str] = None):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
+    rows = JOBS.list(owner=request.session.get("user"), store=request.session.get("store") or tenants.DEFAULT_STORE)
+    active = any(j["status"] in ("queued", "running") for j in rows)
+    return templates.TemplateResponse("jobs.html", _ctx(request, {"jobs": rows, "new": new, "active": active}))
+
+@app.get("/jobs/{job_id}")
+def job_status(request: Request, job_id: str):
+    if _need_login(request): return JSONResponse({"ok": False, "msg": "請先登入"}, status_code=401)
+    job = _my_job(request, job_id)
+    if job is None: return JSONResponse({"ok": False, "msg": "找不到工作"}, status_code=404)
+    return {"ok": True, "job": job}
+
+@app.get("/jobs/{job_id}/download")
+def job_download(request: Request, job_id: str):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
+    job = _my_job(request, job_id)
+    art = JOBS.artifact(job_id) if job else None
+    if art is None: return JSONResponse({"ok": False, "msg": "檔案不存在或工作尚未完成"}, status_code=404)
+    path, name, media_type = art
+    return FileResponse(path, media_type=media_type, filename=name)
+
+@app.post("/jobs/{job_id}/cancel")
+def job_cancel(request: Request, job_id: str):
+    if _need_login(request): return RedirectResponse("/login", status_code=303)
+    if _my_job(request, job_id): JOBS.cancel(job_id)
+    return RedirectResponse("/jobs", status_code=303)
+
 @app.post("/backup/restore")
 async def backup_restore(request: Request, file: UploadFile = File(...)):
     if _need_login(request): return RedirectResponse("/login", status_code=303)
     try:
         data = await file.read()
+        db_path = _db_path()
         with zipfile.ZipFile(io.BytesIO(data), "r") as z:
             def _extract_member(name: str, target: Path):
                 target.parent.mkdir(parents=True, exist_ok=True)
                 content = z.read(name)
-                # path safety
+                # path safety（門市 DB 可能放在 app 目錄外，只放行本門市自己的檔）
                 p = target.resolve()
-                if APP_DIR not in p.parents and p != APP_DIR:
+                if APP_DIR not in p.parents and p != APP_DIR and p != db_path.resolve():
                     raise RuntimeError("非法路徑")
                 with open(p, "wb") as f: f.write(content)
 
@@ -565,7 +1110,8 @@ async def backup_restore(request: Request, file: UploadFile = File(...)):
                 elif name == "static/css/style.css":
                     _extract_member(name, APP_DIR / "static" / "css" / "style.css")
                 elif name == "aurum.db":
-                    _extract_member(name, DB_PATH)
+                    _extract_member(name, db_path)
+                    _store().categories.clear()
                 elif name == "auth.json":
                     _extract_member(name, AUTH_PATH)
             return RedirectResponse("/backup?ok=已還原，請重啟服務使變更生效。", status_code=303)
@@ -52,10 +52,14 @@ from PySide6.QtGui import QPalette, QColor, QBrush, QPixmap, QTransform, QFont
 from PySide6.QtCore import Qt, QDate, Signal, QTimer
 
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Date, Enum as SAEnum, Numeric, Text,
-    func, asc, and_, or_, event, MetaData, text, update
+    create_engine, Column, ForeignKey, Integer, String, Date, Enum as SAEnum, Numeric, Text,
+    func, asc, and_, or_, event, MetaData, text, update, case, literal, select, union_all
 )
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import relationship, sessionmaker
+
+from app.utils import analytics, categories, jobs, series, xlsx
+from app.utils.jsonstore import store_for
+from app.utils.sqlstats import instrument_engine, track as sql_track
 
 # ====================== 啟動健檢 ======================
 def preflight_checks():
@@ -85,9 +89,17 @@ DB_PATH = os.getenv("RESTO_DB", "resto.db")
 DB_PATH = os.path.abspath(DB_PATH)
 
 def _backup_sqlite(db_path: str):
+    """開機備份：優先走增量快照（<db>.backups/，只存變動的塊）；失敗才退回整檔複製"""
     import shutil, datetime
     if not os.path.exists(db_path):
         return
+    try:
+        from app.utils.incr_backup import snapshot as _incr_snapshot
+        m = _incr_snapshot(db_path, label="boot")
+        print(f"[BOOT] 增量快照 {m['id']}：新塊 {m['new_chunks']}/{len(m['chunks'])}（{m['new_bytes']:,} bytes）")
+        return
+    except Exception as e:
+        print(f"[BOOT] 增量快照失敗，改用整檔備份：{e}")
     ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
     bak = db_path + f".bak.{ts}"
     try:
@@ -127,6 +139,9 @@ def _normalize_shift_values(db_path: str):
 if os.path.exists(DB_PATH):
     _backup_sqlite(DB_PATH)
     _normalize_shift_values(DB_PATH)
+    # expenses.category 文字欄 → expense_categories 維度表 + category_id（與 server.py 共用，先啟動的那邊做）
+    if categories.migrate_sqlite(DB_PATH, "category", "category_id"):
+        print("[BOOT] 支出分類已改存 category_id")
 else:
     print(f"[BOOT] 尚未找到資料庫，稍後 create_all() 會建立：{DB_PATH}")
 
@@ -135,10 +150,16 @@ try:
     engine = create_engine(f"sqlite:///{DB_PATH}", future=True, echo=False)
 except Exception as e:
     raise RuntimeError(f"資料庫引擎建立失敗：{e}")
+instrument_engine(engine)   # 慢查詢 / 重複語句記到 logger "aurum.sql"；各動作以 @sql_track 歸屬
 
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, future=True)
 Base = declarative_base()
 
+# 報表匯出改在背景工作執行緒跑（不卡畫面）；佇列與 server.py 同在 <resto.db>.jobs/，
+# 各自只領自己註冊的種類。程式中途關掉的匯出，下次開啟時接著做。
+JOBS = jobs.JobQueue(jobs.default_dir_for(DB_PATH), workers=1, name="gui-jobs")
+DESKTOP_OWNER = "desktop"
+
 # ===== Shift 代碼/標籤對照（DB 存代碼、UI 顯示中文）=====
 class ShiftEnum(str, enum.Enum):
     MORNING = "MORNING"
@@ -168,13 +189,24 @@ class Order(Base):
     amount = Column(Numeric(14,2), nullable=False)
     memo = Column(Text)
 
+class ExpenseCategory(Base):
+    __tablename__ = categories.TABLE
+    id = Column(Integer, primary_key=True)
+    name = Column(String(categories.NAME_MAX), nullable=False, unique=True)
+
 class Expense(Base):
     __tablename__ = "expenses"
     id = Column(Integer, primary_key=True)
     date = Column(Date, nullable=False, index=True)
-    category = Column(String(50), nullable=False)
+    category_id = Column(Integer, ForeignKey(f"{categories.TABLE}.id"), nullable=False)
     amount = Column(Numeric(14,2), nullable=False)
     note = Column(Text)
+    # 列表 / 匯出查支出時一併 JOIN 分類名稱
+    category_ref = relationship(ExpenseCategory, lazy="joined")
+
+    @property
+    def category(self) -> str:
+        return self.category_ref.name if self.category_ref else categories.DEFAULT_NAME
 
 # 寫入/更新時自動把中文/別名轉為代碼
 @event.listens_for(Order, "before_insert")
@@ -195,20 +227,20 @@ def init_db():
     except Exception as e:
         raise RuntimeError(f"建立資料表失敗：{e}")
 
+# 新增支出時以分類名稱換 id；新名稱以獨立交易立即建立
+CATEGORIES = categories.CategoryCache(engine.begin)
+
 # ====================== 帳號/設定 ======================
 AUTH_FILE="auth.json"
 SET_FILE="settings.json"
 
+# auth.json / settings.json 走 jsonstore：記憶體快取 + 檔案異動偵測 + 原子寫入
+# settings.json 延遲 1 秒合併寫入（搜尋歷史每打一次字就會存），結束程式時自動補寫
+def _json_store(path):
+    return store_for(path, debounce=1.0 if path==SET_FILE else 0.0, quarantine_broken=True)
+
 def _safe_read_json(path):
-    try:
-        with open(path,"r",encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        try:
-            os.rename(path, path+".broken")
-        except Exception:
-            pass
-        return None
+    return _json_store(path).load()
 
 class Settings:
     def __init__(self):
@@ -220,23 +252,21 @@ class Settings:
     @staticmethod
     def load():
         s = Settings()
-        if os.path.exists(SET_FILE):
-            d=_safe_read_json(SET_FILE)
-            if d:
-                s.remember_code = bool(d.get("remember_code",False))
-                s.last_code = str(d.get("last_code","") or "")
-                s.search_history = list(d.get("search_history",[]))[:8]
-                s.exp_search_history = list(d.get("exp_search_history",[]))[:8]
+        d=_safe_read_json(SET_FILE)
+        if d:
+            s.remember_code = bool(d.get("remember_code",False))
+            s.last_code = str(d.get("last_code","") or "")
+            s.search_history = list(d.get("search_history",[]))[:8]
+            s.exp_search_history = list(d.get("exp_search_history",[]))[:8]
         return s
 
     def save(self):
-        with open(SET_FILE,"w",encoding="utf-8") as f:
-            json.dump({
-                "remember_code": self.remember_code,
-                "last_code": self.last_code,
-                "search_history": self.search_history,
-                "exp_search_history": self.exp_search_history
-            }, f, ensure_ascii=False, indent=2)
+        _json_store(SET_FILE).save({
+            "remember_code": self.remember_code,
+            "last_code": self.last_code,
+            "search_history": self.search_history,
+            "exp_search_history": self.exp_search_history
+        })
 
 def _hash_password(pw:str):
     salt=os.urandom(16)
@@ -255,7 +285,6 @@ def _verify_password(pw:str, salt_b64:str, hash_b64:str):
 class AuthManager:
     @staticmethod
     def is_initialized():
-        if not os.path.exists(AUTH_FILE): return False
         d=_safe_read_json(AUTH_FILE)
         if not d: return False
         u=d.get("user",{})
@@ -265,12 +294,10 @@ class AuthManager:
     def setup_account(code:str, pw:str):
         if not code or not pw: raise ValueError("請輸入帳號代號與密碼")
         salt,h=_hash_password(pw)
-        with open(AUTH_FILE,"w",encoding="utf-8") as f:
-            json.dump({"version":1,"user":{"code":code.strip(),"salt":salt,"hash":h}}, f, ensure_ascii=False, indent=2)
+        _json_store(AUTH_FILE).save({"version":1,"user":{"code":code.strip(),"salt":salt,"hash":h}})
 
     @staticmethod
     def verify(code:str, pw:str)->bool:
-        if not os.path.exists(AUTH_FILE): return False
         d=_safe_read_json(AUTH_FILE)
         if not d: return False
         u=d.get("user",{})
@@ -287,8 +314,7 @@ class AuthManager:
             salt,h=_hash_password(new_pw.strip())
             u["salt"],u["hash"]=salt,h
         d["user"]=u
-        with open(AUTH_FILE,"w",encoding="utf-8") as f:
-            json.dump(d, f, ensure_ascii=False, indent=2)
+        _json_store(AUTH_FILE).save(d)
 
 # ====================== 小工具 ======================
 def dec(txt:str)->Decimal:
@@ -722,12 +748,13 @@ class ExpensesTab(QWidget):
                 q=s.query(Expense).filter(and_(Expense.date>=d1,Expense.date<=d2)).order_by(asc(Expense.date),asc(Expense.id)).all()
             else:
                 like=f"%{query}%"
+                cat_hit=Expense.category_id.in_(select(ExpenseCategory.id).where(ExpenseCategory.name.like(like)))
                 cond=[and_(Expense.date>=d1,Expense.date<=d2),
-                      or_(Expense.category.like(like), Expense.note.like(like))]
+                      or_(cat_hit, Expense.note.like(like))]
                 try:
                     v=float(query.replace(",",""))
                     cond=[and_(Expense.date>=d1,Expense.date<=d2),
-                          or_(Expense.category.like(like), Expense.note.like(like), Expense.amount==v)]
+                          or_(cat_hit, Expense.note.like(like), Expense.amount==v)]
                 except: pass
                 q=s.query(Expense).filter(and_(*cond)).order_by(asc(Expense.date),asc(Expense.id)).all()
         self.t.setSortingEnabled(False); self.t.setRowCount(len(q))
@@ -748,7 +775,7 @@ class ExpensesTab(QWidget):
             note=self.note.text().strip()
             if amt<=0: QMessageBox.warning(self,"錯誤","請輸入正確金額。"); return
             with SessionLocal() as s:
-                s.add(Expense(date=d, category=cat, amount=amt, note=note or None)); s.commit()
+                s.add(Expense(date=d, category_id=CATEGORIES.id_for(cat), amount=amt, note=note or None)); s.commit()
             self.amt.clear(); self.note.clear(); self._reload_current(); self.updated.emit()
         except ValueError as e:
             QMessageBox.warning(self,"錯誤", str(e))
@@ -827,6 +854,7 @@ class DashboardTab(QWidget):
             for x in w: x.setVisible(vis)
         self.refresh()
 
+    @sql_track("DashboardTab.refresh")
     def refresh(self):
         m=self.mode.currentText()
         if m=="當日":
@@ -861,6 +889,79 @@ class DashboardTab(QWidget):
             self.period.setText(f"期間：{yv} 年")
 
 # ====================== 報表（日期控制＋三大匯出） ======================
+# ---- 報表匯出：在 JOBS 的工作執行緒執行，ReportsTab 只負責選檔、排入、等結果 ----
+def _no_track(rows,_label): return rows
+
+def export_orders_csv(path,d1,d2,track=_no_track):
+    n=0
+    with SessionLocal() as s, open(path,"w",newline="",encoding="utf-8-sig") as f:
+        w=csv.writer(f); w.writerow(["日期","班別","單號","金額","備註"])
+        # yield_per：分批從 cursor 取，不先 .all() 整段載入
+        q=s.query(Order).filter(and_(Order.date>=d1,Order.date<=d2)).order_by(asc(Order.date),asc(Order.id)).yield_per(xlsx.CHUNK_ROWS)
+        for o in track(q,"訂單 "):
+            w.writerow([o.date.strftime("%Y-%m-%d"), shift_label(o.shift.value), o.order_no, f"{float(o.amount):.0f}", o.memo or ""]); n+=1
+    return n
+
+def export_expenses_csv(path,d1,d2,track=_no_track):
+    n=0
+    with SessionLocal() as s, open(path,"w",newline="",encoding="utf-8-sig") as f:
+        w=csv.writer(f); w.writerow(["日期","分類","金額","備註"])
+        q=s.query(Expense).filter(and_(Expense.date>=d1,Expense.date<=d2)).order_by(asc(Expense.date),asc(Expense.id)).yield_per(xlsx.CHUNK_ROWS)
+        for e in track(q,"支出 "):
+            w.writerow([e.date.strftime("%Y-%m-%d"),e.category,f"{float(e.amount):,.0f}",e.note or ""]); n+=1
+    return n
+
+def export_revenue_csv(path,d1,d2,track=_no_track):
+    with SessionLocal() as s, open(path,"w",newline="",encoding="utf-8-sig") as f:
+        w=csv.writer(f); w.writerow(["日期","早班營業額","晚班營業額","總營業額","支出","利潤"])
+        ords=s.query(Order.date,Order.shift,func.sum(Order.amount)).filter(and_(Order.date>=d1,Order.date<=d2)).group_by(Order.date,Order.shift).all()
+        exps=s.query(Expense.date,func.sum(Expense.amount)).filter(and_(Expense.date>=d1,Expense.date<=d2)).group_by(Expense.date).all()
+        o_map={}; dates=set()
+        for d,sh,sumv in ords:
+            dates.add(d); o_map.setdefault(d,{ShiftEnum.MORNING:0.0,ShiftEnum.EVENING:0.0})[sh]=float(sumv or 0)
+        x_map={d:float(v or 0) for d,v in exps}; dates.update(x_map.keys())
+        for d in sorted(dates):
+            m=o_map.get(d,{ShiftEnum.MORNING:0.0,ShiftEnum.EVENING:0.0})
+            mm,me=float(m.get(ShiftEnum.MORNING,0)),float(m.get(ShiftEnum.EVENING,0))
+            total=mm+me; x=float(x_map.get(d,0)); profit=total-x
+            w.writerow([d.strftime("%Y-%m-%d"),f"{mm:.0f}",f"{me:.0f}",f"{total:.0f}",f"{x:.0f}",f"{profit:.0f}"])
+    return len(dates)
+
+def export_xlsx(path,d1,d2,track=_no_track):
+    """訂單 / 支出 / 每日彙總三張表；cursor 分批讀、邊寫邊壓縮到檔案，記憶體與筆數無關。"""
+    with SessionLocal() as s:
+        def rows(stmt,label): return track(s.execute(stmt.execution_options(yield_per=xlsx.CHUNK_ROWS)),label)
+        orders=(select(Order.date,Order.shift,Order.order_no,Order.amount,Order.memo)
+                .where(Order.date>=d1,Order.date<=d2).order_by(asc(Order.date),asc(Order.id)))
+        expenses=(select(Expense.date,ExpenseCategory.name,Expense.amount,Expense.note)
+                  .join(ExpenseCategory,ExpenseCategory.id==Expense.category_id)
+                  .where(Expense.date>=d1,Expense.date<=d2).order_by(asc(Expense.date),asc(Expense.id)))
+        kind=case((Order.shift==ShiftEnum.MORNING,0),else_=1)
+        day_rows=s.execute(union_all(
+            select(Order.date,kind,func.sum(Order.amount)).where(Order.date>=d1,Order.date<=d2).group_by(Order.date,Order.shift),
+            select(Expense.date,literal(2,Integer),func.sum(Expense.amount)).where(Expense.date>=d1,Expense.date<=d2).group_by(Expense.date))).all()
+        daily=series.dense(d1,d2,"day",day_rows)
+        return xlsx.write(path,[
+            xlsx.Sheet("訂單",["日期","班別","單號","金額","備註"],
+                       lambda:((d,shift_label(sh.value),no,amt,memo or "") for d,sh,no,amt,memo in rows(orders,"訂單 ")),
+                       widths=[12,8,16,12,30],money=[3]),
+            xlsx.Sheet("支出",["日期","分類","金額","備註"],lambda:((d,c,amt,note or "") for d,c,amt,note in rows(expenses,"支出 ")),
+                       widths=[12,14,12,30],money=[2]),
+            xlsx.Sheet("每日彙總",["日期","早班營業額","晚班營業額","總營業額","支出","利潤"],
+                       zip([date.fromisoformat(x) for x in daily["dates"]],daily["morning"],daily["evening"],
+                           daily["total"],daily["expense"],daily["net"]),
+                       widths=[12,14,14,14,12,12],money=[1,2,3,4,5]),
+        ])
+
+def _export_job(fn):
+    def run(ctx,path,d1,d2):
+        return {"rows":fn(path,date.fromisoformat(d1),date.fromisoformat(d2),ctx.track),"path":path}
+    return run
+
+for _kind,_fn in (("desktop.orders_csv",export_orders_csv),("desktop.expenses_csv",export_expenses_csv),
+                  ("desktop.revenue_csv",export_revenue_csv),("desktop.xlsx",export_xlsx)):
+    JOBS.register(_kind,_export_job(_fn))
+
 class ReportsTab(QWidget):
     def __init__(self):
         super().__init__(); root=QVBoxLayout(self)
@@ -899,15 +1000,25 @@ class ReportsTab(QWidget):
         self.b1=QPushButton("📤 匯出訂單 CSV"); self.b1.setObjectName("btnOrders")
         self.b2=QPushButton("🧾 匯出支出 CSV"); self.b2.setObjectName("btnExpenses")
         self.b3=QPushButton("💹 匯出營業額 CSV"); self.b3.setObjectName("btnRevenue")
-        for b in (self.b1,self.b2,self.b3):
+        self.b4=QPushButton("📗 匯出 Excel"); self.b4.setObjectName("btnXlsx")
+        for b in (self.b1,self.b2,self.b3,self.b4):
             b.setMinimumHeight(56)
             b.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
             btns.addWidget(b)
         root.addLayout(btns)
 
         self.b1.clicked.connect(self.exp_orders); self.b2.clicked.connect(self.exp_expenses); self.b3.clicked.connect(self.exp_revenue)
+        self.b4.clicked.connect(self.exp_xlsx)
         self._mode_changed()
 
+        # 匯出在 JOBS 背景執行：job id → (按鈕, 原文字)，計時器輪詢狀態，完成 / 失敗才跳訊息
+        self._jobs={}
+        self._timer=QTimer(self); self._timer.setInterval(500); self._timer.timeout.connect(self._poll_jobs)
+        # 上次關程式時沒做完的匯出，佇列啟動後會接著做；這裡接回來等結果
+        for j in JOBS.list(owner=DESKTOP_OWNER,limit=20):
+            if j["status"] in ("queued","running"): self._jobs[j["id"]]=None
+        if self._jobs: self._timer.start()
+
     def _mode_changed(self):
         m=self.mode.currentText()
         for w,vis in (
@@ -929,51 +1040,61 @@ class ReportsTab(QWidget):
             q=self.m.date().toPython(); first,last=month_first_last(q.year,q.month); return first,last
         yv=self.y.date().year(); return year_first_last(yv)
 
-    def _pick(self,name):
-        p,_=QFileDialog.getSaveFileName(self,"儲存為...",name,"CSV 檔 (*.csv)")
+    def _pick(self,name,filt="CSV 檔 (*.csv)"):
+        p,_=QFileDialog.getSaveFileName(self,"儲存為...",name,filt)
         return p
 
+    def _export(self,kind,btn,d1,d2,name,filt="CSV 檔 (*.csv)"):
+        path=self._pick(name,filt)
+        if not path: return
+        job=JOBS.enqueue(kind,{"path":path,"d1":d1,"d2":d2},owner=DESKTOP_OWNER)
+        self._jobs[job["id"]]=(btn,btn.text())
+        btn.setEnabled(False); btn.setText("匯出中…")
+        self._timer.start()
+
+    def _poll_jobs(self):
+        for jid,ui in list(self._jobs.items()):
+            j=JOBS.get(jid)
+            if j is not None and j["status"] in ("queued","running"):
+                if ui: ui[0].setText(f"匯出中… {j['message']}")
+                continue
+            self._jobs.pop(jid)
+            if ui: ui[0].setEnabled(True); ui[0].setText(ui[1])
+            if j is None: continue
+            if j["status"]=="done":
+                QMessageBox.information(self,"完成",f"已匯出 {j['result']['rows']:,} 列：\n{j['result']['path']}")
+            elif j["status"]=="failed":
+                QMessageBox.warning(self,"匯出失敗",f"{j['params'].get('path','')}\n{j['error']}")
+        if not self._jobs: self._timer.stop()
+
     def exp_orders(self):
         d1,d2=self._range()
-        path=self._pick(f"訂單_{d1.strftime('%Y%m%d')}_{d2.strftime('%Y%m%d')}.csv")
-        if not path: return
-        with SessionLocal() as s, open(path,"w",newline="",encoding="utf-8-sig") as f:
-            w=csv.writer(f); w.writerow(["日期","班別","單號","金額","備註"])
-            q=s.query(Order).filter(and_(Order.date>=d1,Order.date<=d2)).order_by(asc(Order.date),asc(Order.id)).all()
-            for o in q:
-                w.writerow([o.date.strftime("%Y-%m-%d"), shift_label(o.shift.value), o.order_no, f"{float(o.amount):.0f}", o.memo or ""])
-        QMessageBox.information(self,"完成",f"已匯出：\n{path}")
+        self._export("desktop.orders_csv",self.b1,d1,d2,f"訂單_{d1.strftime('%Y%m%d')}_{d2.strftime('%Y%m%d')}.csv")
 
     def exp_expenses(self):
         d1,d2=self._range()
-        path=self._pick(f"支出_{d1.strftime('%Y%m%d')}_{d2.strftime('%Y%m%d')}.csv")
-        if not path: return
-        with SessionLocal() as s, open(path,"w",newline="",encoding="utf-8-sig") as f:
-            w=csv.writer(f); w.writerow(["日期","分類","金額","備註"])
-            q=s.query(Expense).filter(and_(Expense.date>=d1,Expense.date<=d2)).order_by(asc(Expense.date),asc(Expense.id)).all()
-            for e in q: w.writerow([e.date.strftime("%Y-%m-%d"),e.category,f"{float(e.amount):,.0f}",e.note or ""])
-        QMessageBox.information(self,"完成",f"已匯出：\n{path}")
+        self._export("desktop.expenses_csv",self.b2,d1,d2,f"支出_{d1.strftime('%Y%m%d')}_{d2.strftime('%Y%m%d')}.csv")
 
     def exp_revenue(self):
         d1,d2=self._range()
-        path=self._pick(f"營業額_{d1.strftime('%Y%m%d')}_{d2.strftime('%Y%m%d')}.csv")
-        if not path: return
-        with SessionLocal() as s, open(path,"w",newline="",encoding="utf-8-sig") as f:
-            w=csv.writer(f); w.writerow(["日期","早班營業額","晚班營業額","總營業額","支出","利潤"])
-            ords=s.query(Order.date,Order.shift,func.sum(Order.amount)).filter(and_(Order.date>=d1,Order.date<=d2)).group_by(Order.date,Order.shift).all()
-            exps=s.query(Expense.date,func.sum(Expense.amount)).filter(and_(Expense.date>=d1,Expense.date<=d2)).group_by(Expense.date).all()
-            o_map={}; dates=set()
-            for d,sh,sumv in ords:
-                dates.add(d); o_map.setdefault(d,{ShiftEnum.MORNING:0.0,ShiftEnum.EVENING:0.0})[sh]=float(sumv or 0)
-            x_map={d:float(v or 0) for d,v in exps}; dates.update(x_map.keys())
-            for d in sorted(dates):
-                m=o_map.get(d,{ShiftEnum.MORNING:0.0,ShiftEnum.EVENING:0.0})
-                mm,me=float(m.get(ShiftEnum.MORNING,0)),float(m.get(ShiftEnum.EVENING,0))
-                total=mm+me; x=float(x_map.get(d,0)); profit=total-x
-                w.writerow([d.strftime("%Y-%m-%d"),f"{mm:.0f}",f"{me:.0f}",f"{total:.0f}",f"{x:.0f}",f"{profit:.0f}"])
-        QMessageBox.information(self,"完成",f"已匯出：\n{path}")
+        self._export("desktop.revenue_csv",self.b3,d1,d2,f"營業額_{d1.strftime('%Y%m%d')}_{d2.strftime('%Y%m%d')}.csv")
+
+    def exp_xlsx(self):
+        d1,d2=self._range()
+        self._export("desktop.xlsx",self.b4,d1,d2,f"報表_{d1.strftime('%Y%m%d')}_{d2.strftime('%Y%m%d')}.xlsx","Excel 檔 (*.xlsx)")
 
 # ====================== AI 智能助手 ======================
+TREND_WORDS=("走勢","趨勢","預估","預測","月底","移動平均","均線","星期幾","週幾","淡旺")
+
+def _daily_rows():
+    """analytics 用：每日 ×（早班 0／晚班 1／支出 2）全歷史彙總，一條 SQL。"""
+    kind=case((Order.shift==ShiftEnum.MORNING,0),else_=1)
+    stmt=union_all(
+        select(Order.date,kind,func.sum(Order.amount)).group_by(Order.date,Order.shift),
+        select(Expense.date,literal(2,Integer),func.sum(Expense.amount)).group_by(Expense.date))
+    with SessionLocal() as s:
+        return s.execute(stmt).all()
+
 class AiTab(QWidget):
     def __init__(self):
         super().__init__(); root=QVBoxLayout(self)
@@ -981,7 +1102,7 @@ class AiTab(QWidget):
         glass=QFrame(); glass.setObjectName("glassBox")
         gl=QVBoxLayout(glass); gl.setContentsMargins(10,10,10,10); gl.setSpacing(6)
 
-        tip=QLabel("輸入問題（例：本月利潤？ / 今天早班營業額 / 今年支出 / 本月TOP3支出分類 / 單號 37）")
+        tip=QLabel("輸入問題（例：本月利潤？ / 今天早班營業額 / 今年支出 / 本月TOP3支出分類 / 單號 37 / 本月走勢預估）")
         tip.setStyleSheet("color:#334155;font-weight:700;")
         gl.addWidget(tip)
 
@@ -1009,7 +1130,7 @@ class AiTab(QWidget):
         self.out=QTextEdit(); self.out.setReadOnly(True); root.addWidget(self.out)
 
         chips=QHBoxLayout()
-        for txt in ["今日利潤","本月支出","今年總營業額","今天早班營業額","今天晚班營業額","本月TOP3支出分類"]:
+        for txt in ["今日利潤","本月支出","今年總營業額","今天早班營業額","今天晚班營業額","本月TOP3支出分類","本月走勢預估"]:
             b=QPushButton(txt); b.clicked.connect(lambda _,t=txt:self._fill(t)); chips.addWidget(b)
         chips.addStretch(); root.addLayout(chips)
 
@@ -1032,9 +1153,16 @@ class AiTab(QWidget):
         if "今年" in qtext: return year_first_last(today.year)
         return (today,today)
 
+    @sql_track("AiTab.ask")
     def ask(self):
         q=self.q.text().strip()
         if not q: return
+        if any(k in q for k in TREND_WORDS):
+            # 全歷史每日彙總快取在記憶體，資料庫有寫入才重查
+            st=analytics.summary(analytics.cache.get(DB_PATH,_daily_rows))
+            msg=["📈 本月走勢與預估："]+[f"- {ln}" for ln in analytics.brief(st)]
+            msg.append("　".join(f"週{w['weekday']} {w['index']:.2f}" for w in st["weekday"]))
+            self.out.setText("\n".join(msg)); return
         d1,d2=self._period_from_ui_or_text(q)
         want_profit=("利潤" in q)
         want_rev=("營業額" in q) or ("收入" in q)
@@ -1068,7 +1196,10 @@ class AiTab(QWidget):
                 exp=float(v)
 
             if want_top and want_exp:
-                rows=s.query(Expense.category, func.sum(Expense.amount)).filter(and_(Expense.date>=d1,Expense.date<=d2)).group_by(Expense.category).order_by(func.sum(Expense.amount).desc()).all()
+                agg=(s.query(Expense.category_id.label("cid"), func.sum(Expense.amount).label("total"))
+                     .filter(and_(Expense.date>=d1,Expense.date<=d2)).group_by(Expense.category_id).subquery())
+                rows=(s.query(ExpenseCategory.name, agg.c.total).join(agg, agg.c.cid==ExpenseCategory.id)
+                      .order_by(agg.c.total.desc()).all())
                 msg.append(f"📊 {d1} ~ {d2} 支出分類排行（TOP 3）：")
                 for i,(cat,sumv) in enumerate(rows[:3],1):
                     msg.append(f"  {i}. {cat} NT${float(sumv):,.0f}")
@@ -1352,6 +1483,7 @@ def main():
     print("=== 啟動健檢 ===\n"+info+"\n================")
 
     init_db()
+    JOBS.start()
     app=QApplication(sys.argv)
     apply_light_theme(app)
 
@@ -1378,7 +1510,9 @@ def main():
 
     w=MainWindow(current_code=current_code, settings=settings)
     w.show()
-    sys.exit(app.exec())
+    code=app.exec()
+    JOBS.stop()
+    sys.exit(code)
 
 if __name__=="__main__":
     main()
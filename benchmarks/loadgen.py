@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/loadgen.py
+併發壓測 / 浸泡測試：對「已啟動」的 server.py 或 app.web_ui:app 同時跑多個寫入者與讀取者，
+觀察 SQLite 鎖競爭。每個統計區間輸出各端點的 p50/p95/p99、吞吐量、錯誤數與「database is locked」次數。
+  uvicorn app.web_ui:app --port 8000      （另開一個視窗）
+  python .\\benchmarks\\loadgen.py --target web --url http://127.0.0.1:8000 --user admin --password xxx --pin 1234
+  python .\\benchmarks\\loadgen.py --target server --url http://127.0.0.1:8001 --user A01 --password xxx ^
+         --writers 8 --readers 32 --duration 300 --interval 10 --out benchmarks\\results\\soak.json
+寫入者：新增訂單、表內編輯（web 走 /orders/update-batch，server 走 PUT）；讀取者：KPI、清單、匯出。
+--mix 可調整各動作權重，例如 --mix create=3,edit=1,kpi=2,list=2,export=1。
+鎖錯誤判定：HTTP 503（兩個程式遇到 database is locked 時回 503）或回應內容含 "database is locked"。
+需要 httpx（pip install httpx）。
+"""
+from __future__ import annotations
+
+import argparse, asyncio, json, random, sys, time
+from collections import defaultdict
+from datetime import date, datetime
+from pathlib import Path
+
+try:
+    import httpx
+except ImportError:
+    raise SystemExit("[!] 需要 httpx：pip install httpx")
+
+WRITE_OPS = ("create", "edit")
+READ_OPS = ("kpi", "list", "export")
+DEFAULT_MIX = {"create": 3, "edit": 2, "kpi": 2, "list": 3, "export": 1}
+
+
+# ---------------- 統計 ----------------
+def _pct(sorted_ms, q):
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, int(q * len(sorted_ms)))]
+
+class Recorder:
+    def __init__(self):
+        self.window = defaultdict(list)     # endpoint -> [(ms, status, locked)]
+        self.total = defaultdict(list)
+        self.timeline = []
+        self.t0 = time.perf_counter()
+
+    def add(self, ep: str, ms: float, status: int, locked: bool):
+        rec = (ms, status, locked)
+        self.window[ep].append(rec)
+        self.total[ep].append(rec)
+
+    @staticmethod
+    def summarize(recs, seconds):
+        ms = sorted(r[0] for r in recs)
+        return {"count": len(recs), "rps": round(len(recs) / seconds, 2) if seconds > 0 else 0.0,
+                "p50_ms": round(_pct(ms, 0.50), 2), "p95_ms": round(_pct(ms, 0.95), 2),
+                "p99_ms": round(_pct(ms, 0.99), 2), "max_ms": round(ms[-1], 2) if ms else 0.0,
+                "errors": sum(1 for r in recs if r[1] >= 400 or r[1] == 0),
+                "locked": sum(1 for r in recs if r[2])}
+
+    def roll(self, seconds: float):
+        t = round(time.perf_counter() - self.t0, 1)
+        snap = {ep: self.summarize(recs, seconds) for ep, recs in sorted(self.window.items())}
+        self.timeline.append({"t": t, "endpoints": snap})
+        self.window.clear()
+        print(f"\n[t={t:>6.1f}s]")
+        _print_table(snap)
+
+def _print_table(snap):
+    print(f"  {'endpoint':<16}{'count':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'err':>6}{'locked':>8}")
+    for ep, s in snap.items():
+        print(f"  {ep:<16}{s['count']:>7}{s['rps']:>9.1f}{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}"
+              f"{s['p99_ms']:>9.1f}{s['errors']:>6}{s['locked']:>8}")
+
+
+# ---------------- 兩種目標的動作 ----------------
+class WebTarget:
+    """app.web_ui：session 登入；KPI 需先過二次密碼。"""
+    def __init__(self, args):
+        self.args = args
+        self.ids = []
+
+    async def login(self, c: httpx.AsyncClient):
+        r = await c.post("/login", data={"username": self.args.user, "password": self.args.password})
+        if r.status_code >= 400 or "/login" in str(r.url):
+            raise SystemExit(f"[!] 登入失敗（{r.status_code}）")
+        if self.args.pin:
+            await c.post("/kpi/guard", data={"pin": self.args.pin})
+        r = await c.get("/orders/rows", params={"limit": 500})
+        self.ids = [row["id"] for row in r.json().get("rows", [])] if r.status_code == 200 else []
+
+    async def op(self, c: httpx.AsyncClient, name: str, rng: random.Random):
+        today = self.args.day
+        if name == "create":
+            return "orders.create", await c.post("/orders/create", data={
+                "odt": today, "shift": rng.choice(["早班", "晚班"]),
+                "order_no": str(rng.randint(1, 99999)), "amount": str(rng.randint(80, 3000))})
+        if name == "edit":
+            if not self.ids:                      # 空庫起跑：等寫入者先建出幾筆再抓 id
+                r = await c.get("/orders/rows", params={"limit": 500})
+                self.ids = [row["id"] for row in r.json().get("rows", [])] if r.status_code == 200 else []
+                return "orders.edit", None
+            edits = [{"key": str(i), "id": rng.choice(self.ids), "field": "amount", "value": str(rng.randint(80, 3000))}
+                     for i in range(rng.randint(1, 5))]
+            return "orders.edit", await c.post("/orders/update-batch", json={"edits": edits})
+        if name == "kpi":
+            return "kpi", await c.get("/kpi", params={"mode": rng.choice(["day", "month"]), "dt": today})
+        if name == "list":
+            if rng.random() < 0.5:
+                return "orders.page", await c.get("/orders")
+            return "orders.rows", await c.get("/orders/rows")
+        return "export.csv", await c.get("/export/orders.csv", params={"scope": "month", "base": today})
+
+class ServerTarget:
+    """server.py：JWT；401 時自動重新登入。"""
+    def __init__(self, args):
+        self.args = args
+        self.ids = []
+        self.headers = {}
+
+    async def login(self, c: httpx.AsyncClient):
+        r = await c.post("/api/v1/auth/login", json={"code": self.args.user, "password": self.args.password})
+        if r.status_code != 200:
+            raise SystemExit(f"[!] 登入失敗（{r.status_code}）：{r.text[:200]}")
+        self.headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        r = await c.get("/api/v1/orders", params={"page_size": 200}, headers=self.headers)
+        self.ids = [it["id"] for it in r.json().get("items", [])] if r.status_code == 200 else []
+
+    async def op(self, c: httpx.AsyncClient, name: str, rng: random.Random):
+        h, today = self.headers, self.args.day
+        if name == "create":
+            return "orders.create", await c.post("/api/v1/orders", headers=h, json={
+                "date": today, "shift": rng.choice(["早班", "晚班"]),
+                "order_no": str(rng.randint(1, 99999)), "amount": rng.randint(80, 3000)})
+        if name == "edit":
+            if not self.ids:
+                r = await c.get("/api/v1/orders", params={"page_size": 200}, headers=h)
+                self.ids = [it["id"] for it in r.json().get("items", [])] if r.status_code == 200 else []
+                return "orders.edit", None
+            return "orders.edit", await c.put(f"/api/v1/orders/{rng.choice(self.ids)}", headers=h, json={
+                "date": today, "shift": "早班", "order_no": str(rng.randint(1, 99999)), "amount": rng.randint(80, 3000)})
+        if name == "kpi":
+            return "kpi", await c.get("/api/v1/reports/kpi", headers=h,
+                                      params={"mode": rng.choice(["day", "month", "year"]), "ref_date": today})
+        if name == "list":
+            return "orders.list", await c.get("/api/v1/orders", headers=h, params={"page": rng.randint(1, 20)})
+        return "expenses.list", await c.get("/api/v1/expenses", headers=h, params={"page_size": 200})
+
+
+# ---------------- 執行 ----------------
+def _is_locked(r: httpx.Response) -> bool:
+    if r.status_code == 503:
+        return True
+    if r.status_code >= 500:
+        try: return "database is locked" in r.text
+        except Exception: return False
+    return False
+
+async def worker(wid: int, target, ops, weights, client_kw, rec: Recorder, deadline: float, think: float):
+    rng = random.Random(wid)
+    async with httpx.AsyncClient(**client_kw) as c:
+        while time.perf_counter() < deadline:
+            name = rng.choices(ops, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                ep, r = await target.op(c, name, rng)
+            except httpx.HTTPError:
+                rec.add(name, (time.perf_counter() - t0) * 1000, 0, False)
+                continue
+            if r is None:
+                await asyncio.sleep(0.05)
+                continue
+            if r.status_code == 401 and isinstance(target, ServerTarget):
+                await target.login(c)
+            rec.add(ep, (time.perf_counter() - t0) * 1000, r.status_code, _is_locked(r))
+            if think:
+                await asyncio.sleep(rng.uniform(0, think))
+
+async def run(args) -> dict:
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, (args.mix or "").split(",")):
+        k, _, v = part.partition("=")
+        if k.strip() in mix:
+            mix[k.strip()] = float(v or 0)
+    target = (WebTarget if args.target == "web" else ServerTarget)(args)
+    client_kw = dict(base_url=args.url, timeout=args.timeout, follow_redirects=False)
+
+    # 先登入一次取 cookie / token 與可編輯的 id，之後各 worker 共用
+    async with httpx.AsyncClient(**dict(client_kw, follow_redirects=True)) as c:
+        await target.login(c)
+        cookies = dict(c.cookies)
+    client_kw["cookies"] = cookies
+
+    rec = Recorder()
+    deadline = time.perf_counter() + args.duration
+    w_ops = [o for o in WRITE_OPS if mix[o] > 0]
+    r_ops = [o for o in READ_OPS if mix[o] > 0]
+    tasks = []
+    for i in range(args.writers if w_ops else 0):
+        tasks.append(asyncio.create_task(worker(i + 1, target, w_ops, [mix[o] for o in w_ops],
+                                                client_kw, rec, deadline, args.think)))
+    for i in range(args.readers if r_ops else 0):
+        tasks.append(asyncio.create_task(worker(1000 + i, target, r_ops, [mix[o] for o in r_ops],
+                                                client_kw, rec, deadline, args.think)))
+    print(f"[i] {args.target} @ {args.url}：寫入者 {args.writers}、讀取者 {args.readers}、{args.duration}s，mix={mix}")
+    last = time.perf_counter()
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(min(args.interval, max(0.05, deadline - time.perf_counter())))
+        now = time.perf_counter()
+        rec.roll(now - last); last = now
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    elapsed = time.perf_counter() - rec.t0
+    totals = {ep: Recorder.summarize(recs, elapsed) for ep, recs in sorted(rec.total.items())}
+    print(f"\n[✓] 總計（{elapsed:.1f}s）")
+    _print_table(totals)
+    return {"meta": {"target": args.target, "url": args.url, "writers": args.writers, "readers": args.readers,
+                     "duration": args.duration, "interval": args.interval, "mix": mix,
+                     "created": datetime.now().isoformat(timespec="seconds")},
+            "totals": totals, "timeline": rec.timeline}
+
+def main():
+    ap = argparse.ArgumentParser(description="AurumLedger 併發壓測")
+    ap.add_argument("--target", choices=["web", "server"], required=True)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--user", required=True, help="web：帳號；server：auth.json 的 code")
+    ap.add_argument("--password", required=True)
+    ap.add_argument("--pin", default="", help="web 的 KPI 二次密碼（不給則 KPI 會被導回 guard）")
+    ap.add_argument("--writers", type=int, default=4)
+    ap.add_argument("--readers", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=60.0, help="秒")
+    ap.add_argument("--interval", type=float, default=5.0, help="統計區間（秒）")
+    ap.add_argument("--think", type=float, default=0.0, help="每次請求後隨機等待 0..think 秒")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--mix", default="", help="動作權重，例如 create=3,edit=1,kpi=2,list=2,export=1")
+    ap.add_argument("--day", default=date.today().isoformat(), help="寫入 / 查詢用的日期")
+    ap.add_argument("--out", help="結果 JSON 路徑")
+    args = ap.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[✓] 結果已寫入 {args.out}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks/run.py
+效能基準：以 ASGI TestClient 直接打各程式的端點，量測 KPI / 清單 / 搜尋 / 匯出 / 寫入路徑。
+資料集由 scripts/gen_dataset.py 產生（固定 seed 與結束日，跨 commit 可比），快取在 benchmarks/data/。
+  python .\\benchmarks\\run.py                              # 預設 10k、1m 兩種規模
+  python .\\benchmarks\\run.py --sizes 10k,1m,10m --repeat 7
+  python .\\benchmarks\\run.py --only web,server --out benchmarks\\results\\after.json
+  python .\\benchmarks\\run.py --baseline benchmarks\\results\\before.json   # 列出與上次的差異
+每個「程式 × 規模」在獨立子行程執行（各程式在 import 時就決定 DB 路徑），
+寫入測試作用在資料集的暫存複本上，快取的資料集不會被改動。
+結果寫成 JSON：meta（commit / Python / SQLite 版本）+ 每個 case 的 min/median/mean/p95 毫秒。
+"""
+from __future__ import annotations
+
+import argparse, json, logging, os, platform, shutil, sqlite3, statistics, subprocess, sys, tempfile, time
+from datetime import date, datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT / "benchmarks" / "data"
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+SEED = 42
+DATA_END = date(2025, 6, 30)           # 固定結束日：資料集內容不隨執行日期改變
+TARGETS = {"server": "resto", "web": "aurum", "app": "app", "import_export": "app"}
+
+def parse_size(s: str) -> int:
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s[:-1] if mult > 1 else s) * mult)
+
+def dataset(schema: str, rows: int) -> Path:
+    p = DATA_DIR / f"{schema}-{rows}-seed{SEED}.db"
+    if not p.exists():
+        sys.path.insert(0, str(ROOT / "scripts"))
+        from gen_dataset import generate
+        print(f"[i] 產生資料集 {p.name} …")
+        tmp = p.with_suffix(".tmp")
+        if tmp.exists(): tmp.unlink()
+        generate(schema, tmp, years=3, rows=rows, end=DATA_END, seed=SEED)
+        tmp.replace(p)
+    return p
+
+
+# ====================== 子行程：實際量測 ======================
+class Timer:
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results = []
+
+    def case(self, name: str, fn, repeat: int | None = None):
+        n = repeat or self.repeat
+        status = None
+        try:
+            r = fn(); status = getattr(r, "status_code", None)        # 暖機
+            samples = []
+            for _ in range(n):
+                t0 = time.perf_counter()
+                r = fn()
+                samples.append((time.perf_counter() - t0) * 1000)
+                status = getattr(r, "status_code", status)
+        except Exception as e:
+            self.results.append({"case": name, "error": f"{type(e).__name__}: {e}"})
+            print(f"  [!] {name}: {e}")
+            return
+        samples.sort()
+        row = {"case": name, "n": n, "status": status,
+               "min_ms": round(samples[0], 3), "median_ms": round(statistics.median(samples), 3),
+               "mean_ms": round(statistics.fmean(samples), 3),
+               "p95_ms": round(samples[min(n - 1, int(0.95 * n))], 3)}
+        self.results.append(row)
+        print(f"  {name:<34} median {row['median_ms']:>10.2f} ms   p95 {row['p95_ms']:>10.2f} ms   [{status}]")
+
+def _mid_date(db: Path, table: str, col: str) -> str:
+    con = sqlite3.connect(str(db))
+    try:
+        lo, hi = con.execute(f"SELECT MIN({col}), MAX({col}) FROM {table}").fetchone()
+    finally:
+        con.close()
+    if not lo:
+        return DATA_END.isoformat()
+    a, b = date.fromisoformat(str(lo)[:10]), date.fromisoformat(str(hi)[:10])
+    return date.fromordinal((a.toordinal() + b.toordinal()) // 2).isoformat()
+
+def bench_server(db: Path, t: Timer, work: Path):
+    import base64, hashlib
+    auth = {"user": {"code": "bench", "salt": "", "hash": ""}}
+    salt = b"bench-salt-0001"
+    auth["user"]["salt"] = base64.b64encode(salt).decode()
+    auth["user"]["hash"] = base64.b64encode(hashlib.pbkdf2_hmac("sha256", b"bench", salt, 200_000)).decode()
+    (work / "auth.json").write_text(json.dumps(auth), encoding="utf-8")
+    os.chdir(work)                                   # server.py 讀相對路徑的 auth.json
+    import server
+    from fastapi.testclient import TestClient
+    mid = _mid_date(db, "orders", "date")
+    with TestClient(server.app) as c:
+        tok = c.post("/api/v1/auth/login", json={"code": "bench", "password": "bench"}).json()["access_token"]
+        h = {"Authorization": f"Bearer {tok}"}
+        t.case("orders list p1", lambda: c.get("/api/v1/orders", headers=h))
+        t.case("orders list p50", lambda: c.get("/api/v1/orders?page=50&page_size=50", headers=h))
+        t.case("orders day filter", lambda: c.get(f"/api/v1/orders?date_from={mid}&date_to={mid}", headers=h))
+        t.case("orders search q", lambda: c.get("/api/v1/orders?q=10037", headers=h))
+        t.case("expenses list p1", lambda: c.get("/api/v1/expenses", headers=h))
+        for mode in ("day", "month", "year"):
+            t.case(f"kpi {mode}", lambda mode=mode: c.get(f"/api/v1/reports/kpi?mode={mode}&ref_date={mid}", headers=h))
+        body = {"date": mid, "shift": "早班", "order_no": "99999", "amount": 520}
+        t.case("order create", lambda: c.post("/api/v1/orders", json=body, headers=h))
+        oid = c.post("/api/v1/orders", json=body, headers=h).json()["id"]
+        t.case("order update", lambda: c.put(f"/api/v1/orders/{oid}", json=dict(body, amount=640), headers=h))
+
+def bench_web(db: Path, t: Timer, work: Path):
+    os.environ["AURUM_AUTH"] = str(work / "auth.json")
+    import app.web_ui as w
+    from fastapi.testclient import TestClient
+    mid = _mid_date(db, "orders", "odt")
+    c = TestClient(w.app)
+    c.post("/login", data={"username": "bench", "password": "bench", "mode": "setup"}, follow_redirects=False)
+    c.post("/account/update", data={"current_password": "bench", "new_kpi_pin": "1234"})
+    c.post("/kpi/guard", data={"pin": "1234"}, follow_redirects=False)
+    t.case("orders_page", lambda: c.get("/orders"))
+    t.case("orders_page day", lambda: c.get(f"/orders?from_={mid}&to={mid}"))
+    t.case("orders_page search", lambda: c.get("/orders?q=10037"))
+    t.case("orders rows json", lambda: c.get("/orders/rows"))
+    t.case("expenses_page month", lambda: c.get(f"/expenses?mode=month&dt={mid}"))
+    for mode in ("day", "month", "year"):
+        t.case(f"kpi_page {mode}", lambda mode=mode: c.get(f"/kpi?mode={mode}&dt={mid}"))
+    for scope in ("month", "year"):
+        t.case(f"export_orders_csv {scope}", lambda scope=scope: c.get(f"/export/orders.csv?scope={scope}&base={mid}"))
+        t.case(f"export_expenses_csv {scope}", lambda scope=scope: c.get(f"/export/expenses.csv?scope={scope}&base={mid}"))
+    t.case("export_sales_csv year", lambda: c.get(f"/export/sales.csv?scope=year&base={mid}"))
+    form = {"odt": mid, "shift": "早班", "order_no": "99999", "amount": "520"}
+    t.case("orders_create", lambda: c.post("/orders/create", data=form, follow_redirects=False))
+    con = sqlite3.connect(str(db)); oid = con.execute("SELECT MAX(id) FROM orders").fetchone()[0]; con.close()
+    edits = {"edits": [{"key": str(i), "id": oid, "field": "amount", "value": str(600 + i)} for i in range(20)]}
+    t.case("orders update-batch x20", lambda: c.post("/orders/update-batch", json=edits))
+
+def bench_app(db: Path, t: Timer, work: Path):
+    # app/routers 的清單端點（app.main 的 router 掛載包在 try 內，這裡直接組）；清單不分頁，只量有日期範圍的
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.auth import login_required
+    from app.routers import orders, expenses
+    from app.db import engine
+    from app.migrations import upgrade
+    upgrade(engine)                                  # 與啟動時 ensure_tables() 相同：套用受管索引
+    api = FastAPI()
+    api.include_router(orders.router)
+    api.include_router(expenses.router)
+    api.dependency_overrides[login_required] = lambda: True
+    c = TestClient(api)
+    mid = _mid_date(db, "orders", "date")
+    first = mid[:8] + "01"
+    t.case("orders day", lambda: c.get(f"/api/orders?date_from={mid}&date_to={mid}"))
+    t.case("orders month", lambda: c.get(f"/api/orders?date_from={first}&date_to={mid}"))
+    t.case("orders month status=open", lambda: c.get(f"/api/orders?date_from={first}&date_to={mid}&status=open"))
+    t.case("orders status=open (all)", lambda: c.get("/api/orders?status=open"), repeat=3)
+    t.case("orders search q", lambda: c.get(f"/api/orders?q=10037&date_from={first}&date_to={mid}"))
+    t.case("expenses month", lambda: c.get(f"/api/expenses?date_from={first}&date_to={mid}"))
+    t.case("expenses search q", lambda: c.get("/api/expenses?q=%E5%8E%9F%E6%96%99&date_from=" + first + "&date_to=" + mid))
+
+def bench_import_export(db: Path, t: Timer, work: Path):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from starlette.middleware.sessions import SessionMiddleware
+    from app import import_export
+    from app.auth import login_required
+    api = FastAPI()
+    api.add_middleware(SessionMiddleware, secret_key="bench")
+    api.include_router(import_export.router)
+    api.dependency_overrides[login_required] = lambda: True
+    c = TestClient(api)
+    t.case("export orders (all)", lambda: c.get("/data/export/orders"), repeat=3)
+    t.case("export expenses (all)", lambda: c.get("/data/export/expenses"))
+    con = sqlite3.connect(str(db)); base = con.execute("SELECT COALESCE(MAX(id),0) FROM expenses").fetchone()[0]; con.close()
+    counter = {"n": 0}
+    def do_import():
+        counter["n"] += 1
+        start = base + counter["n"] * 1000
+        body = "id,date,category,amount,owner,note\n" + "".join(
+            f"{start + i},{DATA_END.isoformat()},原料,{100 + i},bench,\n" for i in range(1000))
+        return c.post("/data/import/expenses", files={"file": ("e.csv", body.encode("utf-8"), "text/csv")})
+    t.case("import expenses x1000", do_import)
+
+def child(target: str, db_src: Path, repeat: int) -> list:
+    work = Path(tempfile.mkdtemp(prefix=f"bench-{target}-"))
+    db = work / db_src.name
+    shutil.copy2(db_src, db)                         # 寫入測試不污染快取資料集
+    sys.path.insert(0, str(ROOT))
+    if target == "server":
+        os.environ["RESTO_DB"] = str(db)
+    elif target == "web":
+        os.environ["AURUM_DB"] = str(db)
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{db}"
+    logging.getLogger("aurum.sql").setLevel(logging.ERROR)   # 量測期間不印慢查詢 log
+    t = Timer(repeat)
+    try:
+        {"server": bench_server, "web": bench_web, "app": bench_app,
+         "import_export": bench_import_export}[target](db, t, work)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(work, ignore_errors=True)
+    return t.results
+
+
+# ====================== 主行程：排程 + 彙整 ======================
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+def compare(results: list, baseline_path: Path) -> None:
+    base = json.loads(baseline_path.read_text(encoding="utf-8"))
+    idx = {(r["target"], r["size"], r["case"]): r for r in base.get("results", []) if "median_ms" in r}
+    print(f"\n[i] 與 {baseline_path.name}（{base.get('meta', {}).get('commit', '?')}）比較 median：")
+    for r in results:
+        old = idx.get((r["target"], r["size"], r["case"]))
+        if not old or "median_ms" not in r:
+            continue
+        delta = (r["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0.0
+        flag = "  ▲" if delta > 10 else ("  ▼" if delta < -10 else "")
+        print(f"  {r['target']:<13} {r['size']:>9,}  {r['case']:<34} {old['median_ms']:>10.2f} → {r['median_ms']:>10.2f} ms"
+              f"  {delta:+6.1f}%{flag}")
+
+def main():
+    ap = argparse.ArgumentParser(description="AurumLedger 效能基準")
+    ap.add_argument("--sizes", default="10k,1m", help="資料規模（訂單筆數），逗號分隔，例如 10k,1m,10m")
+    ap.add_argument("--only", default=",".join(TARGETS), help="要跑的程式：server,web,app,import_export")
+    ap.add_argument("--repeat", type=int, default=5, help="每個 case 重複次數（另有一次暖機）")
+    ap.add_argument("--out", help="結果 JSON（預設 benchmarks/results/<commit>-<時間>.json）")
+    ap.add_argument("--baseline", help="與先前的結果 JSON 比較")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--db", help=argparse.SUPPRESS)
+    ap.add_argument("--result", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        rows = child(args.child, Path(args.db), args.repeat)
+        Path(args.result).write_text(json.dumps(rows, ensure_ascii=False), encoding="utf-8")
+        return
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    targets = [t.strip() for t in args.only.split(",") if t.strip() in TARGETS]
+    results = []
+    for size in sizes:
+        for target in targets:
+            db = dataset(TARGETS[target], size)
+            print(f"\n[i] {target} × {size:,} 筆")
+            fd, res = tempfile.mkstemp(suffix=".json"); os.close(fd)
+            p, rows, err = None, None, ""
+            try:
+                p = subprocess.run([sys.executable, __file__, "--child", target, "--db", str(db),
+                                    "--repeat", str(args.repeat), "--result", res], cwd=ROOT)
+                rows = json.loads(Path(res).read_text(encoding="utf-8") or "null")
+            except Exception as e:
+                err = f"{type(e).__name__}: {e}"
+            finally:
+                os.remove(res)
+            if not rows:
+                # p 是這一輪的子行程（沒啟動成功就是 None）；例外訊息一併記下，不要只剩 exit code
+                why = "；".join(x for x in (f"exit {p.returncode}" if p else "", err) if x) or "沒有結果"
+                rows = [{"case": "*", "error": f"子行程失敗（{why}）"}]
+            results += [dict(r, target=target, size=size) for r in rows]
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{_git_rev()}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    meta = {"commit": _git_rev(), "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(), "repeat": args.repeat, "seed": SEED, "data_end": DATA_END.isoformat()}
+    out.write_text(json.dumps({"meta": meta, "results": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n[✓] 結果已寫入 {out}")
+    if args.baseline:
+        compare(results, Path(args.baseline))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+backup_incr.py
+SQLite 增量備份（內容定址去重）指令列工具，桌機版 resto.db 與 Web 版 aurum.db 皆可用。
+  python .\scripts\backup_incr.py snapshot --db resto.db
+  python .\scripts\backup_incr.py list     --db resto.db
+  python .\scripts\backup_incr.py restore  --db resto.db --at 2025-09-10T18:00
+  python .\scripts\backup_incr.py prune    --db resto.db --keep 48 --days 7
+倉庫預設為 <db>.backups/，可用 --store 指定。
+適合排程（Windows 工作排程器 / cron）每小時執行 snapshot。
+"""
+import argparse, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.utils.incr_backup import (  # noqa: E402
+    BackupError, default_store_for, snapshot, list_snapshots, restore, prune, store_size,
+)
+
+def _mb(n: int) -> str:
+    return f"{n / 1024 / 1024:,.2f} MB"
+
+def main():
+    ap = argparse.ArgumentParser(description="SQLite 增量備份")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("snapshot", "list", "restore", "prune"):
+        p = sub.add_parser(name)
+        p.add_argument("--db", required=True, help="SQLite 檔路徑")
+        p.add_argument("--store", help="備份倉庫目錄（預設 <db>.backups）")
+        if name == "snapshot":
+            p.add_argument("--label", default="", help="備註")
+        if name == "restore":
+            p.add_argument("--at", default="latest", help="快照 id、latest 或時間點 YYYY-MM-DD[THH:MM]")
+            p.add_argument("--to", help="還原到另一個檔案（預設覆寫 --db）")
+        if name == "prune":
+            p.add_argument("--keep", type=int, default=24, help="保留最新幾份（預設 24）")
+            p.add_argument("--days", type=int, default=0, help="幾天內的快照一律保留")
+    args = ap.parse_args()
+
+    db = Path(args.db).resolve()
+    store = Path(args.store).resolve() if args.store else default_store_for(db)
+    try:
+        if args.cmd == "snapshot":
+            m = snapshot(db, store, label=args.label)
+            print(f"[✓] 快照 {m['id']}：DB {_mb(m['size'])}，新塊 {m['new_chunks']}/{len(m['chunks'])}"
+                  f"（新增 {_mb(m['new_bytes'])}），倉庫共 {_mb(store_size(store))}")
+        elif args.cmd == "list":
+            snaps = list_snapshots(store)
+            if not snaps:
+                print("[i] 尚無快照"); return
+            for s in snaps:
+                print(f"  {s['id']}  {s['created']}  {_mb(s['size'])}  新塊 {s['new_chunks']}/{s['chunk_count']}  {s.get('label','')}")
+            print(f"[i] 共 {len(snaps)} 份，倉庫 {_mb(store_size(store))}")
+        elif args.cmd == "restore":
+            target = Path(args.to).resolve() if args.to else db
+            m = restore(store, args.at, target)
+            print(f"[✓] 已還原快照 {m['id']}（{m['created']}）→ {target}")
+        elif args.cmd == "prune":
+            r = prune(store, keep_last=args.keep, keep_days=args.days)
+            print(f"[✓] 移除快照 {r['snapshots_removed']} 份、資料塊 {r['objects_removed']} 個，釋放 {_mb(r['bytes_freed'])}")
+    except BackupError as e:
+        raise SystemExit(f"[!] {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+export_parquet.py
+把 resto.db（server / 桌機版）的訂單、支出匯出成依日期分割的 Parquet 資料集（app/utils/columnar.py），給 BI 排程用：
+  python .\\scripts\\export_parquet.py --db resto.db --out bi\\store-A01
+  python .\\scripts\\export_parquet.py --db resto.db --out bi --table orders --partition day --from 2025-01-01
+輸出：<out>/orders/month=2025-01/part-0.parquet …（zstd 壓縮）；
+DuckDB：SELECT * FROM read_parquet('bi/orders/*/*.parquet', hive_partitioning = true)
+未指定期間時先清掉該表目錄再寫；指定期間時只覆寫期間內的分割檔（期間請對齊分割邊界）。需要 pyarrow。
+"""
+import argparse, shutil, sqlite3, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.utils import columnar  # noqa: E402
+
+# 欄位順序同 columnar.TABLES；日期直接取 ISO 字串
+SQL = {
+    "orders": "SELECT id, date, CASE WHEN shift = 'MORNING' THEN '早班' ELSE '晚班' END, order_no, amount, memo "
+              "FROM orders {where} ORDER BY date, id",
+    "expenses": "SELECT e.id, e.date, k.name, e.amount, e.note FROM expenses e "
+                "JOIN expense_categories k ON k.id = e.category_id {where} ORDER BY e.date, e.id",
+}
+# 還沒被 server / 桌機版遷移過的舊檔：分類仍是文字欄
+LEGACY_EXPENSES = "SELECT id, date, category, amount, note FROM expenses {where} ORDER BY date, id"
+
+def main():
+    ap = argparse.ArgumentParser(description="匯出 Parquet 資料集（依日期分割）")
+    ap.add_argument("--db", required=True, help="SQLite 檔（resto.db）")
+    ap.add_argument("--out", required=True, help="輸出目錄")
+    ap.add_argument("--table", choices=("orders", "expenses", "all"), default="all")
+    ap.add_argument("--partition", choices=columnar.PARTITIONS, default="month", help="分割粒度（預設 month）")
+    ap.add_argument("--from", dest="date_from", help="起日 YYYY-MM-DD（預設全部歷史）")
+    ap.add_argument("--to", dest="date_to", help="迄日 YYYY-MM-DD")
+    args = ap.parse_args()
+
+    if not columnar.available():
+        raise SystemExit("[!] 需要 pyarrow：pip install pyarrow")
+    db = Path(args.db)
+    if not db.exists():
+        raise SystemExit(f"[!] 找不到資料庫：{db}")
+    out = Path(args.out)
+    cond, params = [], []
+    if args.date_from: cond.append("date >= ?"); params.append(args.date_from)
+    if args.date_to: cond.append("date <= ?"); params.append(args.date_to)
+
+    def open_fn(rel: str):
+        p = out / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        return open(p, "wb")
+
+    c = sqlite3.connect(db.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        for table in (["orders", "expenses"] if args.table == "all" else [args.table]):
+            t0 = time.perf_counter()
+            sql = SQL[table]
+            if table == "expenses" and "category_id" not in {r[1] for r in c.execute("PRAGMA table_info(expenses)")}:
+                sql = LEGACY_EXPENSES
+            alias = "e." if table == "expenses" and sql is not LEGACY_EXPENSES else ""
+            where = ("WHERE " + " AND ".join(alias + x for x in cond)) if cond else ""
+            rows = c.execute(sql.format(where=where), params)
+            # 整張表重匯：舊的分割可能已不存在於新資料，整個目錄清掉
+            if not cond and (out / table).exists():
+                shutil.rmtree(out / table)
+            files = columnar.write_dataset(table, rows, open_fn, args.partition)
+            n = sum(files.values())
+            print(f"[✓] {table}：{n:,} 列 → {len(files)} 個分割檔（{time.perf_counter() - t0:.1f}s）")
+    finally:
+        c.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+gen_dataset.py
+產生擬真的餐廳資料（訂單 + 支出）供效能測試用；三種 schema 皆可：
+  resto  桌機版 / server.py 的 resto.db（shift 存 MORNING/EVENING，date/category/note）
+  aurum  Web 版 app/web_ui.py 的 aurum.db（shift 存 早班/晚班，odt/cat/memo，金額整數）
+  app    app/models.py（orders: order_no/date/customer/total/status/notes；expenses 含 owner）
+用法：
+  python .\\scripts\\gen_dataset.py --schema resto --db bench\\resto.db --years 3
+  python .\\scripts\\gen_dataset.py --schema aurum --db bench\\aurum.db --rows 1000000
+  python .\\scripts\\gen_dataset.py --schema app   --db bench\\app.db   --rows 10000000 --seed 7
+同一組 --seed / --end / 參數產生的資料完全相同；預設拒絕寫入已有資料的表，可加 --append 或 --reset。
+只支援 SQLite（以 executemany 批次寫入，寫入期間關閉 journal / fsync，完成後才建索引）。
+"""
+from __future__ import annotations
+
+import argparse, math, random, sqlite3, sys, time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+BATCH = 100_000
+
+# ---------- 分布參數 ----------
+SHIFT_MORNING_RATIO = 0.45              # 早班佔比
+WEEKDAY_FACTOR = [0.85, 0.9, 0.9, 0.95, 1.1, 1.3, 1.25]   # 週一..週日
+SHORT_ORDER_NO_RATIO = 0.2              # 「37」這種只打尾碼的單號比例
+AMOUNT_MEDIAN, AMOUNT_SIGMA = 420.0, 0.65
+AMOUNT_MIN, AMOUNT_MAX = 30, 20_000
+
+EXPENSE_CATS = [   # (分類, 權重, 金額中位數, 離散)
+    ("原料", 35, 3200, 0.6), ("菜錢", 25, 1800, 0.5), ("雜支", 15, 450, 0.8),
+    ("人事", 10, 12000, 0.3), ("其他", 7, 800, 0.9), ("租金水電", 5, 6500, 0.3), ("租金", 3, 45000, 0.1),
+]
+EXPENSE_NOTES = ["", "", "", "市場", "好市多", "瓦斯", "清潔用品", "外送平台費", "修繕", "文具", "冷凍庫維修", "飲料進貨"]
+CUSTOMERS = [None, None, None, "王先生", "林小姐", "陳先生", "外送", "團購", "公司訂餐", "熟客"]
+OWNERS = ["店長", "會計", "內場", "外場"]
+ORDER_STATUS = (("paid", 0.93), ("open", 0.05), ("void", 0.02))
+
+# ---------- DDL（與各程式建立的表一致；索引在灌完資料後才建，速度快很多） ----------
+SCHEMAS = {
+    "resto": {
+        "tables": [
+            """CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER NOT NULL PRIMARY KEY, date DATE NOT NULL, shift VARCHAR(7) NOT NULL,
+                order_no VARCHAR(32) NOT NULL, amount NUMERIC(14, 2) NOT NULL, memo TEXT)""",
+            """CREATE TABLE IF NOT EXISTS expenses (
+                id INTEGER NOT NULL PRIMARY KEY, date DATE NOT NULL, category VARCHAR(50) NOT NULL,
+                amount NUMERIC(14, 2) NOT NULL, note TEXT)""",
+        ],
+        "indexes": [
+            "CREATE INDEX IF NOT EXISTS ix_orders_date ON orders (date)",
+            "CREATE INDEX IF NOT EXISTS ix_orders_shift ON orders (shift)",
+            "CREATE INDEX IF NOT EXISTS ix_orders_order_no ON orders (order_no)",
+            "CREATE INDEX IF NOT EXISTS ix_expenses_date ON expenses (date)",
+        ],
+        "order_sql": "INSERT INTO orders (date, shift, order_no, amount, memo) VALUES (?,?,?,?,?)",
+        "expense_sql": "INSERT INTO expenses (date, category, amount, note) VALUES (?,?,?,?)",
+    },
+    "aurum": {
+        "tables": [
+            """CREATE TABLE IF NOT EXISTS orders(
+                id INTEGER PRIMARY KEY AUTOINCREMENT, shift TEXT NOT NULL, order_no TEXT NOT NULL,
+                amount INTEGER NOT NULL, odt TEXT NOT NULL, ctime TEXT NOT NULL)""",
+            """CREATE TABLE IF NOT EXISTS expenses(
+                id INTEGER PRIMARY KEY AUTOINCREMENT, cat TEXT NOT NULL, amount INTEGER NOT NULL,
+                odt TEXT NOT NULL, memo TEXT DEFAULT '', ctime TEXT NOT NULL)""",
+        ],
+        "indexes": [
+            "CREATE INDEX IF NOT EXISTS idx_orders_odt_shift_id ON orders(odt, shift, id)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_order_no ON orders(order_no)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_amount   ON orders(amount)",
+            "CREATE INDEX IF NOT EXISTS idx_expenses_odt    ON expenses(odt)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_sort    ON orders(odt DESC, (CASE WHEN shift='早班' THEN 0 ELSE 1 END), id)",
+        ],
+        "order_sql": "INSERT INTO orders (odt, shift, order_no, amount, ctime) VALUES (?,?,?,?,?)",
+        "expense_sql": "INSERT INTO expenses (odt, cat, amount, memo, ctime) VALUES (?,?,?,?,?)",
+    },
+    "app": {
+        "tables": [
+            """CREATE TABLE IF NOT EXISTS users (
+                id INTEGER NOT NULL PRIMARY KEY, username VARCHAR(64) NOT NULL, password_hash VARCHAR(255) NOT NULL)""",
+            """CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER NOT NULL PRIMARY KEY, order_no VARCHAR(64) NOT NULL, date DATE NOT NULL,
+                customer VARCHAR(128), total NUMERIC(12, 2) NOT NULL, status VARCHAR(16), notes TEXT)""",
+            """CREATE TABLE IF NOT EXISTS expenses (
+                id INTEGER NOT NULL PRIMARY KEY, date DATE NOT NULL, category VARCHAR(64) NOT NULL,
+                amount NUMERIC(12, 2) NOT NULL, owner VARCHAR(64), note TEXT)""",
+        ],
+        "indexes": [
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+            "CREATE INDEX IF NOT EXISTS ix_orders_order_no ON orders (order_no)",
+            "CREATE INDEX IF NOT EXISTS ix_orders_no_date ON orders (order_no, date)",
+            "CREATE INDEX IF NOT EXISTS ix_expenses_date_cat ON expenses (date, category)",
+        ],
+        "order_sql": "INSERT INTO orders (order_no, date, customer, total, status, notes) VALUES (?,?,?,?,?,?)",
+        "expense_sql": "INSERT INTO expenses (date, category, amount, owner, note) VALUES (?,?,?,?,?)",
+    },
+}
+
+
+# ---------- 產生器 ----------
+def _poisson(rng: random.Random, lam: float) -> int:
+    """小 λ 用 Knuth，大 λ 用常態近似（夠用且快）。"""
+    if lam <= 0:
+        return 0
+    if lam > 30:
+        return max(0, int(round(rng.gauss(lam, math.sqrt(lam)))))
+    l, k, p = math.exp(-lam), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= l:
+            return k
+        k += 1
+
+def _amount(rng: random.Random, median: float, sigma: float) -> int:
+    v = rng.lognormvariate(math.log(median), sigma)
+    return int(min(AMOUNT_MAX * 10, max(AMOUNT_MIN, round(v))))
+
+def _ctime(rng: random.Random, d: date, morning: bool) -> str:
+    hour = rng.randint(10, 14) if morning else rng.randint(17, 21)
+    return datetime(d.year, d.month, d.day, hour, rng.randint(0, 59), rng.randint(0, 59)).isoformat()
+
+def iter_orders(schema: str, rng: random.Random, start: date, days: int, per_day: float):
+    """依日期遞增產生訂單 tuple（欄位順序對應 SCHEMAS[schema]['order_sql']）。"""
+    for i in range(days):
+        d = start + timedelta(days=i)
+        ds = d.isoformat()
+        n = _poisson(rng, per_day * WEEKDAY_FACTOR[d.weekday()])
+        n_m = sum(1 for _ in range(n) if rng.random() < SHIFT_MORNING_RATIO)
+        for seq in range(1, n + 1):
+            morning = seq <= n_m
+            no_seq = seq if morning else seq - n_m
+            order_no = str(no_seq) if rng.random() < SHORT_ORDER_NO_RATIO else str(10000 + no_seq)
+            amt = min(AMOUNT_MAX, _amount(rng, AMOUNT_MEDIAN, AMOUNT_SIGMA))
+            if schema == "resto":
+                yield (ds, "MORNING" if morning else "EVENING", order_no, amt, None)
+            elif schema == "aurum":
+                yield (ds, "早班" if morning else "晚班", order_no, amt, _ctime(rng, d, morning))
+            else:
+                r = rng.random()
+                status = "paid" if r < ORDER_STATUS[0][1] else ("open" if r < 1 - ORDER_STATUS[2][1] else "void")
+                yield (f"{ds.replace('-', '')}-{order_no}", ds, rng.choice(CUSTOMERS), amt, status, None)
+
+def iter_expenses(schema: str, rng: random.Random, start: date, days: int, per_day: float):
+    cats = [c[0] for c in EXPENSE_CATS]
+    weights = [c[1] for c in EXPENSE_CATS]
+    params = {c[0]: (c[2], c[3]) for c in EXPENSE_CATS}
+    for i in range(days):
+        d = start + timedelta(days=i)
+        ds = d.isoformat()
+        picks = rng.choices(cats, weights, k=_poisson(rng, per_day))
+        if d.day == 1:                              # 月初固定有房租
+            picks.append("租金")
+        for cat in picks:
+            amt = _amount(rng, *params[cat])
+            note = rng.choice(EXPENSE_NOTES)
+            if schema == "resto":
+                yield (ds, cat, amt, note or None)
+            elif schema == "aurum":
+                yield (ds, cat, amt, note, _ctime(rng, d, True))
+            else:
+                yield (ds, cat, amt, rng.choice(OWNERS), note or None)
+
+def _batched_insert(con: sqlite3.Connection, sql: str, rows, label: str) -> int:
+    total, buf, t0 = 0, [], time.perf_counter()
+    for r in rows:
+        buf.append(r)
+        if len(buf) >= BATCH:
+            con.executemany(sql, buf); total += len(buf); buf.clear()
+            print(f"\r[i] {label}：{total:,} 筆（{total / (time.perf_counter() - t0):,.0f} 筆/秒）", end="", flush=True)
+    if buf:
+        con.executemany(sql, buf); total += len(buf)
+    print(f"\r[i] {label}：{total:,} 筆，{time.perf_counter() - t0:.1f} 秒" + " " * 20)
+    return total
+
+
+def generate(schema: str, db_path, *, years: float = 1.0, rows: int = 0, orders_per_day: float = 0.0,
+             expenses_per_day: float = 4.0, end: date | None = None, seed: int = 42,
+             append: bool = False, reset: bool = False) -> dict:
+    """
+    產生資料並寫入 db_path，回傳 {"orders": n, "expenses": n, "days": n, "seconds": t}。
+    rows > 0 時以「訂單總筆數約等於 rows」回推每日單量；否則用 orders_per_day（預設 120）。
+    """
+    if schema not in SCHEMAS:
+        raise ValueError(f"未知 schema：{schema}")
+    spec = SCHEMAS[schema]
+    end = end or date.today()
+    days = max(1, int(round(years * 365)))
+    start = end - timedelta(days=days - 1)
+    if rows > 0:
+        orders_per_day = rows / days / (sum(WEEKDAY_FACTOR) / 7)
+    orders_per_day = orders_per_day or 120.0
+
+    db = Path(db_path)
+    db.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(str(db), isolation_level=None)
+    t0 = time.perf_counter()
+    try:
+        if reset:
+            for t in ("orders", "expenses"):
+                con.execute(f"DROP TABLE IF EXISTS {t}")
+        for ddl in spec["tables"]:
+            con.execute(ddl)
+        if not append:
+            for t in ("orders", "expenses"):
+                if con.execute(f"SELECT 1 FROM {t} LIMIT 1").fetchone():
+                    raise SystemExit(f"[!] {db} 的 {t} 已有資料；請加 --append 或 --reset")
+        # 灌資料期間：不寫 journal、不 fsync；完成後恢復預設
+        con.execute("PRAGMA journal_mode=OFF")
+        con.execute("PRAGMA synchronous=OFF")
+        con.execute("PRAGMA cache_size=-262144")
+        con.execute("PRAGMA temp_store=MEMORY")
+        rng_o = random.Random(f"{seed}:orders")
+        rng_e = random.Random(f"{seed}:expenses")
+        con.execute("BEGIN")
+        n_o = _batched_insert(con, spec["order_sql"], iter_orders(schema, rng_o, start, days, orders_per_day), "訂單")
+        n_e = _batched_insert(con, spec["expense_sql"], iter_expenses(schema, rng_e, start, days, expenses_per_day), "支出")
+        con.execute("COMMIT")
+        print("[i] 建立索引 …")
+        for ddl in spec["indexes"]:
+            con.execute(ddl)
+        con.execute("ANALYZE")
+        con.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        con.close()
+    return {"orders": n_o, "expenses": n_e, "days": days, "start": start.isoformat(),
+            "end": end.isoformat(), "seconds": round(time.perf_counter() - t0, 2)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="產生餐廳測試資料（訂單 + 支出）")
+    ap.add_argument("--schema", choices=sorted(SCHEMAS), required=True)
+    ap.add_argument("--db", required=True, help="輸出的 SQLite 檔")
+    ap.add_argument("--years", type=float, default=1.0, help="涵蓋幾年（預設 1）")
+    ap.add_argument("--rows", type=int, default=0, help="目標訂單筆數（給了就自動推算每日單量）")
+    ap.add_argument("--orders-per-day", type=float, default=0.0, help="平均每日訂單數（預設 120）")
+    ap.add_argument("--expenses-per-day", type=float, default=4.0, help="平均每日支出筆數（預設 4）")
+    ap.add_argument("--end", help="最後一天 YYYY-MM-DD（預設今天）")
+    ap.add_argument("--seed", type=int, default=42, help="亂數種子（預設 42）")
+    g = ap.add_mutually_exclusive_group()
+    g.add_argument("--append", action="store_true", help="表內已有資料時照樣追加")
+    g.add_argument("--reset", action="store_true", help="先刪除 orders / expenses 表")
+    args = ap.parse_args()
+
+    end = date.fromisoformat(args.end) if args.end else None
+    r = generate(args.schema, args.db, years=args.years, rows=args.rows, orders_per_day=args.orders_per_day,
+                 expenses_per_day=args.expenses_per_day, end=end, seed=args.seed,
+                 append=args.append, reset=args.reset)
+    print(f"[✓] {args.db}：訂單 {r['orders']:,}、支出 {r['expenses']:,}（{r['start']} ~ {r['end']}，{r['seconds']} 秒）")
+
+if __name__ == "__main__":
+    sys.exit(main())
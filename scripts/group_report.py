@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+group_report.py
+跨門市合併報表（與 server.py 的 /api/v1/reports/group 相同邏輯，見 app/utils/consolidate.py）：
+各店 DB 在 process pool 平行彙總，合併出集團 KPI、各店排行、支出分類排行與時間序列。
+  python .\\scripts\\group_report.py --stores stores.json
+  python .\\scripts\\group_report.py --stores stores.json --from 2025-01-01 --to 2025-06-30 --grain month
+  python .\\scripts\\group_report.py --db A01=stores\\A01\\resto.db --db B02=stores\\B02\\resto.db --json group.json
+  python .\\scripts\\group_report.py --stores stores.json --csv group-series.csv
+--stores 預設為 RESTO_STORES 或 stores.json；--only 只取部分門市。
+有門市查詢失敗時仍輸出其餘門市的合併結果，結束碼為 1。
+"""
+from __future__ import annotations
+
+import argparse, csv, json, os, sys
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.utils import consolidate, series, tenants  # noqa: E402
+
+def _money(v: float) -> str:
+    return f"{v:>14,.0f}"
+
+def _stores(args) -> list:
+    if args.db:
+        out = []
+        for spec in args.db:
+            sid, eq, path = spec.partition("=")
+            if not eq:
+                sid, path = Path(spec).stem, spec
+            out.append((sid, sid, path))
+        return out
+    sm = tenants.StoreMap(args.stores, lambda: os.getenv("RESTO_DB", "resto.db"))
+    ids = [s.strip() for s in args.only.split(",")] if args.only else sm.ids()
+    try:
+        return [(sid, sm.name(sid), sm.db_path(sid)) for sid in ids]
+    except tenants.UnknownStore as e:
+        raise SystemExit(f"[!] 設定檔 {args.stores} 沒有門市：{e}")
+
+def _print(rep: dict) -> None:
+    k = rep["kpi"]
+    print(f"[i] 期間 {rep['date_from']} ~ {rep['date_to']}，門市 {len(rep['stores'])} 家")
+    print(f"    集團營收 {_money(k['total'])}（早班 {k['morning']:,.0f} / 晚班 {k['evening']:,.0f}）"
+          f"  支出 {_money(k['expense'])}  淨額 {_money(k['net'])}")
+    print("  門市                      營收            支出            淨額   來源")
+    for s in rep["stores"]:
+        src = "快取" if s["cached"] else f"{s['ms']:.0f} ms"
+        print(f"  {s['store']:<8}{s['name']:<10}{_money(s['total'])}  {_money(s['expense'])}  {_money(s['net'])}   {src}")
+    if rep["categories"]:
+        print("  支出分類 TOP 10")
+        for c in rep["categories"][:10]:
+            print(f"    {c['category']:<16}{_money(c['amount'])}  {c['share'] * 100:5.1f}%")
+    for e in rep["errors"]:
+        print(f"[!] {e['store']}（{e['name']}）：{e['error']}")
+
+def main():
+    ap = argparse.ArgumentParser(description="跨門市合併報表")
+    ap.add_argument("--stores", default=os.getenv("RESTO_STORES", "stores.json"), help="門市設定檔（預設 stores.json）")
+    ap.add_argument("--db", action="append", help="直接指定門市 DB：代碼=路徑（可重複，給了就不讀設定檔）")
+    ap.add_argument("--only", help="逗號分隔的門市代碼")
+    ap.add_argument("--from", dest="date_from", help="起日 YYYY-MM-DD（預設 --to 當月 1 日）")
+    ap.add_argument("--to", dest="date_to", help="迄日 YYYY-MM-DD（預設今天）")
+    ap.add_argument("--grain", choices=series.GRAINS, default="day", help="時間序列粒度（預設 day）")
+    ap.add_argument("--json", help="完整結果另存 JSON")
+    ap.add_argument("--csv", help="合併時間序列另存 CSV（Excel 可開）")
+    args = ap.parse_args()
+
+    d2 = date.fromisoformat(args.date_to) if args.date_to else date.today()
+    d1 = date.fromisoformat(args.date_from) if args.date_from else d2.replace(day=1)
+    if d1 > d2:
+        raise SystemExit("[!] --from 不可晚於 --to")
+    if (d2 - d1) >= timedelta(days=series.MAX_DAYS):
+        raise SystemExit(f"[!] 期間過長（最多 {series.MAX_DAYS} 天）")
+    try:
+        rep = consolidate.group_report(_stores(args), d1, d2, args.grain)
+    finally:
+        consolidate.shutdown()
+    _print(rep)
+    if args.json:
+        Path(args.json).write_text(json.dumps(rep, default=str, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[✓] JSON → {args.json}")
+    if args.csv:
+        s = rep["series"]
+        with open(args.csv, "w", newline="", encoding="utf-8-sig") as f:
+            w = csv.writer(f)
+            w.writerow(["期間", "早班", "晚班", "營收", "支出", "淨額"])
+            w.writerows(zip(s["dates"], s["morning"], s["evening"], s["total"], s["expense"], s["net"]))
+        print(f"[✓] CSV → {args.csv}")
+    if rep["errors"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+jobs_admin.py
+查看 / 取消 / 清理背景工作佇列（app/utils/jobs.py；server.py、web_ui、桌機版共用同一種格式）：
+  python .\\scripts\\jobs_admin.py --db resto.db list
+  python .\\scripts\\jobs_admin.py --db app\\aurum.db list --status failed
+  python .\\scripts\\jobs_admin.py --dir D:\\aurum\\resto.db.jobs cancel 3f2c…
+  python .\\scripts\\jobs_admin.py --db resto.db prune          # 刪掉完成超過 AURUM_JOB_TTL_HOURS 的工作與產出檔
+  python .\\scripts\\jobs_admin.py --db resto.db recover        # 心跳逾時的執行中工作放回佇列
+佇列目錄預設為 <db 檔名>.jobs/；--dir 直接指定（對應 AURUM_JOBS_DIR）。
+"""
+import argparse, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.utils import jobs  # noqa: E402
+
+def main():
+    ap = argparse.ArgumentParser(description="背景工作佇列管理")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--db", help="SQLite 檔；佇列在 <db>.jobs/")
+    src.add_argument("--dir", help="佇列目錄（AURUM_JOBS_DIR）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ls = sub.add_parser("list", help="列出工作（新到舊）")
+    ls.add_argument("--status", choices=jobs.STATUSES)
+    ls.add_argument("--limit", type=int, default=50)
+    cc = sub.add_parser("cancel", help="取消工作")
+    cc.add_argument("job_id")
+    sub.add_parser("prune", help="清掉過期的已完成工作")
+    sub.add_parser("recover", help="收回中斷的執行中工作")
+    args = ap.parse_args()
+
+    root = Path(args.dir) if args.dir else jobs.default_dir_for(args.db)
+    if not (root / "jobs.db").exists():
+        raise SystemExit(f"[!] 找不到佇列：{root / 'jobs.db'}")
+    q = jobs.JobQueue(root)
+
+    if args.cmd == "list":
+        rows = q.list(status=args.status, limit=args.limit)
+        for j in rows:
+            print(f"  {j['id']}  {j['created']}  {j['kind']:<22}{j['status']:<10}{j['progress'] * 100:5.0f}%  "
+                  f"{j['store'] or '-'}/{j['owner'] or '-'}  {j['error'] or j['message']}")
+        print(f"[i] {len(rows)} 筆；{q.stats()}")
+    elif args.cmd == "cancel":
+        j = q.get(args.job_id)
+        if j is None:
+            raise SystemExit(f"[!] 沒有這個工作：{args.job_id}")
+        j = q.cancel(args.job_id)
+        print(f"[✓] {j['id']}：{j['status']}（執行中的工作會在下次回報進度時停下）")
+    elif args.cmd == "prune":
+        print(f"[✓] 清掉 {q.prune()} 個過期工作")
+    else:
+        print(f"[✓] 收回 {q.recover()} 個中斷的工作")
+
+if __name__ == "__main__":
+    main()
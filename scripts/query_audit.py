@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+query_audit.py
+查詢計畫稽核：在目標資料庫上實際跑一遍各程式的讀取端點，收集它們送出的 SQL（經 app/utils/sqlstats.py），
+逐條執行 EXPLAIN QUERY PLAN（PostgreSQL 用 EXPLAIN (FORMAT JSON)），標出全表掃描與暫存 B-tree 排序 / 分組，
+並提出覆蓋索引或運算式索引的建議。
+  python .\\scripts\\query_audit.py --target server --db resto.db
+  python .\\scripts\\query_audit.py --target web    --db app\\aurum.db --json audit-web.json
+  python .\\scripts\\query_audit.py --target app    --db data.db
+  python .\\scripts\\query_audit.py --target app    --url postgresql+psycopg://user:pw@host/db
+SQLite 預設在暫存複本上執行（各程式 import 時可能補建表 / 索引），--in-place 才直接用原檔。
+--strict：有全表掃描或暫存 B-tree 時結束碼為 1（可放進 CI）。
+"""
+from __future__ import annotations
+
+import argparse, base64, json, os, re, sqlite3, sys, tempfile
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+# 各程式的日期欄位（取資料最後一天當查詢基準，讓計畫跟實際資料分布一致）
+DATE_COL = {"server": ("orders", "date"), "web": ("orders", "odt"), "app": ("orders", "date")}
+
+
+# ====================== 各程式的端點情境 ======================
+# (標籤, method, path, query 參數, form 參數)；{day} {month_start} {year_start} 於執行時代入
+SCENARIOS = {
+    "server": [
+        ("orders list",          "GET", "/api/v1/orders", {}, None),
+        ("orders search no",     "GET", "/api/v1/orders", {"q": "37"}, None),
+        ("orders month+shift",   "GET", "/api/v1/orders", {"date_from": "{month_start}", "date_to": "{day}", "shift": "早班"}, None),
+        ("expenses list",        "GET", "/api/v1/expenses", {}, None),
+        ("expenses search",      "GET", "/api/v1/expenses", {"q": "原料"}, None),
+        ("kpi day",              "GET", "/api/v1/reports/kpi", {"mode": "day", "ref_date": "{day}"}, None),
+        ("kpi month",            "GET", "/api/v1/reports/kpi", {"mode": "month", "ref_date": "{day}"}, None),
+        ("kpi year",             "GET", "/api/v1/reports/kpi", {"mode": "year", "ref_date": "{day}"}, None),
+    ],
+    "web": [
+        ("orders page",          "GET", "/orders", {}, None),
+        ("orders rows",          "GET", "/orders/rows", {}, None),
+        ("orders rows search",   "GET", "/orders/rows", {"q": "37"}, None),
+        ("orders range",         "GET", "/orders", {"from_": "{month_start}", "to": "{day}"}, None),
+        ("expenses month",       "GET", "/expenses", {"mode": "month", "dt": "{day}"}, None),
+        ("expenses search",      "GET", "/expenses", {"q": "原料"}, None),
+        ("kpi month",            "GET", "/kpi", {"mode": "month", "dt": "{day}"}, None),
+        ("reports year",         "GET", "/reports", {"mode": "year", "dt": "{day}"}, None),
+        ("export orders",        "GET", "/export/orders.csv", {"scope": "month", "base": "{day}"}, None),
+        ("export expenses",      "GET", "/export/expenses.csv", {"scope": "month", "base": "{day}"}, None),
+        ("export sales",         "GET", "/export/sales.csv", {"scope": "year", "base": "{day}"}, None),
+        ("ai profit",            "POST", "/ai/analyze", {}, {"q": "本月利潤", "mode": "auto"}),
+        ("ai top3",              "POST", "/ai/analyze", {}, {"q": "本月TOP3支出分類", "mode": "auto"}),
+        ("ai order no",          "POST", "/ai/analyze", {}, {"q": "單號 37", "mode": "auto"}),
+    ],
+    "app": [
+        ("orders list",          "GET", "/api/orders", {}, None),
+        ("orders search",        "GET", "/api/orders", {"q": "ab"}, None),
+        ("orders range",         "GET", "/api/orders", {"date_from": "{month_start}", "date_to": "{day}"}, None),
+        ("expenses list",        "GET", "/api/expenses", {}, None),
+        ("expenses search",      "GET", "/api/expenses", {"q": "原料"}, None),
+    ],
+}
+
+
+# ====================== 收集 SQL ======================
+class Collector:
+    def __init__(self):
+        self.label = ""
+        self.stmts: "OrderedDict[str, dict]" = OrderedDict()
+
+    def __call__(self, sql, params, ms, many):
+        if many:
+            return
+        key = " ".join(sql.split())
+        if not key.upper().startswith(("SELECT", "WITH")):
+            return
+        st = self.stmts.setdefault(key, {"sql": sql, "params": params, "endpoints": []})
+        if self.label not in st["endpoints"]:
+            st["endpoints"].append(self.label)
+
+
+def _subst(d, ctx):
+    return {k: (v.format(**ctx) if isinstance(v, str) else v) for k, v in (d or {}).items()}
+
+def _web_session_cookie(app) -> str:
+    """用 web_ui 自己的 SessionMiddleware 金鑰簽一個已登入、已過 KPI 二次密碼的 session。"""
+    from itsdangerous import TimestampSigner
+    from starlette.middleware.sessions import SessionMiddleware
+    secret = next(m.kwargs["secret_key"] for m in app.user_middleware if m.cls is SessionMiddleware)
+    data = base64.b64encode(json.dumps({"user": "audit", "kpi_ok": True}).encode("utf-8"))
+    return TimestampSigner(str(secret)).sign(data).decode("utf-8")
+
+def build_app(target: str):
+    """回傳 (ASGI app, 額外 cookies)；驗證以 dependency override / 簽好的 session 略過。"""
+    if target == "server":
+        import server
+        server.app.dependency_overrides[server.require_user] = lambda: "audit"
+        return server.app, {}
+    if target == "web":
+        import app.web_ui as w
+        return w.app, {"session": _web_session_cookie(w.app)}
+    # app.main 的 router 掛載包在 try 內（任一 router 載入失敗就全部略過），這裡直接組一個只含清單端點的 app
+    from fastapi import FastAPI
+    from app.auth import login_required
+    from app.routers import orders, expenses
+    api = FastAPI()
+    api.include_router(orders.router)
+    api.include_router(expenses.router)
+    api.dependency_overrides[login_required] = lambda: True
+    return api, {}
+
+def collect(target: str, day: date) -> Collector:
+    from fastapi.testclient import TestClient
+    from app.utils import sqlstats
+
+    col = Collector()
+    sqlstats.add_listener(col)
+    app, cookies = build_app(target)
+    ctx = {"day": day.isoformat(), "month_start": day.replace(day=1).isoformat(),
+           "year_start": day.replace(month=1, day=1).isoformat()}
+    with TestClient(app, cookies=cookies) as c:
+        for label, method, path, params, form in SCENARIOS[target]:
+            col.label = label
+            r = c.request(method, path, params=_subst(params, ctx), data=_subst(form, ctx) if form else None,
+                          follow_redirects=False)
+            if r.status_code >= 400 or r.status_code in (302, 303):
+                print(f"[!] {label}：{method} {path} → HTTP {r.status_code}")
+        if target == "server":
+            _desktop_queries(col, day)
+    return col
+
+def _desktop_queries(col: Collector, day: date) -> None:
+    """桌機版（aurum_gui.py）與 server.py 共用 resto schema；GUI 不能在這裡開，直接以相同 ORM 查詢重現。"""
+    import server
+    from sqlalchemy import and_, func
+    E, O, C = server.Expense, server.Order, server.ExpenseCategory
+    d1, d2 = day.replace(day=1), day
+    with server.SessionLocal() as s:
+        col.label = "desktop: AI top3"
+        agg = s.query(E.category_id.label("cid"), func.sum(E.amount).label("total")) \
+               .filter(and_(E.date >= d1, E.date <= d2)).group_by(E.category_id).subquery()
+        s.query(C.name, agg.c.total).join(agg, agg.c.cid == C.id).order_by(agg.c.total.desc()).all()
+        col.label = "desktop: reports"
+        s.query(O.date, O.shift, func.sum(O.amount)).filter(and_(O.date >= d1, O.date <= d2)) \
+         .group_by(O.date, O.shift).all()
+        s.query(E.date, func.sum(E.amount)).filter(and_(E.date >= d1, E.date <= d2)).group_by(E.date).all()
+
+
+# ====================== 建議 ======================
+_COND = re.compile(r"(?:\b\w+\.)?(\w+)\s*(=|>=|<=|<>|!=|<|>|\bIN\b|\bBETWEEN\b|\bLIKE\b)", re.I)
+
+def _clause(sql: str, start: str, stops) -> str:
+    m = re.search(rf"\b{start}\b(.*?)(?:\b(?:{'|'.join(stops)})\b|$)", sql, re.I | re.S)
+    return m.group(1).strip() if m else ""
+
+def _strip_tables(expr: str) -> str:
+    return re.sub(r"\b\w+\.(\w+)", r"\1", expr)
+
+def suggest(sql: str, table: str, kind: str) -> list:
+    flat = " ".join(sql.split())
+    where = _clause(flat, "WHERE", ["GROUP BY", "ORDER BY", "LIMIT", "HAVING"])
+    out = []
+    if kind == "scan":
+        if re.search(r"LIKE\s+(\?|'%|%\()", where, re.I) and re.search(r"lower\s*\(", where, re.I):
+            out.append("lower(欄位) LIKE '%…%'（前置萬用字元）無法走 B-tree：改前綴比對（LIKE '37%'）、"
+                       "SQLite FTS5，或 PostgreSQL pg_trgm GIN 索引")
+        elif re.search(r"LIKE", where, re.I):
+            out.append("前置 % 的 LIKE 無法走 B-tree：改前綴比對或全文索引（FTS5 / pg_trgm）")
+        for fn_col in re.findall(r"lower\s*\(\s*(?:\w+\.)?(\w+)\s*\)\s*=", where, re.I):
+            out.append(f"CREATE INDEX idx_{table}_lower_{fn_col} ON {table}(lower({fn_col}));")
+        eq, rng = [], []
+        for c, op in _COND.findall(where):
+            c = c.lower()
+            if c in ("lower", "and", "or", "not"):
+                continue
+            (eq if op == "=" or op.upper() == "IN" else rng).append(c)
+        cols = list(OrderedDict.fromkeys(eq + rng))
+        if cols and not out:
+            out.append(f"CREATE INDEX idx_{table}_{'_'.join(cols)} ON {table}({', '.join(cols)});  -- 等值欄位在前、範圍欄位在後")
+        if not where:
+            out.append("沒有 WHERE：確認是否需要分頁（LIMIT + keyset）或只取需要的欄位")
+    elif kind.startswith("temp"):
+        what = kind.split(":", 1)[1]
+        if what == "GROUP BY":
+            grp = _strip_tables(_clause(flat, "GROUP BY", ["HAVING", "ORDER BY", "LIMIT"]))
+            aggs = [_strip_tables(a) for a in re.findall(r"\b(?:sum|count|avg|min|max)\s*\(\s*([\w.]+)\s*\)", flat, re.I)]
+            rng = [c for c, op in _COND.findall(where) if op in (">=", "<=", "<", ">") or op.upper() == "BETWEEN"]
+            cols = list(OrderedDict.fromkeys([g.strip() for g in grp.split(",") if g.strip()] + aggs))
+            out.append(f"覆蓋索引：CREATE INDEX idx_{table}_grp ON {table}({', '.join(cols)});  -- 依分組欄位順序讀取，免暫存 B-tree")
+            if rng:
+                rng = list(OrderedDict.fromkeys(c.lower() for c in rng))
+                full = list(OrderedDict.fromkeys(rng + cols))
+                out.append(f"有範圍條件（{', '.join(rng)}）時 SQLite 仍會先依範圍掃再分組；"
+                           f"資料量大時可改 ({', '.join(full)}) 讓查詢只讀索引")
+        elif re.search(r"\bGROUP BY\b", flat, re.I):
+            out.append("分組後再依聚合值排序（如 TOP N）一定要排序，但只排分組結果；重點是讓分組本身走索引")
+        else:
+            order = _strip_tables(_clause(flat, "ORDER BY", ["LIMIT", "OFFSET"]))
+            if order:
+                out.append(f"CREATE INDEX idx_{table}_order ON {table}({order});  -- 運算式 / 方向需與 ORDER BY 完全一致")
+    return out
+
+
+# ====================== 執行計畫 ======================
+_SCAN = re.compile(r"^SCAN (\w+)(?: USING (COVERING )?INDEX (\w+))?")
+_TEMP = re.compile(r"USE TEMP B-TREE FOR (.+)$")
+
+def explain_sqlite(con: sqlite3.Connection, stmt: dict, tables: set) -> dict:
+    sql, params = stmt["sql"], stmt["params"]
+    if isinstance(params, list):
+        params = tuple(params)
+    try:
+        plan = [r[3] for r in con.execute("EXPLAIN QUERY PLAN " + sql, params or ())]
+    except sqlite3.Error as e:
+        return {"plan": [], "issues": [{"level": "error", "what": f"EXPLAIN 失敗：{e}"}]}
+    issues = []
+    main_table = (re.search(r"\bFROM\s+(\w+)", sql, re.I) or [None, ""])[1]
+    # 沒有 WHERE、有 LIMIT、也不需排序：依 rowid / 索引順序讀到 LIMIT 就停，不算問題
+    early_stop = (not re.search(r"\bWHERE\b", sql, re.I) and re.search(r"\bLIMIT\b", sql, re.I)
+                  and not any(_TEMP.search(l) for l in plan))
+    for line in plan:
+        m = _SCAN.match(line)
+        if m and m.group(1) in tables and not early_stop:
+            t = m.group(1)
+            if m.group(3) is None:
+                issues.append({"level": "high", "what": f"全表掃描 {t}", "suggest": suggest(sql, t, "scan")})
+            elif not m.group(2):
+                issues.append({"level": "medium", "what": f"整個索引掃描 {t}（{m.group(3)}，非覆蓋，需回表）",
+                               "suggest": suggest(sql, t, "scan")})
+        m = _TEMP.search(line)
+        if m:
+            what = "ORDER BY" if "ORDER BY" in m.group(1) else m.group(1)
+            issues.append({"level": "high" if what in ("ORDER BY", "GROUP BY") else "medium",
+                           "what": f"暫存 B-tree：{m.group(1)}", "suggest": suggest(sql, main_table, f"temp:{what}")})
+    return {"plan": plan, "issues": issues}
+
+def explain_pg(engine, stmt: dict) -> dict:
+    sql, params = stmt["sql"], stmt["params"]
+    try:
+        with engine.connect() as conn:
+            raw = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql, params).scalar()
+    except Exception as e:
+        return {"plan": [], "issues": [{"level": "error", "what": f"EXPLAIN 失敗：{e}"}]}
+    doc = raw if isinstance(raw, list) else json.loads(raw)
+    plan, issues = [], []
+
+    def walk(node, depth=0):
+        nt = node.get("Node Type", "")
+        rel = node.get("Relation Name", "")
+        plan.append("  " * depth + f"{nt} {rel}".strip() + (f" (rows≈{node.get('Plan Rows')})" if "Plan Rows" in node else ""))
+        if nt == "Seq Scan":
+            issues.append({"level": "high", "what": f"全表掃描 {rel}", "suggest": suggest(sql, rel, "scan")})
+        elif nt in ("Sort", "Incremental Sort"):
+            issues.append({"level": "high", "what": f"排序 {', '.join(node.get('Sort Key', []))}",
+                           "suggest": suggest(sql, (re.search(r"\bFROM\s+(\w+)", sql, re.I) or [None, ""])[1], "temp:ORDER BY")})
+        for ch in node.get("Plans", []) or []:
+            walk(ch, depth + 1)
+
+    walk(doc[0]["Plan"])
+    return {"plan": plan, "issues": issues}
+
+
+# ====================== 主程式 ======================
+def _latest_day(con: sqlite3.Connection, target: str) -> date:
+    t, c = DATE_COL[target]
+    try:
+        v = con.execute(f"SELECT MAX({c}) FROM {t}").fetchone()[0]
+        return date.fromisoformat(str(v)[:10]) if v else date.today()
+    except (sqlite3.Error, ValueError):
+        return date.today()
+
+def _prepare_sqlite(args) -> Path:
+    src = Path(args.db)
+    if not src.exists():
+        raise SystemExit(f"[!] 找不到資料庫：{src}")
+    if args.in_place:
+        return src.resolve()
+    tmp = Path(tempfile.mkdtemp(prefix="query_audit_")) / src.name
+    with sqlite3.connect(src) as s, sqlite3.connect(tmp) as d:
+        s.backup(d)
+    return tmp
+
+def main():
+    ap = argparse.ArgumentParser(description="AurumLedger 查詢計畫稽核")
+    ap.add_argument("--target", choices=sorted(SCENARIOS), required=True)
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--db", help="SQLite 檔")
+    g.add_argument("--url", help="SQLAlchemy URL（PostgreSQL；只適用 --target app）")
+    ap.add_argument("--day", help="查詢基準日 YYYY-MM-DD（預設為資料最後一天）")
+    ap.add_argument("--in-place", action="store_true", help="SQLite 不建暫存複本，直接使用原檔")
+    ap.add_argument("--show-plan", action="store_true", help="沒有問題的語句也列出執行計畫")
+    ap.add_argument("--json", help="結果另存 JSON")
+    ap.add_argument("--strict", action="store_true", help="有 high 等級問題時結束碼 1")
+    args = ap.parse_args()
+
+    if args.url and args.target != "app":
+        raise SystemExit("[!] --url 只支援 --target app（server.py / web_ui 只用 SQLite）")
+
+    con = engine = None
+    if args.db:
+        db = _prepare_sqlite(args)
+        con = sqlite3.connect(db)
+        os.environ.update({"server": {"RESTO_DB": str(db)},
+                           "web": {"AURUM_DB": str(db), "AURUM_AUTH": str(db.with_name("audit-auth.json"))},
+                           "app": {"DATABASE_URL": f"sqlite:///{db}"}}[args.target])
+        day = date.fromisoformat(args.day) if args.day else _latest_day(con, args.target)
+    else:
+        os.environ["DATABASE_URL"] = args.url
+        day = date.fromisoformat(args.day) if args.day else date.today()
+
+    print(f"[i] {args.target}：收集端點 SQL（基準日 {day}）…")
+    col = collect(args.target, day)
+    if con is not None:
+        tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    else:
+        from app.db import engine
+
+    report, n_high = [], 0
+    for key, st in col.stmts.items():
+        res = explain_sqlite(con, st, tables) if con is not None else explain_pg(engine, st)
+        report.append({"sql": key, "endpoints": st["endpoints"], **res})
+        n_high += sum(1 for i in res["issues"] if i["level"] in ("high", "error"))
+        if not res["issues"] and not args.show_plan:
+            continue
+        print(f"\n── {', '.join(st['endpoints'])}")
+        print(f"   {key if len(key) <= 300 else key[:300] + ' …'}")
+        for line in res["plan"]:
+            print(f"     · {line}")
+        for i in res["issues"]:
+            print(f"   [{i['level']}] {i['what']}")
+            for s in i.get("suggest", []):
+                print(f"       → {s}")
+
+    clean = sum(1 for r in report if not r["issues"])
+    print(f"\n[✓] {len(report)} 條語句：{clean} 條無問題、{len(report) - clean} 條有標記（high/error {n_high}）")
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.json).write_text(json.dumps({"target": args.target, "day": day.isoformat(), "statements": report},
+                                              ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[✓] 結果已寫入 {args.json}")
+    return 1 if args.strict and n_high else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,24 @@
 # -*- coding: utf-8 -*-
 # AurumLedger Web API（與桌機版共用 DB 與 auth.json）
 # - 資料庫：沿用 RESTO_DB=resto.db
-# - 登入：沿用 auth.json（PBKDF2），成功後給 JWT
-# - 端點：/api/v1/orders, /api/v1/expenses, /api/v1/reports/*
+# - 登入：沿用 auth.json（PBKDF2），成功後給短效 JWT + 可換發的 refresh token
+# - 端點：/api/v1/orders, /api/v1/expenses, /api/v1/reports/*（/reports/group 為跨門市合併）
+# - 背景工作：大量匯出加 ?async=1 改排入工作佇列（RESTO_DB 旁的 <db>.jobs/），/api/v1/jobs 查進度、下載產出檔
+# - 多門市：RESTO_STORES（預設 stores.json）列出各店的 DB，登入時帶 store，JWT 內含 store → 各店各自的 engine
 # - 文件：/docs
 
-import os, json, base64, hashlib, hmac, enum
+import os, json, base64, enum, hashlib, hmac, secrets, tempfile, threading, zipfile
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta
 from decimal import Decimal
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
-from fastapi import FastAPI, HTTPException, Depends, Query, Security
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Security
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 import jwt  # PyJWT
 
 # SQLAlchemy 2.x（相容 declarative_base）
@@ -22,10 +28,13 @@ except Exception:
     from sqlalchemy.ext.declarative import declarative_base
 
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Date, Enum as SAEnum, Numeric, Text,
-    func, and_, or_, select
+    create_engine, Column, ForeignKey, Index, Integer, String, Date, DateTime, Boolean, Enum as SAEnum, Numeric, Text,
+    Float, func, and_, or_, select, update, delete, case, literal, type_coerce, union_all
 )
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.exc import OperationalError
+
+from app.utils import analytics, categories, columnar, consolidate, hashing, jobs, jsonstore, metrics, periods, pivot, profiling, series, sqlstats, tenants, xlsx
 
 # ------------------------------
 # 設定
@@ -35,10 +44,14 @@ APP_VERSION = "1.0.0"
 CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "*").split(",")]
 DB_PATH = os.getenv("RESTO_DB", "resto.db")
 DATABASE_URL = f"sqlite:///{DB_PATH}"
+STORES_FILE = os.getenv("RESTO_STORES", "stores.json")   # 不存在 = 單店，只有 default → DB_PATH
+JOBS_DIR = os.getenv("AURUM_JOBS_DIR") or str(jobs.default_dir_for(DB_PATH))
 
 JWT_SECRET = os.getenv("JWT_SECRET", "CHANGE_ME")  # 上線請改強隨機字串
 JWT_ALG = "HS256"
-TOKEN_HOURS = int(os.getenv("TOKEN_HOURS", "12"))
+TOKEN_HOURS = int(os.getenv("TOKEN_HOURS", "12"))              # 登入後免輸密碼的最長時間（refresh token 壽命）
+ACCESS_MINUTES = int(os.getenv("ACCESS_MINUTES", "15"))        # access token 壽命
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))  # 已驗證 access token 的 LRU 筆數
 
 # ------------------------------
 # FastAPI
@@ -54,10 +67,20 @@ app.add_middleware(
 # ------------------------------
 # 資料庫
 # ------------------------------
-engine = create_engine(DATABASE_URL, future=True, echo=False)
+# 每家門市一個 engine；連線池 = 門市併發上限（tenants.LIMIT）+ 少量餘裕（分類快取另開的短交易）
+POOL_KW = dict(pool_size=tenants.LIMIT, max_overflow=2)
+engine = create_engine(DATABASE_URL, future=True, echo=False, **POOL_KW)
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, future=True)
 Base = declarative_base()
 
+# 每路由延遲 / 狀態碼 / 回應大小 + 連線池、threadpool 使用量 → GET /metrics（Prometheus 文字格式）
+_metrics = metrics.install(app, name="server", engines={"resto": engine})
+# 每請求 SQL 條數 / 時間（X-SQL-Count、X-SQL-Time-ms）、慢查詢與重複語句 → logger "aurum.sql"
+sqlstats.instrument_engine(engine)
+sqlstats.install(app)
+# 管理員單次剖析（X-Profile 標頭或簽章 ?_profile=）；未設定 AURUM_PROFILE_KEY 時不掛
+profiling.install(app)
+
 class Shift(str, enum.Enum):
     MORNING = "早班"
     EVENING = "晚班"
@@ -70,19 +93,109 @@ class Order(Base):
     order_no = Column(String(32), nullable=False, index=True)
     amount = Column(Numeric(14,2), nullable=False)
     memo = Column(Text)
+    # 日期範圍彙總（KPI / 比較 / 時間序列）只讀這三欄 → covering index，免回表
+    __table_args__ = (Index("ix_orders_date_shift_amount", "date", "shift", "amount"),)
+
+class ExpenseCategory(Base):
+    """支出分類維度表（app/utils/categories.py）；expenses 只存整數 category_id。"""
+    __tablename__ = categories.TABLE
+    id = Column(Integer, primary_key=True)
+    name = Column(String(categories.NAME_MAX), nullable=False, unique=True)
 
 class Expense(Base):
     __tablename__ = "expenses"
     id = Column(Integer, primary_key=True)
     date = Column(Date, nullable=False, index=True)
-    category = Column(String(50), nullable=False)
+    category_id = Column(Integer, ForeignKey(f"{categories.TABLE}.id"), nullable=False)
     amount = Column(Numeric(14,2), nullable=False)
     note = Column(Text)
+    # 分類樞紐表 GROUP BY 日期, 分類 只讀這三欄 → covering index，依索引順序直接分組、免暫存排序
+    # （索引名沿用文字欄位時期的名稱，舊檔遷移後同名索引已改建在 category_id 上）
+    __table_args__ = (Index("ix_expenses_date_category_amount", "date", "category_id", "amount"),)
+
+class RefreshToken(Base):
+    """
+    伺服器端 refresh token：只存 HMAC 摘要；每次 refresh 換發新 token（rotation），
+    同一登入的所有 token 共用 family，舊 token 被重用時整個 family 作廢。
+    """
+    __tablename__ = "auth_refresh_tokens"
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    family = Column(String(32), nullable=False, index=True)
+    sub = Column(String(64), nullable=False)
+    issued_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used_at = Column(DateTime)
+    revoked = Column(Boolean, nullable=False, default=False)
+
+# ------------------------------
+# 門市（tenant）
+# ------------------------------
+class StoreDB:
+    """一家門市的資料庫：engine、Session factory、分類 id 快取（寫入支出時以名稱換 id）。"""
+    def __init__(self, path: str, eng, session_factory):
+        self.path, self.engine, self.Session = path, eng, session_factory
+        self.categories = categories.CategoryCache(eng.begin)
+
+DEFAULT_DB = StoreDB(DB_PATH, engine, SessionLocal)
+
+def _prepare(store: StoreDB):
+    # 舊 resto.db 的 expenses.category 仍是文字 → 先換成 category_id（與桌機版共用，先啟動的那邊做）
+    if os.path.exists(store.path):
+        categories.migrate_sqlite(store.path, "category", "category_id")
+    Base.metadata.create_all(bind=store.engine)
+    # create_all 只在建表時一併建索引；既有的 resto.db 補建後來新增的索引
+    for t in Base.metadata.sorted_tables:
+        for ix in t.indexes:
+            ix.create(bind=store.engine, checkfirst=True)
+
+def _open_store(store: str, path: str) -> StoreDB:
+    if os.path.abspath(path) == os.path.abspath(DB_PATH):
+        return DEFAULT_DB                       # 單店模式，或設定檔指到同一個檔
+    eng = create_engine(f"sqlite:///{path}", future=True, echo=False, **POOL_KW)
+    db = StoreDB(path, eng, sessionmaker(bind=eng, expire_on_commit=False, future=True))
+    _prepare(db)
+    sqlstats.instrument_engine(eng)             # schema 檢查完才掛，否則會算進第一個請求的 SQL 統計
+    return db
+
+def _close_store(db: StoreDB):
+    if db is not DEFAULT_DB:
+        db.engine.dispose()
+
+TENANTS = tenants.TenantRouter(tenants.StoreMap(STORES_FILE, lambda: DB_PATH), _open_store, _close_store,
+                               pinned={tenants.DEFAULT_STORE})
+_metrics.gauge("aurum_tenant_requests", "各門市進行中的請求 / 上限 / 累計拒絕數", TENANTS.samples)
+
+# 背景工作（大量匯出）：佇列存在 JOBS_DIR/jobs.db，產出檔在 JOBS_DIR/artifacts/；處理函式在「匯出」段註冊
+JOBS = jobs.JobQueue(JOBS_DIR, name="jobs")
+_metrics.gauge("aurum_jobs", "背景工作數（依狀態）",
+               lambda: [({"status": s}, float(JOBS.stats()[s])) for s in jobs.STATUSES])
+
+@contextmanager
+def store_session(store: str):
+    """取該門市一個併發名額與 Session；名額滿丟 TenantBusy（→ 429），門市不存在丟 UnknownStore（→ 403）。"""
+    with TENANTS.slot(store) as sdb:
+        db = sdb.Session()
+        db.info["store"] = sdb
+        try:
+            yield db
+        finally:
+            db.close()
 
-# 啟動時確保資料表存在（與桌機版共存）
+def _store_of(db: Session) -> StoreDB:
+    return db.info.get("store", DEFAULT_DB)
+
+# 啟動時確保資料表存在（與桌機版共存）；其他門市在第一次用到時才初始化
 @app.on_event("startup")
 def _create_tables():
-    Base.metadata.create_all(bind=engine)
+    _prepare(DEFAULT_DB)
+    JOBS.start()                                # 上次行程中斷的工作在這裡收回重排
+
+@app.on_event("shutdown")
+def _close_stores():
+    JOBS.stop()
+    TENANTS.close_all()
+    consolidate.shutdown()
 
 # ------------------------------
 # auth.json 相容驗證
@@ -90,50 +203,151 @@ def _create_tables():
 AUTH_FILE = "auth.json"
 
 def _safe_read_json(path: str):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return None
+    # 解析結果快取在記憶體，檔案 mtime/inode/size 變了才重讀（桌機版改密碼後立即生效）
+    return jsonstore.store_for(path).load()
 
-def _verify_password(pw: str, salt_b64: str, hash_b64: str) -> bool:
+async def _verify_password(pw: str, salt_b64: str, hash_b64: str) -> bool:
     try:
         salt = base64.b64decode(salt_b64.encode())
         target = base64.b64decode(hash_b64.encode())
     except Exception:
         return False
-    dk = hashlib.pbkdf2_hmac("sha256", pw.encode(), salt, 200_000)
-    return hmac.compare_digest(dk, target)
+    # 200k 次 PBKDF2 交給雜湊專用 process pool，不佔 request 執行緒
+    return await hashing.pbkdf2_verify(pw, salt, 200_000, target)
 
-def verify_user(code: str, pw: str) -> bool:
+async def verify_user(code: str, pw: str) -> bool:
     d = _safe_read_json(AUTH_FILE)
     if not d:
         return False
     u = d.get("user", {})
-    return (u.get("code") == code.strip()) and _verify_password(pw or "", u.get("salt", ""), u.get("hash", ""))
+    if u.get("code") != code.strip():
+        return False
+    return await _verify_password(pw or "", u.get("salt", ""), u.get("hash", ""))
+
+# SQLite 寫鎖逾時：回 503 + Retry-After，讓用戶端知道是暫時性的（壓測也靠這個統計鎖競爭）
+@app.exception_handler(OperationalError)
+async def _db_operational(_req: Request, exc: OperationalError):
+    if "locked" in str(exc.orig).lower():
+        return JSONResponse({"detail": "database is locked"}, status_code=503, headers={"Retry-After": "1"})
+    return JSONResponse({"detail": "database error"}, status_code=500)
+
+@app.exception_handler(hashing.HashBusy)
+async def _hash_busy(_req: Request, exc: hashing.HashBusy):
+    return JSONResponse({"detail": "too many login attempts, retry later"}, status_code=429,
+                        headers={"Retry-After": str(exc.retry_after)})
+
+# 單一門市的併發名額用完：只擋這家，其他門市不受影響
+@app.exception_handler(tenants.TenantBusy)
+async def _tenant_busy(_req: Request, exc: tenants.TenantBusy):
+    return JSONResponse({"detail": "store is busy, retry later"}, status_code=429,
+                        headers={"Retry-After": str(exc.retry_after)})
+
+# Arrow / Parquet 匯出需要選用的 pyarrow
+@app.exception_handler(columnar.ArrowUnavailable)
+async def _arrow_unavailable(_req: Request, exc: columnar.ArrowUnavailable):
+    return JSONResponse({"detail": str(exc)}, status_code=501)
+
+@app.exception_handler(tenants.UnknownStore)
+async def _unknown_store(_req: Request, exc: tenants.UnknownStore):
+    return JSONResponse({"detail": "unknown store"}, status_code=403)
 
 # ------------------------------
 # JWT
 # ------------------------------
 auth_scheme = HTTPBearer()
+_optional_auth = HTTPBearer(auto_error=False)
 
-def create_token(sub: str) -> str:
+def create_token(sub: str, store: str = tenants.DEFAULT_STORE) -> str:
     payload = {
         "sub": sub,
-        "exp": datetime.utcnow() + timedelta(hours=TOKEN_HOURS),
+        "store": store,
+        "exp": datetime.utcnow() + timedelta(minutes=ACCESS_MINUTES),
         "iat": datetime.utcnow(),
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
-def require_user(cred: HTTPAuthorizationCredentials = Security(auth_scheme)) -> str:
+# 已驗證 access token 的 LRU：token -> (sub, store, exp)；命中時只比對到期時間，不再 jwt.decode
+_token_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+def _claims(token: str) -> Tuple[str, str]:
+    now = datetime.utcnow().timestamp()
+    with _token_cache_lock:
+        hit = _token_cache.get(token)
+        if hit:
+            if hit[2] > now:
+                _token_cache.move_to_end(token)
+                return hit[0], hit[1]
+            del _token_cache[token]
     try:
-        payload = jwt.decode(cred.credentials, JWT_SECRET, algorithms=[JWT_ALG])
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
         sub = payload.get("sub")
         if not sub:
             raise ValueError("no sub")
-        return sub
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    store = payload.get("store") or tenants.DEFAULT_STORE     # 多門市之前簽發的 token 屬於 default
+    with _token_cache_lock:
+        _token_cache[token] = (sub, store, float(payload.get("exp", now)))
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return sub, store
+
+def require_user(cred: HTTPAuthorizationCredentials = Security(auth_scheme)) -> str:
+    return _claims(cred.credentials)[0]
+
+def current_store(cred: Optional[HTTPAuthorizationCredentials] = Security(_optional_auth)) -> str:
+    """token 內的門市；沒帶 token 的請求（由 require_user 擋下）視為 default。"""
+    return _claims(cred.credentials)[1] if cred else tenants.DEFAULT_STORE
+
+# ---- refresh token（存 HMAC 摘要；驗證只做 HMAC + 一次查表，不碰 PBKDF2 / auth.json）----
+def _refresh_digest(token: str) -> str:
+    return hmac.new(JWT_SECRET.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+def refresh_store(token: str) -> str:
+    """refresh token 存在該門市的 DB；非 default 門市的 token 以「門市代碼.」開頭，換發時才知道去哪家查。"""
+    store, dot, _rest = token.partition(".")
+    return store if dot else tenants.DEFAULT_STORE
+
+def issue_refresh(db: Session, sub: str, family: Optional[str] = None, store: str = tenants.DEFAULT_STORE) -> str:
+    token = secrets.token_urlsafe(32)
+    if store != tenants.DEFAULT_STORE:
+        token = f"{store}.{token}"
+    now = datetime.utcnow()
+    db.add(RefreshToken(token_hash=_refresh_digest(token), family=family or secrets.token_hex(16),
+                        sub=sub, issued_at=now, expires_at=now + timedelta(hours=TOKEN_HOURS)))
+    return token
+
+def rotate_refresh(db: Session, token: str) -> tuple:
+    """驗證並換發：回傳 (sub, 新 refresh token)；重用已換過的 token 視為外洩，整個 family 作廢。"""
+    digest = _refresh_digest(token)
+    row = db.execute(select(RefreshToken).where(RefreshToken.token_hash == digest)).scalar_one_or_none()
+    now = datetime.utcnow()
+    if not row or row.revoked or row.expires_at <= now:
+        raise HTTPException(401, "invalid refresh token")
+    # 以條件式 UPDATE 搶「第一次使用」：同一 token 併發換發只有一個 rowcount = 1，其餘視為重用
+    claimed = db.execute(update(RefreshToken)
+                         .where(RefreshToken.token_hash == digest, RefreshToken.used_at.is_(None),
+                                RefreshToken.revoked.is_(False))
+                         .values(used_at=now)
+                         .execution_options(synchronize_session=False)).rowcount
+    if claimed != 1:
+        db.rollback()
+        db.execute(update(RefreshToken).where(RefreshToken.family == row.family).values(revoked=True)
+                   .execution_options(synchronize_session=False))
+        db.commit()
+        raise HTTPException(401, "refresh token reused")
+    new_token = issue_refresh(db, row.sub, row.family, refresh_store(token))
+    db.commit()
+    return row.sub, new_token
+
+def revoke_refresh_family(db: Session, token: str) -> bool:
+    row = db.execute(select(RefreshToken).where(RefreshToken.token_hash == _refresh_digest(token))).scalar_one_or_none()
+    if not row:
+        return False
+    db.execute(update(RefreshToken).where(RefreshToken.family == row.family).values(revoked=True))
+    db.commit()
+    return True
 
 # ------------------------------
 # Pydantic（v2）
@@ -144,10 +358,16 @@ from typing import Literal
 class LoginIn(BaseModel):
     code: str
     password: str
+    store: str = tenants.DEFAULT_STORE      # 多門市時登入哪一家（GET /api/v1/stores 可列出）
 
 class TokenOut(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    expires_in: int = ACCESS_MINUTES * 60
+    refresh_token: Optional[str] = None
+
+class RefreshIn(BaseModel):
+    refresh_token: str
 
 class OrderIn(BaseModel):
     date: date
@@ -182,33 +402,192 @@ class KPIOut(BaseModel):
     net: float
     period_label: str
 
+class ComparePeriod(BaseModel):
+    label: str
+    date_from: date
+    date_to: date
+    morning: float
+    evening: float
+    total: float
+    expense: float
+    net: float
+    delta_total: Optional[float] = None     # 與前一期的差額 / 百分比（第一期為 null）
+    delta_total_pct: Optional[float] = None
+    delta_net: Optional[float] = None
+    delta_net_pct: Optional[float] = None
+
+class CompareOut(BaseModel):
+    mode: str
+    periods: List[ComparePeriod]
+
+class WeekdayIndex(BaseModel):
+    weekday: str                            # 一 … 日
+    mean: float                             # 近 8 週該星期的平均營收
+    index: float                            # 相對於七天平均（1.0 = 平均）
+
+class MonthProjection(BaseModel):
+    month: str
+    days_elapsed: int
+    days_left: int
+    revenue_mtd: float
+    expense_mtd: float
+    revenue_projected: float
+    expense_projected: float
+    net_projected: float
+    last_month_revenue: float
+    last_year_revenue: float
+    vs_last_month_pct: Optional[float] = None
+    vs_last_year_pct: Optional[float] = None
+
+class AnalyticsTail(BaseModel):
+    dates: List[str]
+    total: List[float]
+    expense: List[float]
+    ma7: List[Optional[float]]
+    ma28: List[Optional[float]]
+
+class AnalyticsOut(BaseModel):
+    ref_date: date
+    ma7: Optional[float] = None
+    ma28: Optional[float] = None
+    trend_pct: Optional[float] = None       # 7 日均相對 28 日均
+    weekday: List[WeekdayIndex]
+    projection: MonthProjection
+    tail: AnalyticsTail                     # 近 56 天每日營收 / 支出與均線（畫圖用）
+    brief: List[str]
+
+class PivotOut(BaseModel):
+    grain: str
+    date_from: date
+    date_to: date
+    periods: List[str]                      # 列：日 YYYY-MM-DD / 月 YYYY-MM（含沒有支出的期間）
+    categories: List[str]                   # 欄：依總額由大到小
+    matrix: List[List[float]]               # matrix[期間][分類]
+    row_totals: List[float]
+    col_totals: List[float]
+    total: float
+
+class GroupStore(BaseModel):
+    store: str
+    name: str
+    morning: float
+    evening: float
+    expense: float
+    total: float
+    net: float
+    cached: bool                            # 該店資料沒變，直接用上次的部分彙總
+    ms: float
+
+class GroupCategory(BaseModel):
+    category: str
+    amount: float
+    share: float                            # 占集團支出比例
+
+class GroupError(BaseModel):
+    store: str
+    name: str
+    error: str
+
+class SeriesOut(BaseModel):
+    grain: str
+    date_from: date
+    date_to: date
+    dates: List[str]                        # day：YYYY-MM-DD；week：該週週一；month：YYYY-MM
+    morning: List[float]
+    evening: List[float]
+    total: List[float]
+    expense: List[float]
+    net: List[float]
+
+class GroupKPI(BaseModel):
+    morning: float
+    evening: float
+    expense: float
+    total: float
+    net: float
+
+class GroupOut(BaseModel):
+    date_from: date
+    date_to: date
+    grain: str
+    kpi: GroupKPI                           # 集團合計
+    stores: List[GroupStore]                # 各店，依營收由高到低
+    categories: List[GroupCategory]         # 集團支出分類排行
+    series: SeriesOut                       # 各店合併的時間序列
+    errors: List[GroupError]                # 查詢失敗的門市（不計入合計）
+
+class JobOut(BaseModel):
+    id: str
+    kind: str
+    store: str
+    params: Dict[str, Any]
+    status: str                             # queued / running / done / failed / cancelled
+    progress: float                         # 0 ~ 1
+    message: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None             # 最近一次失敗（重試中也會有）
+    attempts: int
+    max_attempts: int
+    artifact: Optional[str] = None          # 完成且有產出檔時為下載檔名
+    created: Optional[str] = None
+    started: Optional[str] = None
+    finished: Optional[str] = None
+
 # ------------------------------
 # 依賴：DB session
 # ------------------------------
-def get_db():
-    db = SessionLocal()
-    try:
+def get_db(store: str = Depends(current_store)):
+    # 依 token 的門市取該店的 Session；整個請求期間佔用該店一個併發名額
+    with store_session(store) as db:
         yield db
-    finally:
-        db.close()
 
 # ------------------------------
 # 健康 / 根 / 登入
 # ------------------------------
 @app.get("/healthz")
 def healthz():
-    return {"ok": True, "version": APP_VERSION, "db": DB_PATH}
+    return {"ok": True, "version": APP_VERSION, "db": DB_PATH, "hashing": hashing.stats(), "stores": TENANTS.stats(),
+            "group": consolidate.stats(), "jobs": JOBS.stats()}
 
 @app.get("/")
 def root():
     return {"service": APP_NAME, "docs": "/docs", "health": "/healthz"}
 
+@app.get("/api/v1/stores")
+def list_stores():
+    """登入畫面用：可選的門市（未設定 stores.json 時只有 default）。"""
+    return [{"store": s, "name": TENANTS.stores.name(s)} for s in TENANTS.stores.ids()]
+
 @app.post("/api/v1/auth/login", response_model=TokenOut)
-def login(payload: LoginIn):
-    if verify_user(payload.code, payload.password):
-        return {"access_token": create_token(payload.code)}
+async def login(payload: LoginIn):
+    code, store = payload.code.strip(), payload.store.strip()
+    TENANTS.stores.db_path(store)                       # 門市不存在 → 403，先於密碼驗證
+    if await verify_user(payload.code, payload.password) and TENANTS.stores.allows(store, code):
+        # 等門市名額、第一次開店的 schema 遷移、寫 refresh token 都是阻塞操作 → threadpool，不卡事件迴圈
+        refresh = await run_in_threadpool(_login_refresh, code, store)
+        return {"access_token": create_token(code, store), "refresh_token": refresh}
     raise HTTPException(401, "bad credentials")
 
+def _login_refresh(code: str, store: str) -> str:
+    with store_session(store) as db:
+        # 順手清掉過期的 refresh token
+        db.execute(delete(RefreshToken).where(RefreshToken.expires_at < datetime.utcnow()))
+        refresh = issue_refresh(db, code, store=store)
+        db.commit()
+    return refresh
+
+@app.post("/api/v1/auth/refresh", response_model=TokenOut)
+def refresh(payload: RefreshIn):
+    store = refresh_store(payload.refresh_token)
+    with store_session(store) as db:
+        sub, new_refresh = rotate_refresh(db, payload.refresh_token)
+    return {"access_token": create_token(sub, store), "refresh_token": new_refresh}
+
+@app.post("/api/v1/auth/logout")
+def logout(payload: RefreshIn):
+    with store_session(refresh_store(payload.refresh_token)) as db:
+        return {"ok": revoke_refresh_family(db, payload.refresh_token)}
+
 # ------------------------------
 # Orders
 # ------------------------------
@@ -303,14 +682,16 @@ def list_expenses(
     db: Session = Depends(get_db),
     _user: str = Depends(require_user),
 ):
-    stmt = select(Expense)
+    stmt = select(Expense, ExpenseCategory.name).join(ExpenseCategory, ExpenseCategory.id == Expense.category_id)
     if date_from:
         stmt = stmt.where(Expense.date >= date_from)
     if date_to:
         stmt = stmt.where(Expense.date <= date_to)
     if q:
         like = f"%{q}%"
-        cond = [Expense.category.like(like), Expense.note.like(like)]
+        # 分類名稱的 LIKE 只掃維度表，支出本身比對整數 id
+        cond = [Expense.category_id.in_(select(ExpenseCategory.id).where(ExpenseCategory.name.like(like))),
+                Expense.note.like(like)]
         try:
             val = float(q.replace(",", ""))
             cond.append(Expense.amount == Decimal(str(val)))
@@ -319,41 +700,42 @@ def list_expenses(
         stmt = stmt.where(or_(*cond))
 
     total = db.scalar(select(func.count()).select_from(stmt.subquery())) or 0
-    rows = db.execute(stmt.order_by(Expense.id.desc()).offset((page-1)*page_size).limit(page_size)).scalars().all()
+    rows = db.execute(stmt.order_by(Expense.id.desc()).offset((page-1)*page_size).limit(page_size)).all()
     items = [{
         "id": x.id,
         "date": x.date,
-        "category": x.category,
+        "category": name,
         "amount": float(x.amount),
         "note": x.note,
-    } for x in rows]
+    } for x, name in rows]
     return {"total": total, "page": page, "page_size": page_size, "items": items}
 
 @app.post("/api/v1/expenses", response_model=ExpenseOut, status_code=201)
 def create_expense(payload: ExpenseIn, db: Session = Depends(get_db), _user: str = Depends(require_user)):
     x = Expense(
         date=payload.date,
-        category=payload.category,
+        category_id=_store_of(db).categories.id_for(payload.category),
         amount=Decimal(str(payload.amount)),
         note=payload.note or None,
     )
     db.add(x); db.commit(); db.refresh(x)
     return {
-        "id": x.id, "date": x.date, "category": x.category,
+        "id": x.id, "date": x.date, "category": _store_of(db).categories.name_for(x.category_id),
         "amount": float(x.amount), "note": x.note
     }
 
 @app.put("/api/v1/expenses/{eid}", response_model=ExpenseOut)
 def update_expense(eid: int, payload: ExpenseIn, db: Session = Depends(get_db), _user: str = Depends(require_user)):
+    cid = _store_of(db).categories.id_for(payload.category)     # 先取 id（可能新建分類），再改支出
     x = db.get(Expense, eid)
     if not x: raise HTTPException(404, "expense not found")
     x.date = payload.date
-    x.category = payload.category
+    x.category_id = cid
     x.amount = Decimal(str(payload.amount))
     x.note = payload.note or None
     db.commit(); db.refresh(x)
     return {
-        "id": x.id, "date": x.date, "category": x.category,
+        "id": x.id, "date": x.date, "category": _store_of(db).categories.name_for(x.category_id),
         "amount": float(x.amount), "note": x.note
     }
 
@@ -408,6 +790,373 @@ def kpi(
     net = total - mx
     return {"morning": mm, "evening": me, "expense": mx, "total": total, "net": net, "period_label": label}
 
+def compare_periods(db: Session, mode: str, ref_date: date, n: int) -> List[dict]:
+    """N 期營收（早 / 晚班）、支出、淨額與期間差額；期間以 VALUES CTE 表示，整段一條查詢、各表只掃一次範圍。"""
+    buckets = periods.buckets(mode, ref_date, n)
+    # UNION ALL 組期間表（SQLite 不支援 (VALUES …) AS p(欄位) 的寫法）
+    p = union_all(*[select(literal(i, Integer).label("idx"), literal(d1, Date).label("d1"), literal(d2, Date).label("d2"))
+                    for i, (_l, d1, d2) in enumerate(buckets)]).cte("periods")
+    o = (select(p.c.idx,
+                func.sum(case((Order.shift == Shift.MORNING, Order.amount), else_=0)).label("m"),
+                func.sum(case((Order.shift == Shift.EVENING, Order.amount), else_=0)).label("e"))
+         .select_from(p.join(Order, and_(Order.date >= p.c.d1, Order.date <= p.c.d2)))
+         .group_by(p.c.idx).subquery("o"))
+    x = (select(p.c.idx, func.sum(Expense.amount).label("x"))
+         .select_from(p.join(Expense, and_(Expense.date >= p.c.d1, Expense.date <= p.c.d2)))
+         .group_by(p.c.idx).subquery("x"))
+    stmt = (select(p.c.idx, func.coalesce(o.c.m, 0), func.coalesce(o.c.e, 0), func.coalesce(x.c.x, 0))
+            .select_from(p.outerjoin(o, o.c.idx == p.c.idx).outerjoin(x, x.c.idx == p.c.idx))
+            .order_by(p.c.idx))
+    out, prev = [], None
+    for idx, m, e, xv in db.execute(stmt):
+        label, d1, d2 = buckets[idx]
+        m, e, xv = float(m or 0), float(e or 0), float(xv or 0)
+        row = {"label": label, "date_from": d1, "date_to": d2, "morning": m, "evening": e,
+               "total": m + e, "expense": xv, "net": m + e - xv}
+        row["delta_total"], row["delta_total_pct"] = periods.delta(row["total"], prev and prev["total"])
+        row["delta_net"], row["delta_net_pct"] = periods.delta(row["net"], prev and prev["net"])
+        out.append(row)
+        prev = row
+    return out
+
+@app.get("/api/v1/reports/compare", response_model=CompareOut)
+def compare(
+    mode: str = Query("month", pattern="^(day|month|year)$"),
+    ref_date: date = Query(default_factory=lambda: date.today()),
+    periods_n: int = Query(2, alias="periods", ge=1, le=periods.MAX_PERIODS, description="期數（含基準期，往前推）"),
+    db: Session = Depends(get_db),
+    _user: str = Depends(require_user),
+):
+    return {"mode": mode, "periods": compare_periods(db, mode, ref_date, periods_n)}
+
+def _daily_rows(d1: Optional[date] = None, d2: Optional[date] = None):
+    """一條 UNION ALL 彙總：訂單 GROUP BY date, shift + 支出 GROUP BY date → (日期, 類別, 金額)。"""
+    kind = case((Order.shift == Shift.MORNING, series.MORNING), else_=series.EVENING)
+    o = select(Order.date, kind.label("k"), func.sum(Order.amount))
+    x = select(Expense.date, literal(series.EXPENSE, Integer), func.sum(Expense.amount))
+    if d1 is not None:
+        o, x = o.where(Order.date >= d1, Order.date <= d2), x.where(Expense.date >= d1, Expense.date <= d2)
+    return union_all(o.group_by(Order.date, Order.shift), x.group_by(Expense.date))
+
+def daily_series(db: Session, d1: date, d2: date, grain: str) -> dict:
+    """缺的日子由 series.dense 補 0。"""
+    out = series.dense(d1, d2, grain, db.execute(_daily_rows(d1, d2)))
+    out.update(date_from=d1, date_to=d2)
+    return out
+
+@app.get("/api/v1/reports/series", response_model=SeriesOut)
+def report_series(
+    date_to: date = Query(default_factory=lambda: date.today(), alias="to"),
+    date_from: Optional[date] = Query(None, alias="from", description="預設為 to 往前一年"),
+    grain: str = Query("day", pattern="^(day|week|month)$"),
+    db: Session = Depends(get_db),
+    _user: str = Depends(require_user),
+):
+    d1 = date_from or date_to - timedelta(days=364)
+    if d1 > date_to:
+        raise HTTPException(400, "from must not be after to")
+    if (date_to - d1).days >= series.MAX_DAYS:
+        raise HTTPException(400, f"range too long (max {series.MAX_DAYS} days)")
+    return daily_series(db, d1, date_to, grain)
+
+def expense_pivot(db: Session, d1: date, d2: date, grain: str) -> dict:
+    """一條 GROUP BY 期間, 分類 id，彙總後才 JOIN 分類名稱；攤成稠密矩陣交給 pivot.build。"""
+    # SQLite 的 Date 存 YYYY-MM-DD；期間直接當字串取回，金額取 float，省掉數萬列的 date / Decimal 轉換
+    period = type_coerce(Expense.date, String) if grain == "day" else func.substr(Expense.date, 1, 7)
+    agg = (select(period.label("period"), Expense.category_id, func.sum(Expense.amount, type_=Float).label("amount"))
+           .where(Expense.date >= d1, Expense.date <= d2).group_by(period, Expense.category_id).subquery())
+    stmt = (select(agg.c.period, ExpenseCategory.name, agg.c.amount)
+            .join(ExpenseCategory, ExpenseCategory.id == agg.c.category_id))
+    # 日粒度可達數萬列：走 Core 連線取 tuple，略過 ORM 的逐列包裝
+    return pivot.build(db.connection().execute(stmt).all(), d1, d2, grain)
+
+@app.get("/api/v1/reports/expense-pivot", response_model=PivotOut)
+def report_expense_pivot(
+    date_to: date = Query(default_factory=lambda: date.today(), alias="to"),
+    date_from: Optional[date] = Query(None, alias="from", description="預設為 to 當年 1/1"),
+    grain: str = Query("month", pattern="^(day|month)$"),
+    format: str = Query("json", pattern="^(json|csv)$"),
+    db: Session = Depends(get_db),
+    _user: str = Depends(require_user),
+):
+    d1 = date_from or date_to.replace(month=1, day=1)
+    if d1 > date_to:
+        raise HTTPException(400, "from must not be after to")
+    if (date_to - d1).days >= series.MAX_DAYS:
+        raise HTTPException(400, f"range too long (max {series.MAX_DAYS} days)")
+    out = expense_pivot(db, d1, date_to, grain)
+    if format == "csv":
+        fname = f"expense_pivot_{grain}_{d1}_{date_to}.csv"
+        return Response("\ufeff" + "".join(pivot.csv_lines(out)), media_type="text/csv; charset=utf-8",
+                        headers={"Content-Disposition": f"attachment; filename={fname}"})
+    # 矩陣全是 float，直接 json.dumps；逐格走 jsonable_encoder 在日粒度（數萬格）要多花一倍時間
+    return Response(json.dumps(out, default=str, ensure_ascii=False), media_type="application/json")
+
+@app.get("/api/v1/reports/analytics", response_model=AnalyticsOut)
+def report_analytics(
+    ref_date: date = Query(default_factory=lambda: date.today()),
+    db: Session = Depends(get_db),
+    _user: str = Depends(require_user),
+):
+    # 全歷史每日彙總快取在行程內（每家門市一份），該店 DB（含 WAL）有寫入才重查
+    daily = analytics.cache.get(_store_of(db).path, lambda: db.execute(_daily_rows()).all())
+    out = analytics.summary(daily, ref_date)
+    out["brief"] = analytics.brief(out)
+    return out
+
+def _export_span(d1: Optional[date], d2: date) -> date:
+    d1 = d1 or d2.replace(day=1)
+    if d1 > d2:
+        raise HTTPException(400, "from must not be after to")
+    if (d2 - d1).days >= series.MAX_DAYS:
+        raise HTTPException(400, f"range too long (max {series.MAX_DAYS} days)")
+    return d1
+
+def _xlsx_sheets(sdb: StoreDB, d1: date, d2: date, track=lambda rows, _label: rows) -> List[xlsx.Sheet]:
+    """訂單 / 支出 / 每日彙總三張表；各表的列在寫到該表時才查（track 包住 cursor，背景工作用來回報進度）。"""
+    def rows(stmt, label):
+        def gen():
+            with sdb.engine.connect() as conn:
+                yield from track(conn.execution_options(yield_per=xlsx.CHUNK_ROWS).execute(stmt), label)
+        return gen
+
+    def daily():
+        with sdb.engine.connect() as conn:
+            s = series.dense(d1, d2, "day", conn.execute(_daily_rows(d1, d2)))
+        return zip([date.fromisoformat(x) for x in s["dates"]], s["morning"], s["evening"], s["total"],
+                   s["expense"], s["net"])
+
+    orders = (select(Order.id, Order.date, Order.shift, Order.order_no, Order.amount, Order.memo)
+              .where(Order.date >= d1, Order.date <= d2).order_by(Order.date, Order.id))
+    expenses = (select(Expense.id, Expense.date, ExpenseCategory.name, Expense.amount, Expense.note)
+                .join(ExpenseCategory, ExpenseCategory.id == Expense.category_id)
+                .where(Expense.date >= d1, Expense.date <= d2).order_by(Expense.date, Expense.id))
+    return [
+        xlsx.Sheet("訂單", ["id", "日期", "班別", "單號", "金額", "備註"], rows(orders, "訂單 "),
+                   widths=[8, 12, 8, 16, 12, 30], money=[4]),
+        xlsx.Sheet("支出", ["id", "日期", "分類", "金額", "備註"], rows(expenses, "支出 "),
+                   widths=[8, 12, 14, 12, 30], money=[3]),
+        xlsx.Sheet("每日彙總", ["日期", "早班", "晚班", "營業額", "支出", "淨額"], daily,
+                   widths=[12, 12, 12, 12, 12, 12], money=[1, 2, 3, 4, 5]),
+    ]
+
+def _row_count(sdb: StoreDB, d1: Optional[date], d2: Optional[date], table: str = "all") -> int:
+    """期間內訂單 / 支出列數（背景工作的進度分母；走日期索引，不回表）。"""
+    cols = {"orders": [Order.date], "expenses": [Expense.date]}.get(table, [Order.date, Expense.date])
+    n = 0
+    with sdb.engine.connect() as conn:
+        for col in cols:
+            stmt = select(func.count()).select_from(col.table)
+            if d1 is not None:
+                stmt = stmt.where(col >= d1)
+            if d2 is not None:
+                stmt = stmt.where(col <= d2)
+            n += conn.execute(stmt).scalar_one()
+    return n
+
+def _enqueued(job: Dict[str, Any]) -> JSONResponse:
+    """?async=1 的回應：202 + 工作狀態，Location 指向查詢端點。"""
+    return JSONResponse(JobOut(**job).model_dump(), status_code=202, headers={"Location": f"/api/v1/jobs/{job['id']}"})
+
+@app.get("/api/v1/export/xlsx")
+def export_xlsx(
+    date_to: date = Query(default_factory=lambda: date.today(), alias="to"),
+    date_from: Optional[date] = Query(None, alias="from", description="預設為 to 當月 1 日"),
+    async_: bool = Query(False, alias="async", description="排入背景工作，回 202；完成後由 /api/v1/jobs/{id}/download 下載"),
+    store: str = Depends(current_store),
+    db: Session = Depends(get_db),
+    user: str = Depends(require_user),
+):
+    """訂單 / 支出 / 每日彙總三張表的 Excel；cursor 每批 CHUNK_ROWS 列邊讀邊寫、邊壓縮邊送出。"""
+    d1 = _export_span(date_from, date_to)
+    if async_:
+        return _enqueued(JOBS.enqueue("export.xlsx", {"date_from": d1, "date_to": date_to}, store=store, owner=user))
+    # 依賴的 Session 在開始串流前就關了，串流期間另取該店連線
+    sheets = _xlsx_sheets(_store_of(db), d1, date_to)
+    fname = f"aurum_{d1}_{date_to}.xlsx"
+    return StreamingResponse(xlsx.stream(sheets), media_type=xlsx.MEDIA_TYPE,
+                             headers={"Content-Disposition": f"attachment; filename={fname}"})
+
+def _job_xlsx(ctx: jobs.JobContext, date_from: str, date_to: str):
+    d1, d2 = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    # 佔該店一個併發名額：執行期間門市不會因閒置被關掉；名額滿時丟 TenantBusy → 稍後重試
+    with TENANTS.slot(ctx.store) as sdb:
+        ctx.total = _row_count(sdb, d1, d2)
+        path = ctx.artifact(f"aurum_{d1}_{d2}.xlsx", xlsx.MEDIA_TYPE)
+        n = xlsx.write(path, _xlsx_sheets(sdb, d1, d2, ctx.track))
+    return {"rows": n, "bytes": path.stat().st_size}
+
+JOBS.register("export.xlsx", _job_xlsx)
+
+def _columnar_stmt(table: str, d1: Optional[date], d2: Optional[date]):
+    """欄位順序同 columnar.TABLES；日期取字串、金額取 float，略過 ORM 的 date / Decimal 逐列轉換。"""
+    if table == "orders":
+        label = case((Order.shift == Shift.MORNING, Shift.MORNING.value), else_=Shift.EVENING.value)
+        stmt = select(Order.id, type_coerce(Order.date, String), label, Order.order_no,
+                      type_coerce(Order.amount, Float), Order.memo).order_by(Order.date, Order.id)
+        col = Order.date
+    else:
+        stmt = (select(Expense.id, type_coerce(Expense.date, String), ExpenseCategory.name,
+                       type_coerce(Expense.amount, Float), Expense.note)
+                .join(ExpenseCategory, ExpenseCategory.id == Expense.category_id).order_by(Expense.date, Expense.id))
+        col = Expense.date
+    if d1 is not None:
+        stmt = stmt.where(col >= d1)
+    if d2 is not None:
+        stmt = stmt.where(col <= d2)
+    return stmt
+
+def _export_range(d1: Optional[date], d2: Optional[date]):
+    if d1 and d2 and d1 > d2:
+        raise HTTPException(400, "from must not be after to")
+
+@app.get("/api/v1/export/arrow")
+def export_arrow(
+    table: str = Query("orders", pattern="^(orders|expenses)$"),
+    date_from: Optional[date] = Query(None, alias="from", description="預設為全部歷史"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    compression: str = Query("none", pattern="^(none|zstd|lz4)$", description="record batch 壓縮（讀取端需支援）"),
+    db: Session = Depends(get_db),
+    _user: str = Depends(require_user),
+):
+    """Arrow IPC stream：cursor 每 BATCH_ROWS 列一個 record batch，邊轉邊送。"""
+    _export_range(date_from, date_to)
+    columnar.schema(table)              # 沒裝 pyarrow → 501（在開始串流前就要知道）
+    sdb, stmt = _store_of(db), _columnar_stmt(table, date_from, date_to)
+
+    def rows():
+        with sdb.engine.connect() as conn:
+            yield from conn.execution_options(yield_per=columnar.BATCH_ROWS).execute(stmt)
+    return StreamingResponse(columnar.ipc_stream(table, rows, compression), media_type=columnar.MEDIA_TYPE_IPC,
+                             headers={"Content-Disposition": f"attachment; filename={table}.arrows"})
+
+def _parquet_zip(conn, fp, table: str, d1: Optional[date], d2: Optional[date], partition: str,
+                 track=lambda rows, _label: rows) -> Dict[str, int]:
+    """各表的 Parquet 分割檔寫成 zip 成員（ZIP_STORED）；回傳 {成員路徑: 列數}。"""
+    files: Dict[str, int] = {}
+    with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_STORED) as z:
+        for t in (["orders", "expenses"] if table == "all" else [table]):
+            rows = conn.execution_options(yield_per=columnar.BATCH_ROWS).execute(_columnar_stmt(t, d1, d2))
+            files.update(columnar.write_dataset(t, track(rows, f"{t} "),
+                                                lambda path: z.open(path, "w", force_zip64=True), partition))
+    return files
+
+@app.get("/api/v1/export/parquet")
+def export_parquet(
+    table: str = Query("all", pattern="^(orders|expenses|all)$"),
+    date_from: Optional[date] = Query(None, alias="from", description="預設為全部歷史"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    partition: str = Query("month", pattern="^(year|month|day)$"),
+    async_: bool = Query(False, alias="async", description="排入背景工作，回 202；完成後由 /api/v1/jobs/{id}/download 下載"),
+    store: str = Depends(current_store),
+    db: Session = Depends(get_db),
+    user: str = Depends(require_user),
+):
+    """
+    依日期分割的 Parquet 資料集打包成 zip（Parquet 本身已壓縮，zip 只做封裝）：
+    orders/month=2024-01/part-0.parquet …；先寫到暫存檔（記憶體只有一批），寫完才開始下載。
+    """
+    _export_range(date_from, date_to)
+    if async_:
+        columnar.schema("orders")       # 沒裝 pyarrow → 501，不排一個注定失敗的工作
+        return _enqueued(JOBS.enqueue("export.parquet", {"table": table, "date_from": date_from, "date_to": date_to,
+                                                         "partition": partition}, store=store, owner=user))
+    tmp = tempfile.TemporaryFile()
+    try:
+        _parquet_zip(db.connection(), tmp, table, date_from, date_to, partition)
+        size = tmp.tell()
+        tmp.seek(0)
+    except BaseException:
+        tmp.close()
+        raise
+
+    def gen():
+        with tmp:
+            while chunk := tmp.read(1 << 20):
+                yield chunk
+    fname = f"{table}_{partition}.parquet.zip"
+    return StreamingResponse(gen(), media_type="application/zip",
+                             headers={"Content-Disposition": f"attachment; filename={fname}",
+                                      "Content-Length": str(size)})
+
+def _job_parquet(ctx: jobs.JobContext, table: str, date_from: Optional[str], date_to: Optional[str], partition: str):
+    d1 = date.fromisoformat(date_from) if date_from else None
+    d2 = date.fromisoformat(date_to) if date_to else None
+    with TENANTS.slot(ctx.store) as sdb:
+        ctx.total = _row_count(sdb, d1, d2, table)
+        path = ctx.artifact(f"{table}_{partition}.parquet.zip", "application/zip")
+        with sdb.engine.connect() as conn, open(path, "wb") as f:
+            files = _parquet_zip(conn, f, table, d1, d2, partition, ctx.track)
+    return {"rows": sum(files.values()), "files": len(files), "bytes": path.stat().st_size}
+
+# pyarrow 沒裝不會因重試而變好 → 只試一次
+JOBS.register("export.parquet", _job_parquet, max_attempts=1)
+
+# ------------------------------
+# 背景工作：查詢 / 下載 / 取消（只看得到自己在目前門市排的工作）
+# ------------------------------
+def _my_job(job_id: str, store: str, user: str) -> Dict[str, Any]:
+    job = JOBS.get(job_id)
+    if job is None or job["owner"] != user or job["store"] != store:
+        raise HTTPException(404, "job not found")
+    return job
+
+@app.get("/api/v1/jobs", response_model=List[JobOut])
+def list_jobs(
+    status: Optional[str] = Query(None, pattern="^(queued|running|done|failed|cancelled)$"),
+    limit: int = Query(50, ge=1, le=500),
+    store: str = Depends(current_store),
+    user: str = Depends(require_user),
+):
+    return JOBS.list(owner=user, store=store, status=status, limit=limit)
+
+@app.get("/api/v1/jobs/{job_id}", response_model=JobOut)
+def get_job(job_id: str, store: str = Depends(current_store), user: str = Depends(require_user)):
+    return _my_job(job_id, store, user)
+
+@app.get("/api/v1/jobs/{job_id}/download")
+def download_job(job_id: str, store: str = Depends(current_store), user: str = Depends(require_user)):
+    job = _my_job(job_id, store, user)
+    if job["status"] != "done":
+        raise HTTPException(409, f"job is {job['status']}")
+    art = JOBS.artifact(job_id)
+    if art is None:
+        raise HTTPException(410, "artifact expired")
+    path, name, media_type = art
+    return FileResponse(path, media_type=media_type, filename=name)
+
+@app.delete("/api/v1/jobs/{job_id}", response_model=JobOut)
+def cancel_job(job_id: str, store: str = Depends(current_store), user: str = Depends(require_user)):
+    _my_job(job_id, store, user)
+    return JOBS.cancel(job_id)
+
+@app.get("/api/v1/reports/group", response_model=GroupOut)
+def report_group(
+    date_to: date = Query(default_factory=lambda: date.today(), alias="to"),
+    date_from: Optional[date] = Query(None, alias="from", description="預設為 to 當月 1 日"),
+    grain: str = Query("day", pattern="^(day|week|month)$"),
+    stores: Optional[str] = Query(None, description="逗號分隔的門市代碼；預設為登入帳號可進入的所有門市"),
+    user: str = Depends(require_user),
+):
+    d1 = date_from or date_to.replace(day=1)
+    if d1 > date_to:
+        raise HTTPException(400, "from must not be after to")
+    if (date_to - d1).days >= series.MAX_DAYS:
+        raise HTTPException(400, f"range too long (max {series.MAX_DAYS} days)")
+    ids = [s.strip() for s in stores.split(",") if s.strip()] if stores else TENANTS.stores.ids()
+    refs = []
+    for sid in ids:
+        try:
+            path = TENANTS.stores.db_path(sid)
+        except tenants.UnknownStore:
+            raise HTTPException(404, f"unknown store: {sid}")
+        if TENANTS.stores.allows(sid, user):
+            refs.append((sid, TENANTS.stores.name(sid), path))
+        elif stores:
+            raise HTTPException(403, f"store not allowed: {sid}")
+    # 各店在 process pool 各查各的（唯讀連線，不佔門市併發名額），沒寫入的門市直接用快取
+    return consolidate.group_report(refs, d1, date_to, grain)
+
 # ------------------------------
 # 本機啟動
 # ------------------------------